@@ -1,7 +1,12 @@
+from .exceptions import CompilerBackendException
+from .profiler import Profiler
+from .passes import PASSES
 from .backend_base import BaseBackend
-from .backend_c import CBackend
+from .backend_c import CBackend, BUILD_PROFILES
+from .backend_vm import VMBackend
 
 BACKEND_MAP = {
     "base": BaseBackend,
-    "c": CBackend
-}
\ No newline at end of file
+    "c": CBackend,
+    "vm": VMBackend,
+}
@@ -1,14 +1,69 @@
+import sys
+
 from .exceptions import CompilerBackendException
+from .profiler import Profiler
+from .passes import PassManager
 
 class BaseBackend:
     def __init__(self, args):
         self.args = args
         self.file = args.file
         self.output = args.output
+        self.profiler = Profiler() # Replaced by the driver's when phases are timed
+        self.pass_manager = PassManager([] if args.passes == "none" else args.passes.split(","))
 
     def generate(self, ast):
         print(ast.pretty())
         raise CompilerBackendException("no generation function implemented for backend")
 
     def write_output(self):
-        raise CompilerBackendException("no output function implemented for backend")
\ No newline at end of file
+        raise CompilerBackendException("no output function implemented for backend")
+
+    # Separate compilation, used when a program is split into modules
+    def add_import(self, export):
+        raise CompilerBackendException("no import function implemented for backend")
+
+    def write_object(self, output):
+        raise CompilerBackendException("no object output function implemented for backend")
+
+    def link(self, objects):
+        raise CompilerBackendException("no link function implemented for backend")
+
+    # What other modules can use, written to the interface file of a module
+    def interface(self):
+        return self.export
+
+    # Entry points used by the driver, so every backend reports the same phases
+    def run_generate(self, ast):
+        with self.profiler.phase("generate"):
+            self.generate(ast)
+
+    def run_write_output(self):
+        with self.profiler.phase("write_output"):
+            self.write_output()
+
+    def run_write_object(self, output):
+        with self.profiler.phase("write_object"):
+            self.write_object(output)
+
+    def run_link(self, objects):
+        with self.profiler.phase("link"):
+            self.link(objects)
+
+    # Runs the optimization passes on a function lowered with lowering.Lowerer
+    def optimize(self, fn):
+        self.pass_manager.run(fn, self.profiler)
+        if self.args.dump_ir:
+            print(fn, file=sys.stderr)
+
+    # Times the code generation of a top level definition on its own
+    def profile_item(self, kind, name):
+        return self.profiler.item(kind, name, self.file)
+
+    # Everything besides the source and grammar that changes the output, or None if the output can't be cached
+    def cache_key(self):
+        return None
+
+    # Files written by write_output
+    def outputs(self):
+        return [self.output]
@@ -1,8 +1,17 @@
-import subprocess, os
+import sys, subprocess, os, shutil, functools, hashlib, tempfile, contextlib, multiprocessing, threading, json, fcntl
+from concurrent.futures import ProcessPoolExecutor
 
 from .exceptions import CompilerBackendException
-from .types import Type, Param, Func, Struct, Export
+from .types import Type, Param, Func, Struct, Export, INT_RANGES, array_type, slice_type
 from .backend_base import BaseBackend
+from .lowering import Lowerer, NotLowerable, Var, Const
+from .passes import instructions
+from .emitter import Emitter
+from .profiler import Profiler
+
+SECTIONS = ("base", "includes", "data_decls", "fn_decls", "code")
+# The sections before the program's own declarations, compiled once into a precompiled header
+PRELUDE_SECTIONS = SECTIONS[:2]
 
 BASE_CODE = """\
 #include <stdint.h>
@@ -10,6 +19,86 @@ BASE_CODE = """\
 #include <stdbool.h>
 """
 
+# Only emitted with --bounds-check, the index converts to unsigned so negative ones are caught too
+BOUNDS_CHECK_CODE = "static inline uintptr_t __check_index(uintptr_t i,uintptr_t len){if(i>=len){__builtin_trap();}return i;}\n"
+
+# Only emitted when a program uses arenas
+# An arena is a list of blocks allocated with calloc, so everything allocated from one starts out zeroed
+# Allocating bumps the offset into the newest block, starting a block twice as large when it doesn't fit,
+# and freeing the arena frees every block at once, after which it can be allocated from again
+ARENA_CODE = """\
+#include <stdlib.h>
+struct __arena_block{struct __arena_block* next;uintptr_t used;uintptr_t size;_Alignas(max_align_t) unsigned char data[];};
+typedef struct{struct __arena_block* head;} __arena;
+static inline uintptr_t __arena_offset(struct __arena_block* block,uintptr_t align){uintptr_t end=(uintptr_t)(block->data+block->used);return block->used+(align-end%align)%align;}
+static void* __arena_alloc(__arena* arena,uintptr_t size,uintptr_t align){
+struct __arena_block* block=arena->head;
+if(block!=NULL){uintptr_t offset=__arena_offset(block,align);if(offset+size<=block->size){block->used=offset+size;return block->data+offset;}}
+uintptr_t capacity=block!=NULL?block->size*2:4096;
+while(capacity<size+align){capacity*=2;}
+block=calloc(1,sizeof(struct __arena_block)+capacity);
+if(block==NULL){__builtin_trap();}
+block->next=arena->head;block->size=capacity;arena->head=block;
+uintptr_t offset=__arena_offset(block,align);block->used=offset+size;return block->data+offset;
+}
+static inline void __arena_free(__arena* arena){struct __arena_block* block=arena->head;while(block!=NULL){struct __arena_block* next=block->next;free(block);block=next;}arena->head=NULL;}
+"""
+
+# Only emitted with --instrument, every function counts its calls and times them with a counter of its own
+# Counters are linked into a list on their first call, whose head is weak so every module of a program shares it,
+# and the first one registers writing the report at exit, to $LANG_PROFILE or lang-profile.json
+# Time is only measured around the outermost call of a function, so recursion isn't counted twice
+# Counters are updated atomically and the depth and start are kept per thread, so functions called from
+# a parallel for are counted right, their time being the sum of the time every thread spent in them
+INSTRUMENT_CODE = """\
+#include <stdio.h>
+#include <stdlib.h>
+#if defined(__x86_64__)||defined(__i386__)
+#include <x86intrin.h>
+#define __PROF_UNIT "cycles"
+static inline uint64_t __prof_now(void){return __rdtsc();}
+#else
+#include <time.h>
+#define __PROF_UNIT "ns"
+static inline uint64_t __prof_now(void){struct timespec t;clock_gettime(CLOCK_MONOTONIC,&t);return (uint64_t)t.tv_sec*1000000000+t.tv_nsec;}
+#endif
+struct __prof_counter{const char* name;const char* file;uint32_t line;uint64_t calls;uint64_t time;struct __prof_counter* next;};
+struct __prof_local{struct __prof_counter* counter;uint32_t depth;uint64_t start;};
+__attribute__((weak)) struct __prof_counter* __prof_head=NULL;
+static void __prof_report(void){
+const char* path=getenv("LANG_PROFILE");
+FILE* f=fopen(path!=NULL?path:"lang-profile.json","w");
+if(f==NULL){return;}
+fprintf(f,"{\\"unit\\":\\"%s\\",\\"functions\\":[",__PROF_UNIT);
+for(struct __prof_counter* c=__prof_head;c!=NULL;c=c->next){fprintf(f,"%s{\\"name\\":%s,\\"file\\":%s,\\"line\\":%u,\\"calls\\":%llu,\\"time\\":%llu}",c==__prof_head?"":",",c->name,c->file,(unsigned)c->line,(unsigned long long)c->calls,(unsigned long long)c->time);}
+fprintf(f,"]}\\n");
+fclose(f);
+}
+static inline struct __prof_local* __prof_enter(struct __prof_local* l){
+struct __prof_counter* c=l->counter;
+if(__atomic_fetch_add(&c->calls,1,__ATOMIC_RELAXED)==0){
+struct __prof_counter* head=__atomic_load_n(&__prof_head,__ATOMIC_RELAXED);
+do{c->next=head;}while(!__atomic_compare_exchange_n(&__prof_head,&head,c,1,__ATOMIC_RELEASE,__ATOMIC_RELAXED));
+if(head==NULL){atexit(__prof_report);}
+}
+if(l->depth++==0){l->start=__prof_now();}
+return l;
+}
+static inline void __prof_exit(struct __prof_local** l){if(--(*l)->depth==0){__atomic_fetch_add(&(*l)->counter->time,__prof_now()-(*l)->start,__ATOMIC_RELAXED);}}
+"""
+
+# -Wno-psabi: passing 256-bit vectors without AVX is only an ABI note, and every object of a program is built with the same flags
+WARNING_FLAGS = "-Wextra -Wall -Wfloat-equal -Wpointer-arith -Wstrict-prototypes -Wwrite-strings -Wunreachable-code -Wno-psabi".split(" ")
+
+# Flags of each build profile, on top of the warning flags
+# pgo builds once with -fprofile-generate, runs the training command and rebuilds with -fprofile-use
+BUILD_PROFILES = {
+    "fast-compile": ["-O0"],
+    "release": ["-O3"],
+    "release-lto": ["-O3", "-flto"],
+    "pgo": ["-O3"],
+}
+
 TYPE_MAP = {
     "u8": "uint8_t",
     "u16": "uint16_t",
@@ -26,6 +115,44 @@ TYPE_MAP = {
     "bool": "bool",
 }
 
+# Vector types, by their element type and number of lanes
+# They're GCC vector extension types, so arithmetic on them is done on every lane at once
+VECTOR_TYPES = {
+    "f32x4": ("f32", 4),
+    "f32x8": ("f32", 8),
+    "f64x2": ("f64", 2),
+    "f64x4": ("f64", 4),
+    "i32x4": ("i32", 4),
+    "i32x8": ("i32", 8),
+    "i64x2": ("i64", 2),
+    "i64x4": ("i64", 4),
+    "u8x16": ("u8", 16),
+    "u8x32": ("u8", 32),
+}
+TYPE_MAP.update({name: f"__{name}" for name in VECTOR_TYPES})
+TYPE_MAP["arena"] = "__arena"
+
+ARENA = Type("builtin", "arena", 0)
+# Methods of an arena, by the runtime function they call
+ARENA_METHODS = {"free": "__arena_free"}
+
+# A copy of an arena would lose track of the blocks allocated from the other one,
+# so only arena* can be passed around, arenas and arrays of them stay where they're declared
+def check_copyable(type, what):
+    elem = type
+    while elem.elem != None and elem.type == "array":
+        elem = elem.elem
+    if elem == ARENA:
+        raise CompilerBackendException(f"arenas can't be copied, {what} has to be a pointer to one")
+
+# Functions every vector type has, ex. f32x4_load(p), by the name after the type, and their parameters
+# load and store don't need the pointer to be aligned
+VECTOR_FUNCTIONS = {
+    "load": ("pointer",),
+    "store": ("pointer", "vector"),
+    "splat": ("elem",),
+}
+
 VALUE_TYPE_MAP = {
     "number": Type("builtin", "int", 0),
     "string": Type("builtin", "u8", 1),
@@ -48,17 +175,169 @@ OP_BIN_MAP = {
     "divide_eq": "/=",
 }
 
+# Operators that always result in a bool
+OP_BIN_COMPARISONS = ["equal", "not_equal", "less_than", "greater_than"]
+
+# Literal values that aren't stored in a token
+VALUE_KEYWORD_MAP = {
+    "true": "true",
+    "false": "false",
+    "null": "NULL",
+}
+
+FUNCTION_TYPES = ("function_typed", "function_void", "function_annotated")
+
+# Annotations that can be put on functions, with whether they take an argument
+ANNOTATIONS = {
+    "memo": True, # @memo or @memo(table size)
+    "export": False, # Keeps external linkage with --whole-program
+    "inline": False, # Always inlined
+    "noinline": False, # Never inlined
+}
+
+# Functions with up to this many statements and no loops get an inline hint
+INLINE_STATEMENTS = 4
+LOOP_STATEMENTS = ("statement_for", "statement_parallel_for", "statement_for_each", "statement_while", "statement_loop")
+
+# Types the variable of a parallel for can have, the first that holds both bounds is picked
+PARALLEL_FOR_TYPES = ("i32", "u32", "i64", "u64")
+# Updates a parallel for can accumulate into a variable with, and the OpenMP reduction they make
+# Every iteration subtracting from its own copy, the copies are added up
+PARALLEL_REDUCTIONS = {"add_eq": "+", "subtract_eq": "+", "multiply_eq": "*"}
+
 OVERLOAD_NAMES = [f"__{op}__" for op in OP_BIN_MAP.keys()]
+
+# Expressions that can have their address taken, other operands of overloads are stored in a temporary first
+LVALUE_EXPRESSIONS = ("expression_deref", "expression_dot", "expression_index")
+
+# Programs with at least this many functions, structs and statements are generated in parallel,
+# with at most one worker per WORKER_ITEMS of them, otherwise starting the workers costs more than it saves
+PARALLEL_ITEMS = 256
+WORKER_ITEMS = 128
+
+# Operator overloads returning a struct write it through a pointer passed as their last argument,
+# so the caller decides where the result goes and chains don't copy it around
+def returns_through_pointer(name, func):
+    return name in OVERLOAD_NAMES and not name.endswith("_eq__") and func.type != None and func.type.type == "struct" and func.type.ptr == 0
+
+# The local variable an assignment writes to, or None if it writes through a pointer, an index or a field
+def local_name(ast):
+    if ast.data == "expression_value" and ast.children[0].data == "ident":
+        return ast.children[0].text
+    return None
+
+# Whether two expressions are written the same and evaluating either gives the same place,
+# which isn't the case if they call anything
+def same_place(a, b):
+    if not hasattr(a, "children") or not hasattr(b, "children"):
+        return not hasattr(a, "children") and not hasattr(b, "children") and a.type == b.type and a.value == b.value
+    if a.data != b.data or a.data in ("expression_function_call", "expression_method_call") or len(a.children) != len(b.children):
+        return False
+    return all(same_place(x, y) for x, y in zip(a.children, b.children))
+
+# The local variable an assignment writes a part of, through fields and pointers but no index,
+# so the same place is written whatever the value of a loop variable, or None
+def written_local(ast):
+    while ast.data in ("expression_dot", "expression_deref"):
+        ast = ast.children[0]
+    return local_name(ast)
+
+# The line a node starts on, the one of its first token with a line, or None
+def first_line(ast):
+    if not hasattr(ast, "children"):
+        return getattr(ast, "line", None)
+    for child in ast.children:
+        line = first_line(child)
+        if line != None:
+            return line
+    return None
+
+# A C string literal of a string
+def c_string(value):
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+# Pointers to temporaries are always taken with &, so they're dereferenced by dropping it
+def dereference(pointer):
+    return pointer[1:] if pointer.startswith("&") else f"(*{pointer})"
+
 INT_TYPES = list(TYPE_MAP.keys())[:10]
 
+def is_vector_type(type):
+    return type.type == "builtin" and type.ptr == 0 and type.name in VECTOR_TYPES
+
+# The vector type and function a call is to, ex. f32x4_load is ("f32x4", "load"), or None
+def vector_function(fn_name):
+    vector, _, function = fn_name.partition("_")
+    if vector in VECTOR_TYPES and function in VECTOR_FUNCTIONS:
+        return vector, function
+    return None
+
+def is_int_type(type):
+    return type.type == "builtin" and type.ptr == 0 and (type.name in INT_TYPES or type.name == "int")
+
+# Types of the parameters and result of a function
+def fn_types(fn):
+    return [param.type for param in fn.params] + ([fn.type] if fn.type != None else [])
+
+# Types of the properties and methods of a struct
+def struct_types(struct):
+    return list(struct.vars.values()) + [type for fn in struct.fns.values() for type in fn_types(fn)]
+
+# Spells a type so it can be part of a C identifier, for the structs arrays and slices are lowered to
+def mangle_type(type):
+    if type.type == "array":
+        name = f"a{type.length}_{mangle_type(type.elem)}"
+    elif type.type == "slice":
+        name = f"s_{mangle_type(type.elem)}"
+    else:
+        name = type.name
+    return name + "_p" * type.ptr
+
+# Whether an object file calls into the OpenMP runtime, every parallel for does
+def uses_openmp(path):
+    with open(path, "rb") as f:
+        return b"GOMP_" in f.read()
+
+@functools.lru_cache(maxsize=None)
+def compiler_version(compiler):
+    return subprocess.run([compiler, "--version"], capture_output=True, text=True).stdout.split("\n")[0]
+
+# State of a worker process of generate_parallel, inherited from the parent when it forks
+worker_backend = None
+worker_items = None
+
+def init_worker(backend, items):
+    global worker_backend, worker_items
+    worker_backend = backend
+    worker_items = items
+
+# Returns the emitter of the item, the functions it made static, the compiler flags it needs and what the profiler measured
+def generate_worker_item(index):
+    backend = worker_backend
+    backend.emitter = Emitter(SECTIONS)
+    backend.internal = set()
+    backend.profiler = Profiler(backend.profiler.enabled, backend.profiler.trace_memory)
+
+    backend.emitter.emit("code", backend.generate_item(worker_items[index]))
+    return backend.emitter, backend.internal, backend.flags, backend.profiler.to_dict()
+
 class CBackend(BaseBackend):
     def __init__(self, args):
         super().__init__(args)
-        self.compiler = "gcc" # TODO: make this take from args
-        self.flags = "-Wextra -Wall -Wfloat-equal -Wpointer-arith -Wstrict-prototypes -Wwrite-strings -Wunreachable-code -O3".split(" ") # TODO: this too
-        self.compiled = ""
+        self.compiler = args.compiler
+        self.profile = args.build_profile
+        self.flags = WARNING_FLAGS + BUILD_PROFILES[self.profile]
+        # Shared objects can be loaded at any address, so every object going into one is position independent
+        if args.shared:
+            self.flags = self.flags + ["-fPIC"]
+        if args.debug_info:
+            self.flags = self.flags + ["-g"]
+        self.emitter = None
         self.context = {}
         self.export = None
+        self.imports = Export() # Exports of every imported module, set with add_import
+        self.build_cache = None # Set by the caller when caching is on, holds the precompiled headers
+        self.types = {}
 
     def push_locals(self):
         self.context["locals_stack"].append({})
@@ -71,114 +350,299 @@ class CBackend(BaseBackend):
             self.locals = self.context["locals_stack"][-2]
         return self.context["locals_stack"].pop()
     
+    def add_import(self, export):
+        self.imports.structs.update(export.structs)
+        self.imports.fns.update(export.fns)
+        self.imports.vars.update(export.vars)
+        self.imports.internal.update(export.internal)
+
+    # Raises if an imported module has name but kept it to itself, see interface
+    def check_exported(self, kind, name):
+        if name in self.imports.internal:
+            module = os.path.splitext(os.path.basename(self.imports.internal[name]))[0]
+            raise CompilerBackendException(f"{kind} {name} is not exported from module {module}, with --whole-program only main and @export functions are")
+
+    # Look up a struct or function, either from this module or an imported one
+    def get_struct(self, name):
+        if name in self.export.structs:
+            return self.export.structs[name]
+        elif name in self.imports.structs:
+            return self.imports.structs[name]
+        else:
+            raise CompilerBackendException("struct doesn't exist: " + name)
+
+    def get_fn(self, name):
+        if name in self.export.fns:
+            return self.export.fns[name]
+        elif name in self.imports.fns:
+            return self.imports.fns[name]
+        else:
+            self.check_exported("function", name)
+            raise CompilerBackendException("function doesn't exist: " + name)
+
     def generate(self, ast):
         if ast.data != "program":
             raise CompilerBackendException("invalid program type: " + ast.data)
 
-        self.compiled = ""
+        # Sections are written out in this order:
+        #   base: BASE_CODE
+        #   includes: Header includes for the C code
+        #   data_decls: Forward declarations for the C code
+        #   fn_decls
+        #   code: Function definitions and global statements
+        self.emitter = Emitter(SECTIONS)
+        self.emitter.emit("base", BASE_CODE)
         self.context = {
-            "includes": "", # Header includes for the C code
-            "data_decls": "", # Forward declarations for the C code
-            "fn_decls": "",
             "locals_stack": [], # This will be initialized later in generate_function
             "later": {},
+            "loops": 0, # Number of for each loops so far, to name their variables
+            "temps": 0, # Number of operator temporaries so far, to name them
+            "current_result_pointer": False,
         }
         self.locals = None
         self.export = Export()
-
+        # Side table of node id -> Type, filled in by infer_type
+        # Every node is type checked once, codegen only looks its operands up
+        self.types = {}
+        # Names of the array and slice structs declared so far
+        self.sequence_types = set()
+        # (struct name or None, function name) of every function made static by --whole-program
+        self.internal = set()
+
+        if self.args.bounds_check:
+            self.emitter.emit("base", BOUNDS_CHECK_CODE)
+        if self.args.instrument:
+            self.emitter.emit("base", INSTRUMENT_CODE)
+
+        # Where #line directives point, absolute so debug info still finds the source from another directory
+        self.source_path = os.path.abspath(self.args.file)
+
+        self.generate_imports()
+
+        # First pass: structs are declared and every signature is exported,
+        # so code can use the structs and functions defined after it
+        items = []
+        structs = {}
         for node in ast.children:
             if node.data == "include":
-                self.context["includes"] = self.context["includes"] + self.generate_include(node)
-            elif node.data in ("function_typed", "function_void"):
-                self.compiled += self.generate_function(node)
+                self.emitter.emit("includes", self.generate_include(node))
+            elif node.data == "import":
+                pass # Imports are resolved before generating, see add_import
+            elif node.data in FUNCTION_TYPES:
+                self.export_function(node)
+                items.append(node)
             elif node.data == "struct":
-                self.compiled += self.generate_struct(node)
+                if node.children[0].text in structs:
+                    raise CompilerBackendException(f"struct {node.children[0].text} is defined twice")
+                structs[node.children[0].text] = node
+                items.append(node)
             else: # node.data == statement
-                self.compiled += self.generate_statement(node)
-        
-        self.compiled = BASE_CODE + self.context["includes"] + self.context["data_decls"] + self.context["fn_decls"] + self.compiled
-    
-    def generate_struct(self, ast):
+                items.append(node)
+
+        for name in self.order_structs(structs):
+            self.declare_struct(structs[name])
+
+        # Second pass: the code of every function and struct only depends on the exports,
+        # so they're generated independently, in parallel on large programs
+        # Forking copies the locks other threads hold without the threads that would release them,
+        # so it's only done when nothing else runs, not in the server or next to a module being compiled
+        if self.args.jobs > 1 and len(items) >= PARALLEL_ITEMS and "fork" in multiprocessing.get_all_start_methods() and threading.active_count() == 1:
+            self.generate_parallel(items)
+        else:
+            for node in items:
+                self.emitter.emit("code", self.generate_item(node))
+
+    def generate_item(self, node):
+        # Names of loop variables and temporaries only have to be unique within a function
+        self.context["loops"] = 0
+        self.context["temps"] = 0
+
+        if node.data in FUNCTION_TYPES:
+            with self.profile_item("function", self.unwrap_function(node)[0].children[0].text):
+                return self.generate_function(node)
+        elif node.data == "struct":
+            with self.profile_item("struct", node.children[0].text):
+                return self.generate_struct(node)
+        else: # node.data == statement
+            return self.line_directive(node) + self.generate_statement(node)
+
+    # Generates items on a pool of forked processes, which inherit the backend as the first pass left it
+    # Every item is generated into an emitter of its own, and they're merged in source order,
+    # so the output is the same as generating them one after the other
+    def generate_parallel(self, items):
+        jobs = min(self.args.jobs, len(items) // WORKER_ITEMS)
+        context = multiprocessing.get_context("fork")
+
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=context, initializer=init_worker, initargs=(self, items)) as pool:
+            # A few chunks per worker, so a slow chunk doesn't leave the others idle
+            for emitter, internal, flags, profile in pool.map(generate_worker_item, range(len(items)), chunksize=max(1, len(items) // (jobs * 4))):
+                self.emitter.merge(emitter)
+                self.internal.update(internal)
+                self.flags = self.flags + [flag for flag in flags if flag not in self.flags]
+                self.profiler.merge(profile)
+
+    # Names of the structs defined in the module, each one after the ones it holds by value,
+    # since C needs the size of a field's type
+    # A struct reached again while the ones it holds are being ordered would contain itself
+    def order_structs(self, structs):
+        order = []
+        visiting = []
+
+        def visit(name):
+            if name in order:
+                return
+            if name in visiting:
+                cycle = visiting[visiting.index(name):] + [name]
+                raise CompilerBackendException("struct contains itself: " + " -> ".join(cycle))
+
+            visiting.append(name)
+            for node in structs[name].children[1].children:
+                if node.data == "struct_property":
+                    var_type = self.parse_type(node.children[1])
+                    while var_type.type == "array" and var_type.ptr == 0:
+                        var_type = var_type.elem
+                    if var_type.type == "struct" and var_type.ptr == 0 and var_type.name in structs:
+                        visit(var_type.name)
+            visiting.pop()
+            order.append(name)
+
+        for name in structs:
+            visit(name)
+        return order
+
+    # Declares the struct and exports its properties and the signatures of its methods
+    def declare_struct(self, ast):
         if ast.data != "struct":
             raise CompilerBackendException("invalid struct type: " + ast.data)
 
-        compiled = ""
-
         # Set struct name for generate_struct_block
-        struct_name = ast.children[0].children[0].value
+        struct_name = ast.children[0].text
         self.context["struct_name"] = struct_name
         self.export.structs[struct_name] = Struct()
 
         struct_block = self.generate_struct_block(ast.children[1])
 
-        # We put the generated struct in data_decls
-        # compiled contains only the generated methods
-        self.context["data_decls"] += f"struct {struct_name}{{{struct_block}}};"
-
-        struct_init_block = "" # Block for the struct's init function
+        # The struct goes in data_decls, generate_struct generates the methods
+        self.emitter.emit("data_decls", f"struct {struct_name}{{{struct_block}}};")
 
         # context.later.methods was set by generate_struct_block
-        # Since it doesn't generate the methods, we do that now
-        for name, node in self.context["later"]["methods"].items():
-            # Set function pointer in struct to the method we'll generate after
-            struct_init_block += f"self->{name}=&__struct_{struct_name}_{name};"
-            # Generate the method
-            compiled += self.generate_function(node, method=True)
-
-        # Create the declaration for the struct's init function
-        init_declaration = f"void __struct_{struct_name}_init(struct {struct_name}* self)"
-        self.context["fn_decls"] += init_declaration + ";"
-
-        # Add the init function after every other method so that it can reference them
-        # As stated earlier, compiled only includes the generated methods,
-        # since the struct is in data_decls
-        compiled += f"{init_declaration}{{{struct_init_block}}}"
-
-        return compiled
+        # Every method is exported before any is generated, so methods can call the ones defined after them
+        for node in self.context["later"]["methods"].values():
+            self.export_function(node, method=True)
+
+    def generate_struct(self, ast):
+        if ast.data != "struct":
+            raise CompilerBackendException("invalid struct type: " + ast.data)
+
+        compiled = []
+
+        self.context["struct_name"] = ast.children[0].text
+
+        # Methods are called directly by their mangled name,
+        # so the struct doesn't store anything for them
+        for node in ast.children[1].children:
+            if node.data != "struct_property":
+                compiled.append(self.generate_function(node, method=True))
+
+        return "".join(compiled)
     
     def generate_struct_block(self, ast):
         if ast.data != "struct_block":
             raise CompilerBackendException("invalid struct block type: " + ast.data)
 
-        compiled = ""
+        compiled = []
 
-        # We just need to know the declaration of the methods to generate the function pointers,
-        # so we won't generate the methods yet
+        # Only the properties end up in the struct, methods are generated after it
         self.context["later"]["methods"] = {}
 
         for node in ast.children:
             if node.data == "struct_property":
                 var_type = self.generate_type(node.children[1])
-                var_name = node.children[0].children[0].value
+                var_name = node.children[0].text
+                check_copyable(self.parse_type(node.children[1]), f"property {var_name} of {self.context['struct_name']}")
 
                 # Export the struct property
                 self.export.structs[self.context["struct_name"]].vars[var_name] = self.parse_type(node.children[1])
 
-                compiled += f"{var_type} {var_name};"
+                compiled.append(f"{var_type} {var_name};")
 
             else: # node.data == function
-                fn_name = node.children[0].children[0].value
-                fn_params = self.generate_parameter_list(node.children[1], method=True)
-                fn_type = "void" if node.data == "function_void" else self.generate_type(node.children[-2])
-
-                compiled += f"{fn_type} (*{fn_name}){fn_params};"
+                fn_name = self.unwrap_function(node)[0].children[0].text
 
                 # Generate the method later
                 self.context["later"]["methods"][fn_name] = node
-
-                # The method will be exported later when generate_function gets called
         
-        return compiled
+        return "".join(compiled)
+
+    def generate_imports(self):
+        # Declare everything imported modules export, so the code can use them
+        # like they were declared in this module
+        declared = set()
+        for struct_name in self.imports.structs:
+            self.declare_imported_struct(struct_name, declared)
+
+        for fn_name, fn in self.imports.fns.items():
+            fn_type = self.generate_parsed_type(fn.type) if fn.type != None else "void"
+            self.emitter.emit("fn_decls", f"{fn_type} {fn_name}{self.generate_parsed_parameter_list(fn.params)};")
+
+    # Structs holding others by value are declared after them, since C needs those complete
+    def declare_imported_struct(self, struct_name, declared):
+        if struct_name in declared:
+            return
+        declared.add(struct_name)
+
+        struct = self.imports.structs[struct_name]
+        for var_type in struct.vars.values():
+            while var_type.type == "array" and var_type.ptr == 0:
+                var_type = var_type.elem
+            if var_type.type == "struct" and var_type.ptr == 0 and var_type.name in self.imports.structs:
+                self.declare_imported_struct(var_type.name, declared)
+
+        struct_block = []
+        for var_name, var_type in struct.vars.items():
+            struct_block.append(f"{self.generate_parsed_type(var_type)} {var_name};")
+        for fn_name, fn in struct.fns.items():
+            if returns_through_pointer(fn_name, fn):
+                fn_type = "void"
+                fn_params = self.generate_parsed_parameter_list(fn.params, struct_name, fn.type)
+            else:
+                fn_type = self.generate_parsed_type(fn.type) if fn.type != None else "void"
+                fn_params = self.generate_parsed_parameter_list(fn.params, struct_name)
+            self.emitter.emit("fn_decls", f"{fn_type} __struct_{struct_name}_{fn_name}{fn_params};")
+
+        self.emitter.emit("data_decls", f"struct {struct_name}{{{''.join(struct_block)}}};")
 
     def generate_include(self, ast):
         if ast.data != "include":
             raise CompilerBackendException("invalid include type: " + ast.data)
         
-        include_string = ast.children[0].value
+        include_string = ast.text
 
         return f"#include {include_string[:-1]}.h\"\n"
     
+    # Returns the function under any annotations, and the annotations as a dict of name -> argument
+    def unwrap_function(self, ast):
+        annotations = {}
+
+        while ast.data == "function_annotated":
+            name = ast.children[0].text
+            arg = int(ast.children[0].children[1].value) if len(ast.children[0].children) > 1 else None
+
+            if name not in ANNOTATIONS:
+                raise CompilerBackendException("unknown annotation: @" + name)
+            if name in annotations:
+                raise CompilerBackendException("duplicate annotation: @" + name)
+            if arg != None and not ANNOTATIONS[name]:
+                raise CompilerBackendException(f"annotation @{name} doesn't take an argument")
+
+            annotations[name] = arg
+            ast = ast.children[1]
+
+        return ast, annotations
+
     def generate_function(self, ast, method=False):
+        ast, annotations = self.unwrap_function(ast)
+
         if ast.data not in ("function_typed", "function_void"):
             raise CompilerBackendException("invalid function type: " + ast.data)
 
@@ -186,7 +650,7 @@ class CBackend(BaseBackend):
 
         if method:
             # Raw method name (ex. bar)
-            pure_fn_name = ast.children[0].children[0].value
+            pure_fn_name = ast.children[0].text
 
             # Mangled method name (ex. __struct_Foo_bar)
             struct_name = self.context["struct_name"]
@@ -194,7 +658,7 @@ class CBackend(BaseBackend):
         else:
             # No mangling if it's a global function,
             # so set both variables to the same value
-            pure_fn_name = ast.children[0].children[0].value
+            pure_fn_name = ast.children[0].text
             fn_name = pure_fn_name
 
         if ast.data == "function_typed":
@@ -204,30 +668,299 @@ class CBackend(BaseBackend):
 
         fn_params = self.generate_parameter_list(ast.children[1], method=method)       
 
-        export_type = self.parse_type(ast.children[2]) if fn_type != "void" else None
-        export_params = [Param(self.parse_type(node.children[1]), node.children[0].children[0].value) for node in ast.children[1].children]
+        export = self.export_function(ast, method=method)
 
         # Set this for generate_expression
         self.context["current_function"] = fn_name
-        self.context["current_return_type"] = export_type
+        self.context["current_return_type"] = export.type
+        self.context["current_method"] = method
+        self.context["current_result_pointer"] = method and returns_through_pointer(pure_fn_name, export)
+
+        if self.context["current_result_pointer"]:
+            fn_type = "void"
+            fn_params = f"{fn_params[:-1]},{self.generate_parsed_type(export.type)}* __result)"
 
-        fn_declaration = f"{fn_type} {fn_name}{fn_params}"
+        linkage, inline, attributes = self.function_attributes(ast, pure_fn_name, annotations, method)
 
-        self.context["fn_decls"] += fn_declaration + ";"
+        fn_declaration = f"{linkage}{inline}{attributes}{fn_type} {fn_name}{fn_params}"
 
-        if method:
-            export = self.export.structs[struct_name].fns
+        # The prototype isn't inline, otherwise C wouldn't emit an external definition of the function
+        self.emitter.emit("fn_decls", f"{linkage}{attributes}{fn_type} {fn_name}{fn_params};")
+
+        if "memo" in annotations:
+            # The body goes in a separate function, behind one that looks the arguments up in the memo table
+            # Recursive calls go through the table too, since they call fn_name
+            if method:
+                raise CompilerBackendException(f"can't memoize method {pure_fn_name}, it depends on self")
+
+            size = annotations["memo"] if annotations["memo"] != None else self.args.memo_size
+            memo = self.generate_memo(fn_name, fn_type, fn_params, export, size, linkage)
+
+            fn_declaration = f"static {fn_type} __memo_{fn_name}{fn_params}"
+            self.emitter.emit("fn_decls", fn_declaration + ";")
         else:
-            export = self.export.fns
+            memo = ""
 
-        export[pure_fn_name] = Func(export_type, export_params)
+        # Scalar code goes through the lowered form and its passes, anything else is generated from the tree
+        lowered = None if method else self.lower_function(ast, fn_name, export)
+        if lowered != None:
+            fn_block = self.generate_lowered(lowered)
+        else:
+            fn_block = self.generate_block(ast.children[-1])
 
-        fn_block = self.generate_block(ast.children[-1])
+        if self.args.instrument:
+            fn_block = self.generate_instrumentation(ast, f"{struct_name}.{pure_fn_name}" if method else pure_fn_name) + fn_block
 
         self.pop_locals()
 
-        return f"{fn_declaration}{{{fn_block}}}"
+        return f"{self.line_directive(ast)}{memo}{fn_declaration}{{{fn_block}}}"
+
+    # Points the C compiler at the line of the source a function or statement comes from,
+    # so warnings, debug info and profilers refer to the .lang file instead of the generated C
+    # Lowered code has no lines, so its functions only get one at the start
+    def line_directive(self, ast):
+        line = first_line(ast)
+        if line == None:
+            return ""
+        return f"\n#line {line} {c_string(self.source_path)}\n"
+
+    # Counts a call of the function and times it until it returns, however it returns
+    # Names and paths are escaped as JSON strings, so the report writes them as they are
+    def generate_instrumentation(self, ast, name):
+        counter = f"{{.name={c_string(json.dumps(name))},.file={c_string(json.dumps(self.source_path))},.line={first_line(ast) or 0}}}"
+        return f"static struct __prof_counter __prof_fn={counter};static _Thread_local struct __prof_local __prof_thread={{.counter=&__prof_fn}};struct __prof_local* __prof __attribute__((cleanup(__prof_exit)))=__prof_enter(&__prof_thread);"
+
+    # Returns the optimized lowered function, or None if it can't be lowered
+    def lower_function(self, ast, fn_name, func):
+        locals = dict(self.locals)
+        types = dict(self.types)
+
+        try:
+            fn = Lowerer(self).lower(ast, fn_name, func)
+        except (NotLowerable, CompilerBackendException):
+            # Any error is raised again by the tree, with the locals and types it expects
+            # Types the lowering inferred were inferred against its locals, so they're dropped too
+            self.locals.clear()
+            self.locals.update(locals)
+            self.types.clear()
+            self.types.update(types)
+            return None
+
+        self.optimize(fn)
+        return fn
+
+    # Every variable is declared up front, blocks are labels reached with goto
+    def generate_lowered(self, fn):
+        labels = {id(block): f"__L{i}" for i, block in enumerate(fn.blocks)}
+        used = {operand.name for instr in instructions(fn) for operand in instr.args + [instr.dest] if isinstance(operand, Var)}
+
+        # Variables the passes removed every use of aren't declared
+        decls = "".join(f"{self.generate_lowered_type(type)} {name};" for name, type in fn.vars.items() if name not in fn.params and name in used)
+
+        # Blocks are laid out in order, so jumping to the next one is left out
+        # Only blocks something jumps to get a label, unused ones are warned about
+        blocks = []
+        jumped_to = set()
+
+        def goto(block):
+            jumped_to.add(labels[id(block)])
+            return f"goto {labels[id(block)]};"
+
+        for i, block in enumerate(fn.blocks):
+            next = fn.blocks[i + 1] if i + 1 < len(fn.blocks) else None
+            compiled = list(map(self.generate_instruction, block.instrs))
+
+            end = block.terminator
+            if end == None:
+                # Running off the end of the function, which is fine for void functions and main
+                if fn.return_type == None:
+                    compiled.append("return;")
+                elif next != None:
+                    jumped_to.add("__Lend")
+                    compiled.append("goto __Lend;")
+            elif end.op == "return":
+                compiled.append(f"return {self.generate_operand(end.args[0])};")
+            elif end.op == "jump":
+                if end.targets[0] is not next:
+                    compiled.append(goto(end.targets[0]))
+            else: # end.op == branch
+                condition = self.generate_operand(end.args[0])
+                then, otherwise = end.targets
+                if then is next:
+                    compiled.append(f"if(!{condition}){goto(otherwise)}")
+                elif otherwise is next:
+                    compiled.append(f"if({condition}){goto(then)}")
+                else:
+                    compiled.append(f"if({condition}){goto(then)}{goto(otherwise)}")
+
+            blocks.append((labels[id(block)], compiled))
+
+        if "__Lend" in jumped_to:
+            blocks.append(("__Lend", []))
+
+        return decls + "".join((f"{label}:;" if label in jumped_to else "") + "".join(compiled) for label, compiled in blocks)
+
+    def generate_instruction(self, instr):
+        dest = f"{instr.dest}=" if instr.dest != None else ""
+        args = list(map(self.generate_operand, instr.args))
+
+        if instr.op == "copy":
+            return f"{dest}{args[0]};"
+        elif instr.op == "call":
+            return f"{dest}{instr.fn}({','.join(args)});"
+        else:
+            return f"{dest}{args[0]}{OP_BIN_MAP[instr.op]}{args[1]};"
+
+    def generate_operand(self, operand):
+        # Negative literals are parenthesized so they don't merge with the operator before them
+        if isinstance(operand, Const) and operand.value.startswith("-"):
+            return f"({operand.value})"
+        return str(operand)
+
+    def generate_lowered_type(self, type):
+        # C arithmetic on types narrower than int results in an int
+        return "int" if type.name == "int" else self.generate_parsed_type(type)
+
+    # Returns the linkage, inline keyword and attributes of a function
+    # With --whole-program everything but main and @export functions is static, so gcc can inline and drop it freely
+    def function_attributes(self, ast, name, annotations, method):
+        if "inline" in annotations and "noinline" in annotations:
+            raise CompilerBackendException(f"{name} can't be both @inline and @noinline")
+        if "inline" in annotations and "memo" in annotations:
+            raise CompilerBackendException(f"can't inline {name}, it's memoized")
+
+        linkage = ""
+        if self.args.whole_program and "export" not in annotations and (method or name != "main"):
+            linkage = "static "
+            self.internal.add((self.context["struct_name"] if method else None, name))
+
+        if not method and name == "main":
+            if "inline" in annotations:
+                raise CompilerBackendException("main can't be inlined")
+            return linkage, "", ""
+        elif "inline" in annotations:
+            if self.calls_itself(ast.children[-1], name, method):
+                raise CompilerBackendException(f"can't inline {name}, it calls itself")
+            # Instrumented functions have a static counter, which C doesn't allow in inline functions
+            if self.args.instrument:
+                return linkage, "", ""
+            return linkage, "inline ", "__attribute__((always_inline))"
+        elif "noinline" in annotations:
+            return linkage, "", "__attribute__((noinline))"
+        elif "memo" not in annotations and not self.args.instrument and self.is_small(ast.children[-1]):
+            return linkage, "inline ", ""
+
+        return linkage, "", ""
+
+    # Whether a block has at most INLINE_STATEMENTS statements, counting nested ones, and no loops
+    def is_small(self, ast):
+        statements = 0
+        stack = [ast]
+
+        while len(stack) != 0:
+            node = stack.pop()
+            if node.data in LOOP_STATEMENTS:
+                return False
+            if node.data.startswith("statement"):
+                statements += 1
+                if statements > INLINE_STATEMENTS:
+                    return False
+            stack.extend(child for child in node.children if hasattr(child, "children"))
+
+        return True
+
+    def calls_itself(self, ast, name, method):
+        if ast.data == "expression_function_call":
+            called = ast.children[0].text
+            if called == "this" or (called == name and not method):
+                return True
+        elif ast.data == "expression_method_call" and method and ast.children[1].text == name:
+            # Might be a method of another struct with the same name, but that's the safe side to be on
+            return True
+
+        return any(self.calls_itself(child, name, method) for child in ast.children if hasattr(child, "children"))
+
+    # Everything other modules can use, only what --whole-program left external
+    def interface(self):
+        if not self.args.whole_program:
+            export = self.export
+        else:
+            export = Export(
+                {struct_name: Struct(struct.vars, {name: fn for name, fn in struct.fns.items() if (struct_name, name) not in self.internal}, struct.overloads)
+                    for struct_name, struct in self.export.structs.items()},
+                {name: fn for name, fn in self.export.fns.items() if (None, name) not in self.internal},
+                self.export.vars,
+                {name if struct_name == None else f"{struct_name}.{name}": self.source_path for struct_name, name in sorted(self.internal, key=str)})
+
+        # Imported structs the exports use are exported too, through properties and signatures,
+        # so importers of this module can declare them without importing where they come from
+        structs = dict(export.structs)
+        types = [type for struct in export.structs.values() for type in struct_types(struct)]
+        types += [type for fn in export.fns.values() for type in fn_types(fn)]
+        while types:
+            type = types.pop()
+            while type.type in ("array", "slice"):
+                type = type.elem
+            if type.type == "struct" and type.name not in structs:
+                structs[type.name] = self.get_struct(type.name)
+                types += struct_types(structs[type.name])
+
+        return Export(structs, export.fns, export.vars, export.internal)
+
+    def generate_memo(self, fn_name, fn_type, fn_params, func, size, linkage=""):
+        if func.type == None:
+            raise CompilerBackendException(f"can't memoize {fn_name}, it doesn't return anything")
+        if size <= 0:
+            raise CompilerBackendException(f"memo table of {fn_name} needs a positive size")
+
+        for param in func.params:
+            if not (param.type.type == "builtin" and param.type.ptr == 0 and (param.type.name in INT_TYPES or param.type.name == "bool")):
+                raise CompilerBackendException(f"can't memoize {fn_name}, parameter {param.name} of type {param.type} can't be used as a key")
+
+        entry_name = f"__memo_{fn_name}_entry"
+        table_name = f"__memo_{fn_name}_table"
+
+        # The table is direct mapped, each argument tuple has one slot it can be in
+        # A new result simply replaces whatever was in its slot
+        # Every thread has a table of its own, so a parallel for can't read a slot another iteration is writing
+        entry_keys = "".join(f"{self.generate_parsed_type(param.type)} {param.name};" for param in func.params)
+        self.emitter.emit("data_decls", f"struct {entry_name}{{bool used;{entry_keys}{fn_type} value;}};static _Thread_local struct {entry_name} {table_name}[{size}];")
+
+        hash = "".join(f"__hash=(__hash^(uint64_t){param.name})*0x9e3779b97f4a7c15u;" for param in func.params)
+        match = "".join(f"&&__entry->{param.name}=={param.name}" for param in func.params)
+        store = "".join(f"__entry->{param.name}={param.name};" for param in func.params)
+        args = ",".join(param.name for param in func.params)
+
+        return (
+            f"{linkage}{fn_type} {fn_name}{fn_params}{{"
+            f"uint64_t __hash=0;{hash}"
+            f"struct {entry_name}* __entry=&{table_name}[(__hash^(__hash>>32))%{size}u];"
+            f"if(__entry->used{match}){{return __entry->value;}}"
+            f"{fn_type} __value=__memo_{fn_name}({args});"
+            f"__entry->used=true;{store}__entry->value=__value;"
+            f"return __value;}}")
     
+    def export_function(self, ast, method=False):
+        ast = self.unwrap_function(ast)[0]
+        pure_fn_name = ast.children[0].text
+
+        export_type = self.parse_type(ast.children[2]) if ast.data == "function_typed" else None
+        export_params = [Param(self.parse_type(node.children[1]), node.children[0].text) for node in ast.children[1].children]
+
+        if export_type != None:
+            check_copyable(export_type, f"the result of {pure_fn_name}")
+        for param in export_params:
+            check_copyable(param.type, f"parameter {param.name} of {pure_fn_name}")
+
+        if method:
+            export = self.export.structs[self.context["struct_name"]].fns
+        else:
+            export = self.export.fns
+
+        export[pure_fn_name] = Func(export_type, export_params)
+
+        return export[pure_fn_name]
+
     def generate_parameter_list(self, ast, method=False):
         if ast.data != "parameter_list":
             raise CompilerBackendException("invalid parameter list type: " + ast.data)
@@ -236,7 +969,7 @@ class CBackend(BaseBackend):
             params = []
 
             for node in ast.children:
-                var_name = node.children[0].children[0].value
+                var_name = node.children[0].text
                 var_type = self.generate_type(node.children[1])
 
                 params.append(f"{var_type} {var_name}")
@@ -259,7 +992,11 @@ class CBackend(BaseBackend):
             return f"({inner})"
         else:
             if method:
-                struct_name = self.context["method_data"]["struct_name"]
+                struct_name = self.context["struct_name"]
+
+                # Register self as a local variable
+                if self.locals != None:
+                    self.locals["self"] = Type("struct", struct_name, 1)
 
                 return f"(struct {struct_name}* self)"
             else:
@@ -267,16 +1004,22 @@ class CBackend(BaseBackend):
                 # so we use (void) instead to not accept arguments
                 return "(void)"
 
+    # Same as generate_parameter_list, for parameters that were already parsed
+    def generate_parsed_parameter_list(self, params, struct_name=None, result_type=None):
+        params = [f"{self.generate_parsed_type(param.type)} {param.name}" for param in params]
+
+        if struct_name != None:
+            params.insert(0, f"struct {struct_name}* self")
+        if result_type != None:
+            params.append(f"{self.generate_parsed_type(result_type)}* __result")
+
+        return f"({','.join(params) if params else 'void'})"
+
     def generate_block(self, ast):
         if ast.data != "block":
             raise CompilerBackendException("invalid block type: " + ast.data)
 
-        compiled = ""
-
-        for node in ast.children:
-            compiled += self.generate_statement(node)
-        
-        return compiled
+        return "".join(self.line_directive(node) + self.generate_statement(node) for node in ast.children)
     
     def generate_statement(self, ast):
         if ast.data == "statement":
@@ -285,41 +1028,49 @@ class CBackend(BaseBackend):
 
         elif ast.data == "statement_return":
             expr = self.generate_expression(ast.children[0])
+
+            if self.context["current_result_pointer"]:
+                return f"{{*__result={expr};return;}}"
             return f"return {expr};"
 
         elif ast.data == "statement_if":
             if_expr = self.generate_expression(ast.children[0])
             if_block = self.generate_block(ast.children[1])
 
-            compiled = f"if({if_expr}){{{if_block}}}"
+            compiled = [f"if({if_expr}){{{if_block}}}"]
             
-            # If statement has else/elif blocks
-            if len(ast.children) > 2:
-                # Loop over each elif expression
-                #
-                # If statement has this grammar:
-                #   "if" expression block ("elif" expression block)* ["else" block]
-                # Strings get discarded after parsing, so they can be ignored
-                #
-                # Range starts at first elif expression (third element),
-                # ends at last elif block (second to last element)
-                # and skips one element every step (the current elif block)
-                for i in range(2, len(ast.children) - 1, 2):
-                    elif_expr = self.generate_expression(ast.children[i])
-                    elif_block = self.generate_block(ast.children[i + 1])
-
-                    compiled += f"else if({elif_expr}){{{elif_block}}}"
-
+            # Loop over each elif expression
+            #
+            # If statement has this grammar:
+            #   "if" expression block ("elif" expression block)* ["else" block]
+            # Strings get discarded after parsing, so they can be ignored
+            #
+            # Range starts at first elif expression (third element),
+            # ends at last elif block (second to last element)
+            # and skips one element every step (the current elif block)
+            for i in range(2, len(ast.children) - 1, 2):
+                elif_expr = self.generate_expression(ast.children[i])
+                elif_block = self.generate_block(ast.children[i + 1])
+
+                compiled.append(f"else if({elif_expr}){{{elif_block}}}")
+
+            # Expressions and blocks come in pairs, so an odd number of children means there's an else block
+            if len(ast.children) % 2 == 1:
                 else_block = self.generate_block(ast.children[-1])
 
-                compiled += f"else{{{else_block}}}"
+                compiled.append(f"else{{{else_block}}}")
 
-            return compiled
+            return "".join(compiled)
+
+        elif ast.data == "block":
+            # Left behind by the constant folder when only one branch of an if statement can run
+            block = self.generate_block(ast)
+            return f"{{{block}}}"
 
         elif ast.data == "statement_for":
-            for_var = ast.children[0].children[0].value
-            for_start = ast.children[1].children[0].children[0].value
-            for_end = ast.children[1].children[1].children[0].value
+            for_var = ast.children[0].text
+            for_start = ast.children[1].children[0].text
+            for_end = ast.children[1].children[1].text
 
             # Register loop variable as local
             self.locals[for_var] = Type("builtin", "uptr", 0)
@@ -328,17 +1079,77 @@ class CBackend(BaseBackend):
 
             return f"for(uintptr_t {for_var}={for_start};{for_var}<{for_end};{for_var}++){{{for_block}}}"
 
+        elif ast.data == "statement_parallel_for":
+            for_var = ast.children[0].text
+            for_start = ast.children[1].children[0].text
+            for_end = ast.children[1].children[1].text
+
+            var_type, reductions = self.check_parallel_for(ast)
+
+            # Iterations are split between threads by OpenMP, which the compiler has to know about
+            if "-fopenmp" not in self.flags:
+                self.flags = self.flags + ["-fopenmp"]
+
+            self.locals[for_var] = var_type
+
+            for_block = self.generate_block(ast.children[2])
+            clauses = "".join(f" reduction({op}:{name})" for name, op in reductions.items())
+
+            # Pragmas take a line of their own
+            return f"\n#pragma omp parallel for{clauses}\nfor({self.generate_parsed_type(var_type)} {for_var}={for_start};{for_var}<{for_end};{for_var}++){{{for_block}}}"
+
+        elif ast.data == "statement_while":
+            while_expr = self.generate_expression(ast.children[0])
+            while_block = self.generate_block(ast.children[1])
+
+            return f"while({while_expr}){{{while_block}}}"
+
+        elif ast.data == "statement_loop":
+            loop_block = self.generate_block(ast.children[0])
+
+            return f"for(;;){{{loop_block}}}"
+
+        elif ast.data == "statement_for_each":
+            var_name = ast.children[0].text
+            seq_type = self.infer_type(ast.children[1])
+
+            if not (seq_type.type in ("array", "slice") and seq_type.ptr == 0):
+                raise CompilerBackendException(f"can only loop over arrays and slices, not {seq_type}")
+
+            expr = self.generate_expression(ast.children[1])
+            elem_type = self.generate_parsed_type(seq_type.elem)
+
+            # Loops can be nested, so every one gets its own names
+            n = self.context["loops"]
+            self.context["loops"] += 1
+            data, length, index = f"__for{n}_data", f"__for{n}_len", f"__for{n}_i"
+
+            # Data and length are loaded once, leaving a plain index loop gcc can vectorize
+            if seq_type.type == "array":
+                setup = f"{elem_type}*{data}=({expr}).data;uintptr_t {length}={seq_type.length};"
+            else:
+                setup = f"{self.generate_parsed_type(seq_type)} __for{n}_slice={expr};{elem_type}*{data}=__for{n}_slice.data;uintptr_t {length}=__for{n}_slice.len;"
+
+            # Register loop variable as local
+            self.locals[var_name] = seq_type.elem
+
+            for_block = self.generate_block(ast.children[2])
+
+            return f"{{{setup}for(uintptr_t {index}=0;{index}<{length};{index}++){{{elem_type} {var_name}={data}[{index}];{for_block}}}}}"
+
         elif ast.data == "statement_variable_define_auto":
             # Infer variable type from expression
             expr_type = self.infer_type(ast.children[1])
 
             # infer_type returns a type of name "int" for integer literals,
             # so make sure to set it to the appropriate type before we register it
+            # The inferred type is shared with the type table, so replace it instead of mutating it
             if expr_type.type == "builtin" and expr_type.name == "int":
-                expr_type.name = "i32"
+                expr_type = Type("builtin", "i32", 0)
 
             var_type = self.generate_parsed_type(expr_type)
-            var_name = ast.children[0].children[0].value
+            var_name = ast.children[0].text
+            check_copyable(expr_type, var_name)
             var_expr = self.generate_expression(ast.children[1])
 
             # Register local variable
@@ -348,8 +1159,14 @@ class CBackend(BaseBackend):
 
         elif ast.data == "statement_variable_define":
             var_type = self.generate_type(ast.children[1])
-            var_name = ast.children[0].children[0].value
-            var_expr = self.generate_expression(ast.children[2])
+            var_name = ast.children[0].text
+            check_copyable(self.parse_type(ast.children[1]), var_name)
+
+            if ast.children[2].data == "expression_array":
+                # Array literals take the type of the variable, so [1, 2] can fill a [2]u8
+                var_expr = self.generate_array_literal(ast.children[2], self.parse_type(ast.children[1]))
+            else:
+                var_expr = self.generate_expression(ast.children[2])
 
             # Register local variable
             self.locals[var_name] = self.parse_type(ast.children[1])
@@ -358,28 +1175,135 @@ class CBackend(BaseBackend):
 
         elif ast.data == "statement_variable_declare":
             var_type = self.generate_type(ast.children[1])
-            var_name = ast.children[0].children[0].value
+            var_name = ast.children[0].text
 
             # Register local variable
             self.locals[var_name] = self.parse_type(ast.children[1])
 
-            if self.locals[var_name].type == "struct" and self.locals[var_name].ptr == 0:
-                struct_name = ast.children[1].children[0].children[0].value
-                compiled = f"{var_type} {var_name}={{0}};__struct_{struct_name}_init(&{var_name});"
+            # Arenas start out without any blocks
+            if (self.locals[var_name].type == "struct" and self.locals[var_name].ptr == 0) or self.locals[var_name] == ARENA:
+                compiled = f"{var_type} {var_name}={{0}};"
             else:
                 compiled = f"{var_type} {var_name};"
 
             return compiled
 
         elif ast.data == "statement_variable_assign":
+            check_copyable(self.infer_type(ast.children[0]), "the target of an assignment")
             expr = self.generate_expression(ast.children[0])
-            expr_new = self.generate_expression(ast.children[1])
+
+            if ast.children[1].data == "expression_array":
+                expr_new = self.generate_array_literal(ast.children[1], self.infer_type(ast.children[0]))
+            else:
+                in_place = self.generate_overload_assign(ast.children[0], expr, ast.children[1])
+                if in_place != None:
+                    return in_place
+                expr_new = self.generate_expression(ast.children[1])
 
             return f"{expr}={expr_new};"
 
         else:
             raise CompilerBackendException("invalid statement type: " + ast.data)
             
+    # Returns the type of the variable of a parallel for and the reduction of every variable it accumulates into
+    # Iterations run at the same time, so locals from outside the loop can only be read,
+    # or updated with one of PARALLEL_REDUCTIONS and not read otherwise
+    def check_parallel_for(self, ast):
+        for_var = ast.children[0].text
+
+        # The narrowest type holding both bounds, so the body can be vectorized at the width of its data
+        low, high = None, None
+        for bound in ast.children[1].children:
+            if bound.data == "number":
+                value = int(bound.text)
+                bound_low, bound_high = value, value
+            elif bound.data == "ident":
+                bound_type = self.infer_type(bound)
+                if not is_int_type(bound_type):
+                    raise CompilerBackendException(f"bounds of a parallel for have to be integers, not {bound_type}")
+                bound_low, bound_high = INT_RANGES[bound_type.name]
+            else:
+                raise CompilerBackendException("bounds of a parallel for have to be integers or variables")
+
+            low = bound_low if low == None else min(low, bound_low)
+            high = bound_high if high == None else max(high, bound_high)
+
+        for name in PARALLEL_FOR_TYPES:
+            if INT_RANGES[name][0] <= low and high <= INT_RANGES[name][1]:
+                var_type = Type("builtin", name, 0)
+                break
+        else:
+            raise CompilerBackendException(f"bounds of parallel for {for_var} don't fit in any integer type")
+
+        shared = set(self.locals)
+        reductions = {}
+        reads = set()
+
+        # Writing a field of a shared struct, or through a shared pointer, writes the same place every iteration
+        # Writing an element of one is fine, as long as iterations write different elements
+        def check_part_written(target, private):
+            name = written_local(target)
+            if name != None and local_name(target) == None and name in shared and name not in private:
+                raise CompilerBackendException(f"data race: every iteration of parallel for {for_var} writes the same part of {name}")
+
+        def visit(node, private, statement=False):
+            if node.data == "statement_return":
+                raise CompilerBackendException(f"can't return out of parallel for {for_var}")
+            elif node.data in ("statement_variable_define_auto", "statement_variable_define", "statement_variable_declare"):
+                # Declared inside the loop, so every iteration has its own
+                for child in node.children[1:]:
+                    if hasattr(child, "children"):
+                        visit(child, private)
+                private.add(node.children[0].text)
+                return
+            elif node.data in ("statement_for", "statement_for_each", "statement_parallel_for"):
+                private = private | {node.children[0].text}
+            elif node.data == "block":
+                private = set(private)
+            elif node.data == "statement_variable_assign":
+                name = local_name(node.children[0])
+                if name == for_var:
+                    raise CompilerBackendException(f"can't assign the variable of parallel for {for_var}")
+                if name in shared and name not in private:
+                    raise CompilerBackendException(f"data race: every iteration of parallel for {for_var} assigns {name}")
+                check_part_written(node.children[0], private)
+            elif node.data == "expression_op_bin" and node.children[1].data.endswith("_eq"):
+                name = local_name(node.children[0])
+                if name == for_var:
+                    raise CompilerBackendException(f"can't assign the variable of parallel for {for_var}")
+                check_part_written(node.children[0], private)
+                if name in shared and name not in private:
+                    op = PARALLEL_REDUCTIONS.get(node.children[1].data)
+                    var_type = self.infer_type(node.children[0])
+                    if not statement or op == None or not (var_type.type == "builtin" and var_type.ptr == 0 and var_type.name != "bool"):
+                        raise CompilerBackendException(f"data race: every iteration of parallel for {for_var} updates {name}")
+                    if reductions.setdefault(name, op) != op:
+                        raise CompilerBackendException(f"data race: parallel for {for_var} updates {name} with different operators")
+                    visit(node.children[2], private)
+                    return
+            elif node.data in ("expression_new", "expression_method_call", "expression_ref"):
+                # Allocating from an arena, freeing it or passing it on to something that could updates the arena
+                arena = node.children[1] if node.data == "expression_new" else node.children[0]
+                name = written_local(arena)
+                if name in shared and name not in private and (node.data == "expression_new" or self.infer_type(arena).name == "arena"):
+                    raise CompilerBackendException(f"data race: every iteration of parallel for {for_var} uses arena {name}")
+            elif node.data == "expression_value" and node.children[0].data == "ident":
+                name = node.children[0].text
+                if name in shared and name not in private:
+                    reads.add(name)
+
+            for child in node.children:
+                if hasattr(child, "children"):
+                    visit(child, private, node.data == "statement")
+
+        visit(ast.children[2], {for_var})
+
+        for name in reductions:
+            if name in reads:
+                raise CompilerBackendException(f"data race: parallel for {for_var} reads {name} while accumulating into it")
+
+        return var_type, reductions
+
     def generate_expression(self, ast):
         if ast.data == "expression_ref":
             expr = self.generate_expression(ast.children[0])
@@ -391,59 +1315,140 @@ class CBackend(BaseBackend):
 
         elif ast.data == "expression_function_call":
             # TODO: change this back to expression someday
-            fn_name = ast.children[0].children[0].value
-            # TODO: make this handle methods (if it doesn't already)
+            fn_name = ast.children[0].text
+            self_arg = None
+
             if fn_name == "this":
                 fn_name = self.context["current_function"]
+                # Methods recurse on the same struct
+                if self.context["current_method"]:
+                    self_arg = "self"
 
-            if ast.children[0].data in ("expression_dot", "expression_arrow"):
-                method = True
-                # Set struct name for generate_argument_list
-                op = "&" if ast.children[0].data == "expression_dot" else ""
-                self.context["struct_name"] = op + self.generate_expression(ast.children[0].children[0])
-            else:
-                method = False
+                    if self.context["current_result_pointer"]:
+                        return self.generate_pointer_call(fn_name, ast.children[1], self_arg, self.context["current_return_type"])
+
+            elif vector_function(fn_name) != None:
+                # Type checks the arguments, the functions are declared with the vector type
+                self.infer_type(ast)
+                self.declare_vector(vector_function(fn_name)[0])
+                fn_name = f"__{fn_name}"
 
-            fn_args = self.generate_argument_list(ast.children[1], method=method)
+            # Functions that aren't known are left to C, unless an imported module made them static
+            elif fn_name not in self.export.fns:
+                self.check_exported("function", fn_name)
+
+            fn_args = self.generate_argument_list(ast.children[1], self_arg)
 
             return f"({fn_name}{fn_args})"
 
-        elif ast.data == "expression_op_bin":
-            expr_l = self.generate_expression(ast.children[0])
-            expr_r = self.generate_expression(ast.children[2])
-            type_l = self.infer_type(ast.children[0])
-            type_r = self.infer_type(ast.children[2])
+        elif ast.data == "expression_method_call":
+            expr = self.generate_expression(ast.children[0])
+            # Type checks the call, raising if the method doesn't exist
+            self.infer_type(ast)
+            expr_type = self.types[id(ast.children[0])]
+            name = ast.children[1].text
+
+            # Methods are resolved statically and take a pointer to the struct as the first argument
+            # A receiver without an address, like the result of a call, is stored in a temporary first
+            setup = []
+            if expr_type.ptr == 0:
+                self_arg = self.generate_operand_pointer(ast.children[0], setup, expr)
+            else:
+                self_arg = expr
 
-            if type_l == type_r:
-                if type_l.type == "struct" and type_l.ptr == 0:
-                    # Check if struct implemented overloading for operator
-                    fn_name = f"__{ast.children[1].data}__"
-                    if fn_name in self.export.structs[type_l.name].fns:
-                        return f"(__struct_{type_l.name}_{fn_name}(&{expr_l},&{expr_r}))"
-            # Check if left has defined int type and right is a literal
-            elif ((type_l.type == "builtin" and
-                   type_l.name in INT_TYPES and
-                   type_l.ptr == 0 and
-                   type_r == VALUE_TYPE_MAP["number"]) or
-            # Check if right has defined int type and left is a literal
-                  (type_r.type == "builtin" and
-                   type_r.name in INT_TYPES and
-                   type_r.ptr == 0 and
-                   type_l == VALUE_TYPE_MAP["number"])):
-                pass
+            if expr_type.type == "builtin":
+                return f"({ARENA_METHODS[name]}({self_arg}))"
+
+            fn_name = f"__struct_{expr_type.name}_{name}"
+            method = self.get_struct(expr_type.name).fns[name]
+            if returns_through_pointer(name, method):
+                compiled = self.generate_pointer_call(fn_name, ast.children[2], self_arg, method.type)
             else:
-                raise CompilerBackendException(f"can't apply binary operation to expressions of different type: {type_l} and {type_r}")
+                compiled = f"({fn_name}{self.generate_argument_list(ast.children[2], self_arg)})"
+
+            if setup:
+                return f"({{{''.join(setup)}{compiled};}})"
+            return compiled
+
+        elif ast.data == "expression_op_bin":
+            # Type checks the operands, raising if they don't match
+            self.infer_type(ast)
+            type_l = self.types[id(ast.children[0])]
+            type_r = self.types[id(ast.children[2])]
+
+            # Overloads generate their operands themselves, so they're only generated here for plain operators,
+            # otherwise every operator of a chain would generate the rest of the chain again
+            if type_l == type_r and type_l.type == "struct" and type_l.ptr == 0:
+                # Check if struct implemented overloading for operator
+                setup = []
+                value = self.generate_overload(ast, setup)
+                if value != None:
+                    return f"({{{''.join(setup)}{value};}})"
 
             # Generate expression
+            expr_l = self.generate_expression(ast.children[0])
+            expr_r = self.generate_expression(ast.children[2])
             expr_op = OP_BIN_MAP[ast.children[1].data]
             return f"({expr_l}{expr_op}{expr_r})"
 
+        elif ast.data == "expression_index":
+            expr = self.generate_expression(ast.children[0])
+            index = self.generate_expression(ast.children[1])
+
+            # Type checks the container and the index
+            self.infer_type(ast)
+            seq_type = self.types[id(ast.children[0])]
+
+            if is_vector_type(seq_type):
+                # Lanes are indexed like a C array, and can be assigned to
+                if self.args.bounds_check:
+                    index = f"__check_index({index},{VECTOR_TYPES[seq_type.name][1]})"
+                return f"({expr}[{index}])"
+
+            if seq_type.type == "array":
+                # The length is known, so only the index needs checking
+                if self.args.bounds_check:
+                    index = f"__check_index({index},{seq_type.length})"
+                return f"(({expr}).data[{index}])"
+
+            if self.args.bounds_check:
+                # Checked through a function, so the slice expression only runs once
+                return f"(*{self.generate_sequence_type(seq_type)}_at({expr},{index}))"
+            return f"(({expr}).data[{index}])"
+
+        elif ast.data == "expression_slice":
+            expr = self.generate_expression(ast.children[0])
+
+            self.infer_type(ast)
+            seq_type = self.types[id(ast.children[0])]
+            slice_name = self.generate_sequence_type(slice_type(seq_type.elem))
+            lo, hi = (bound.text for bound in ast.children[1].children)
+
+            # Arrays are sliced like a slice of the whole array
+            if seq_type.type == "array":
+                expr = f"(struct {slice_name}){{({expr}).data,{seq_type.length}}}"
+
+            return f"({slice_name}_sub({expr},{lo},{hi}))"
+
+        elif ast.data == "expression_array":
+            return self.generate_array_literal(ast, self.infer_type(ast))
+
         elif ast.data == "expression_dot":
             expr = self.generate_expression(ast.children[0])
-            expr_type = self.infer_type(ast.children[0])
-            name = ast.children[1].children[0].value
+            expr_type = self.infer_type(ast.children[0]) # Already in the type table at this point
+            name = ast.children[1].text
+
+            if expr_type.type in ("array", "slice"):
+                # Type checks the length
+                self.infer_type(ast)
 
-            if expr_type.type == "struct":
+                if expr_type.type == "array":
+                    compiled = f"({expr_type.length})"
+                elif expr_type.ptr == 0:
+                    compiled = f"({expr}.len)"
+                else:
+                    compiled = f"({expr}->len)"
+            elif expr_type.type == "struct":
                 if expr_type.ptr == 0:
                     compiled = f"({expr}.{name})"
                 elif expr_type.ptr == 1:
@@ -455,21 +1460,166 @@ class CBackend(BaseBackend):
 
             return compiled
 
+        elif ast.data == "expression_new":
+            # Type checks the arena
+            self.infer_type(ast)
+            arena = self.generate_expression(ast.children[1])
+            if self.types[id(ast.children[1])].ptr == 0:
+                arena = f"&{arena}"
+
+            # The size and alignment of structs come from the declaration generate_struct_block made
+            type = self.generate_type(ast.children[0])
+            return f"(({type}*)__arena_alloc({arena},sizeof({type}),_Alignof({type})))"
+
         elif ast.data == "expression_value":
-            value = ast.children[0].children[0].value
+            if ast.children[0].data in VALUE_KEYWORD_MAP:
+                return f"({VALUE_KEYWORD_MAP[ast.children[0].data]})"
+
+            value = ast.children[0].text
             return f"({value})"
 
         else:
             raise CompilerBackendException("invalid expression type: " + ast.data)
     
-    def generate_argument_list(self, ast, method=False):
+    # Lowers an operator on structs to statements appended to setup, returning the expression holding its result
+    # or None if the struct doesn't overload the operator
+    # Results are written into result (a pointer), or into a new temporary if it's None
+    # Where the struct has an in place overload (like __add_eq__ for +) it's used instead, so a + b + c
+    # copies a single operand into the result and adds the others to it
+    def generate_overload(self, ast, setup, result=None):
+        type = self.infer_type(ast.children[0])
+        struct = self.get_struct(type.name)
+        op = ast.children[1].data
+        prefix = f"__struct_{type.name}_"
+        fn_name, in_place_name = f"__{op}__", f"__{op}_eq__"
+
+        if op.endswith("_eq") or op in OP_BIN_COMPARISONS:
+            if fn_name not in struct.fns:
+                return None
+            if returns_through_pointer(fn_name, struct.fns[fn_name]):
+                raise CompilerBackendException(f"operator {OP_BIN_MAP[op]} of {type.name} can't return a struct")
+
+            # The left side is updated in place, or compared, so it has to be addressable
+            if op.endswith("_eq"):
+                expr_l = f"&{self.generate_expression(ast.children[0])}"
+            else:
+                expr_l = self.generate_operand_pointer(ast.children[0], setup)
+            expr_r = self.generate_operand_pointer(ast.children[2], setup)
+
+            return f"{prefix}{fn_name}({expr_l},{expr_r})"
+
+        if in_place_name not in struct.fns and fn_name not in struct.fns:
+            return None
+
+        if not self.is_overloaded(ast):
+            # The overload returns something else than a struct, it's called like any function
+            expr_l = self.generate_operand_pointer(ast.children[0], setup)
+            expr_r = self.generate_operand_pointer(ast.children[2], setup)
+            return f"{prefix}{fn_name}({expr_l},{expr_r})"
+
+        if result == None:
+            result = f"&{self.generate_temporary(self.infer_type(ast), setup)}"
+
+        if in_place_name in struct.fns and self.infer_type(ast) == type:
+            # The right side is computed first, it may read what the left side is about to be written to
+            expr_r = self.generate_operand_pointer(ast.children[2], setup)
+
+            if self.is_overloaded(ast.children[0]):
+                self.generate_overload(ast.children[0], setup, result)
+            else:
+                setup.append(f"{dereference(result)}={self.generate_expression(ast.children[0])};")
+
+            setup.append(f"{prefix}{in_place_name}({result},{expr_r});")
+        else:
+            expr_l = self.generate_operand_pointer(ast.children[0], setup)
+            expr_r = self.generate_operand_pointer(ast.children[2], setup)
+            setup.append(f"{prefix}{fn_name}({expr_l},{expr_r},{result});")
+
+        return dereference(result)
+
+    # Lowers a = a + b to an in place update of a when the struct has __add_eq__, returning None if it can't
+    # target is what's assigned to and expr its generated expression
+    def generate_overload_assign(self, target, expr, ast):
+        if not self.is_overloaded(ast):
+            return None
+
+        type = self.infer_type(ast.children[0])
+        in_place_name = f"__{ast.children[1].data}_eq__"
+        # a = a + a would update a while reading it
+        if in_place_name not in self.get_struct(type.name).fns or not same_place(ast.children[0], target) or same_place(ast.children[2], target):
+            return None
+
+        setup = []
+        expr_r = self.generate_operand_pointer(ast.children[2], setup)
+
+        return f"{{{''.join(setup)}__struct_{type.name}_{in_place_name}(&{expr},{expr_r});}}"
+
+    # Whether an expression is an operator on structs that the struct overloads to result in a struct
+    def is_overloaded(self, ast):
+        if ast.data != "expression_op_bin" or ast.children[1].data.endswith("_eq") or ast.children[1].data in OP_BIN_COMPARISONS:
+            return False
+
+        type = self.infer_type(ast.children[0])
+        if not (type.type == "struct" and type.ptr == 0 and self.infer_type(ast.children[2]) == type):
+            return False
+
+        fns = self.get_struct(type.name).fns
+        op = ast.children[1].data
+        return (f"__{op}_eq__" in fns and self.infer_type(ast) == type) or (f"__{op}__" in fns and returns_through_pointer(f"__{op}__", fns[f"__{op}__"]))
+
+    # Returns a pointer to the value of an operand, storing it in a temporary if it isn't addressable
+    # expr is the already generated expression of ast, if there is one
+    def generate_operand_pointer(self, ast, setup, expr=None):
+        if expr == None and self.is_overloaded(ast):
+            result = f"&{self.generate_temporary(self.infer_type(ast), setup)}"
+            self.generate_overload(ast, setup, result)
+            return result
+
+        if expr == None:
+            expr = self.generate_expression(ast)
+
+        if ast.data in LVALUE_EXPRESSIONS or (ast.data == "expression_value" and ast.children[0].data == "ident"):
+            return f"&{expr}"
+
+        return f"&{self.generate_temporary(self.infer_type(ast), setup, expr)}"
+
+    # Declares a temporary in setup, returning its name
+    def generate_temporary(self, type, setup, value=None):
+        name = f"__tmp{self.context['temps']}"
+        self.context["temps"] += 1
+
+        setup.append(f"{self.generate_parsed_type(type)} {name}{'=' + value if value != None else ''};")
+        return name
+
+    # A call to a function writing its result through a pointer, as an expression
+    def generate_pointer_call(self, fn_name, args, self_arg, type):
+        setup = []
+        result = self.generate_temporary(type, setup)
+        fn_args = self.generate_argument_list(args, self_arg)
+
+        return f"({{{''.join(setup)}{fn_name}({fn_args[1:-1]},&{result});{result};}})"
+
+    def generate_array_literal(self, ast, type):
+        if not (type.type == "array" and type.ptr == 0):
+            raise CompilerBackendException(f"array literal can't be used as {type}")
+        if len(ast.children) > type.length:
+            raise CompilerBackendException(f"array literal has {len(ast.children)} elements, more than the {type.length} of {type}")
+
+        elems = ",".join(map(self.generate_expression, ast.children))
+
+        # Elements that aren't given are zeroed
+        return f"(({self.generate_parsed_type(type)}){{{{{elems}}}}})"
+
+    def generate_argument_list(self, ast, self_arg=None):
         if ast.data != "argument_list":
             raise CompilerBackendException("invalid argument list type: " + ast.data)
         
-        inner = ",".join(map(self.generate_expression, ast.children))
+        args = list(map(self.generate_expression, ast.children))
         
-        if method:
-            inner = self.context["struct_name"] + "," + inner
+        if self_arg != None:
+            args.insert(0, self_arg)
+
+        inner = ",".join(args)
 
         return f"({inner})"
     
@@ -483,9 +1633,15 @@ class CBackend(BaseBackend):
             pass
 
         if ast.data == "type_builtin":
+            if ast.children[0].data in VECTOR_TYPES:
+                self.declare_vector(ast.children[0].data)
+            elif ast.children[0].data == "arena":
+                self.emitter.emit("base", ARENA_CODE, "arena")
             return TYPE_MAP[ast.children[0].data] + ptr
         elif ast.data == "type_userdef":
-            return "struct " + ast.children[0].children[0].value + ptr
+            return "struct " + ast.children[0].text + ptr
+        elif ast.data in ("type_array", "type_slice"):
+            return self.generate_parsed_type(self.parse_type(ast))
         else:
             raise CompilerBackendException("invalid type type: " + ast.data)
     
@@ -501,7 +1657,15 @@ class CBackend(BaseBackend):
         if ast.data == "type_builtin":
             return Type("builtin", ast.children[0].data, ptr)
         elif ast.data == "type_userdef":
-            return Type("struct", ast.children[0].children[0].value, ptr)
+            return Type("struct", ast.children[0].text, ptr)
+        elif ast.data == "type_array":
+            # [N]T
+            length = int(ast.children[1].value)
+            if length <= 0:
+                raise CompilerBackendException(f"array length has to be positive, not {length}")
+            return array_type(self.parse_type(ast.children[-1]), length)
+        elif ast.data == "type_slice":
+            return slice_type(self.parse_type(ast.children[-1]))
         else:
             raise CompilerBackendException("can't parse unknown type type: " + ast.data)
     
@@ -509,82 +1673,441 @@ class CBackend(BaseBackend):
         ptr = "*" * type.ptr
 
         if type.type == "builtin":
+            if type.name in VECTOR_TYPES:
+                self.declare_vector(type.name)
+            elif type.name == "arena":
+                self.emitter.emit("base", ARENA_CODE, "arena")
             return TYPE_MAP[type.name] + ptr
         elif type.type == "struct":
             return "struct " + type.name + ptr
+        elif type.type in ("array", "slice"):
+            return "struct " + self.generate_sequence_type(type) + ptr
         else:
             raise CompilerBackendException("invalid type type: " + type.type)
 
+    # Declares a vector type and its functions the first time it's used
+    # Declarations are keyed like the ones of arrays and slices, see generate_sequence_type
+    def declare_vector(self, name):
+        vector = TYPE_MAP[name]
+        elem, lanes = VECTOR_TYPES[name]
+        elem = TYPE_MAP[elem]
+
+        self.emitter.emit("data_decls",
+            f"typedef {elem} {vector} __attribute__((vector_size(sizeof({elem})*{lanes})));"
+            f"static inline {vector} {vector}_load(const {elem}* p){{{vector} v;__builtin_memcpy(&v,p,sizeof(v));return v;}}"
+            f"static inline void {vector}_store({elem}* p,{vector} v){{__builtin_memcpy(p,&v,sizeof(v));}}"
+            f"static inline {vector} {vector}_splat({elem} x){{return ({vector}){{0}}+x;}}", name)
+
+    # Arrays and slices are lowered to structs, declared the first time they're used
+    # Their declarations are keyed on their name, so items generated in parallel don't declare them twice
+    # Arrays wrap a C array, so they're laid out contiguously and copied, passed and returned by value
+    # Slices are a pointer to their first element and a length
+    # Returns the name of the struct
+    def generate_sequence_type(self, type):
+        if type.type == "array":
+            name = f"__array_{type.length}_{mangle_type(type.elem)}"
+        else:
+            name = f"__slice_{mangle_type(type.elem)}"
+
+        if name in self.sequence_types:
+            return name
+        self.sequence_types.add(name)
+
+        # Declares the element type first, if it's an array or slice too
+        elem = self.generate_parsed_type(type.elem)
+
+        if type.type == "array":
+            self.emitter.emit("data_decls", f"struct {name}{{{elem} data[{type.length}];}};", name)
+            return name
+
+        self.emitter.emit("data_decls", f"struct {name}{{{elem}* data;uintptr_t len;}};", name)
+
+        # Helpers take the slice by value, so the slice expression only runs once
+        # They go with the function declarations, where every struct the elements can be is complete
+        if self.args.bounds_check:
+            self.emitter.emit("fn_decls",
+                f"static inline {elem}* {name}_at(struct {name} s,uintptr_t i){{if(i>=s.len){{__builtin_trap();}}return s.data+i;}}", f"{name}_at")
+            check = "if(lo>hi||hi>s.len){__builtin_trap();}"
+        else:
+            check = ""
+        self.emitter.emit("fn_decls",
+            f"static inline struct {name} {name}_sub(struct {name} s,uintptr_t lo,uintptr_t hi){{{check}return(struct {name}){{s.data+lo,hi-lo}};}}", f"{name}_sub")
+
+        return name
+
+    # Vectors are added, subtracted, multiplied and divided lane by lane, by another vector of the same type
+    # or by a scalar of their element type, which every lane is operated on with
+    def check_vector_op(self, type_l, type_r, op):
+        if op in OP_BIN_COMPARISONS:
+            raise CompilerBackendException(f"can't compare vectors, compare their lanes instead: {type_l} and {type_r}")
+
+        vector, scalar = (type_l, type_r) if is_vector_type(type_l) else (type_r, type_l)
+        elem = Type("builtin", VECTOR_TYPES[vector.name][0], 0)
+
+        if not (scalar == vector or scalar == elem or scalar == VALUE_TYPE_MAP["number"]):
+            raise CompilerBackendException(f"can't apply binary operation to expressions of different type: {type_l} and {type_r}")
+        if scalar != vector and op.endswith("_eq") and not is_vector_type(type_l):
+            raise CompilerBackendException(f"can't assign a vector to a {type_l}")
+
+        return vector
+
+    def check_vector_function(self, ast):
+        fn_name = ast.children[0].text
+        vector, function = vector_function(fn_name)
+        elem = Type("builtin", VECTOR_TYPES[vector][0], 0)
+        expected = {"pointer": Type("builtin", elem.name, 1), "vector": Type("builtin", vector, 0), "elem": elem}
+
+        args = ast.children[1].children
+        if len(args) != len(VECTOR_FUNCTIONS[function]):
+            raise CompilerBackendException(f"{fn_name} takes {len(VECTOR_FUNCTIONS[function])} arguments, {len(args)} were given")
+
+        for arg, param in zip(args, VECTOR_FUNCTIONS[function]):
+            type = self.infer_type(arg)
+            if not (type == expected[param] or (param == "elem" and type == VALUE_TYPE_MAP["number"])):
+                raise CompilerBackendException(f"{fn_name} takes a {expected[param]}, not {type}")
+
+        return None if function == "store" else expected["vector"]
+
     def infer_type(self, ast):
+        # Look the node up in the type table first, so each subtree is only walked once
+        # Nodes are keyed by id, which is stable since the tree outlives the table
+        key = id(ast)
+        if key not in self.types:
+            self.types[key] = self.check_type(ast)
+        return self.types[key]
+
+    def check_type(self, ast):
         if ast.data == "expression_ref":
             # Increment pointer count
             type = self.infer_type(ast.children[0])
-            return type._replace(ptr=type.ptr + 1)
+            return Type(type.type, type.name, type.ptr + 1)
 
         elif ast.data == "expression_deref":
             # Decrement pointer count
             type = self.infer_type(ast.children[0])
-            return type._replace(ptr=type.ptr - 1)
+            return Type(type.type, type.name, type.ptr - 1)
 
         elif ast.data == "expression_function_call":
-            fn_name = ast.children[0].children[0].value
+            fn_name = ast.children[0].text
 
             if fn_name == "this":
                 return self.context["current_return_type"]
-            if fn_name in self.export.fns:
-                return self.export.fns[fn_name].type
-            else:
-                raise CompilerBackendException("function doesn't exist: " + fn_name)
+            if vector_function(fn_name) != None:
+                return self.check_vector_function(ast)
+            return self.get_fn(fn_name).type
+
+        elif ast.data == "expression_method_call":
+            type_l = self.infer_type(ast.children[0])
+            name = ast.children[1].text
+
+            if type_l.type == "builtin" and type_l.name == "arena" and type_l.ptr in (0, 1):
+                if name not in ARENA_METHODS:
+                    raise CompilerBackendException(f"method doesn't exist: arena.{name}")
+                if len(ast.children[2].children) != 0:
+                    raise CompilerBackendException(f"arena.{name} takes no arguments")
+                return None
+
+            if not (type_l.type == "struct" and type_l.ptr in (0, 1)):
+                raise CompilerBackendException("left side of method call is not struct or struct pointer")
+
+            struct = self.get_struct(type_l.name)
+            if name not in struct.fns:
+                self.check_exported("method", f"{type_l.name}.{name}")
+                raise CompilerBackendException(f"method doesn't exist: {type_l.name}.{name}")
+
+            return struct.fns[name].type
 
         elif ast.data == "expression_op_bin":
             type_l = self.infer_type(ast.children[0])
             type_r = self.infer_type(ast.children[2])
+            op = ast.children[1].data
+
+            if type_l == type_r and type_l.type == "struct" and type_l.ptr == 0:
+                # Overloaded operators result in whatever the overload returns
+                fn_name = f"__{op}__"
+                struct = self.get_struct(type_l.name)
+                if fn_name in struct.fns:
+                    return struct.fns[fn_name].type
+
+            if is_vector_type(type_l) or is_vector_type(type_r):
+                return self.check_vector_op(type_l, type_r, op)
+
+            if op in OP_BIN_COMPARISONS:
+                type_result = VALUE_TYPE_MAP["true"]
+            else:
+                type_result = None
 
             if (type_l == type_r or
                 (type_l.type == "builtin" and
                  type_l.name in INT_TYPES and
                  type_l.ptr == 0 and
                  type_r == VALUE_TYPE_MAP["number"])):
-                return type_l
+                return type_result or type_l
             elif (type_r.type == "builtin" and
                   type_r.name in INT_TYPES and
                   type_r.ptr == 0 and
                   type_l == VALUE_TYPE_MAP["number"]):
-                return type_r
+                return type_result or type_r
             else:
                 raise CompilerBackendException(f"can't apply binary operation to expressions of different type: {type_l} and {type_r}")
 
+        elif ast.data == "expression_index":
+            type_l = self.infer_type(ast.children[0])
+            type_index = self.infer_type(ast.children[1])
+
+            if not (type_l.type in ("array", "slice") and type_l.ptr == 0) and not is_vector_type(type_l):
+                raise CompilerBackendException(f"can only index arrays, slices and vectors, not {type_l}")
+            if not is_int_type(type_index):
+                raise CompilerBackendException(f"index has to be an integer, not {type_index}")
+
+            # Indexing a vector is a lane
+            if is_vector_type(type_l):
+                return Type("builtin", VECTOR_TYPES[type_l.name][0], 0)
+            return type_l.elem
+
+        elif ast.data == "expression_slice":
+            type_l = self.infer_type(ast.children[0])
+
+            if not (type_l.type in ("array", "slice") and type_l.ptr == 0):
+                raise CompilerBackendException(f"can only slice arrays and slices, not {type_l}")
+
+            for bound in ast.children[1].children:
+                if bound.data == "number":
+                    continue
+                if not (bound.data == "ident" and is_int_type(self.locals[bound.text])):
+                    raise CompilerBackendException("slice bounds have to be integers")
+
+            return slice_type(type_l.elem)
+
+        elif ast.data == "expression_array":
+            if len(ast.children) == 0:
+                raise CompilerBackendException("can't infer the type of an empty array literal")
+
+            type_elem = self.infer_type(ast.children[0])
+            if type_elem == VALUE_TYPE_MAP["number"]:
+                type_elem = Type("builtin", "i32", 0)
+
+            for node in ast.children[1:]:
+                type_node = self.infer_type(node)
+                if not (type_node == type_elem or (type_node == VALUE_TYPE_MAP["number"] and is_int_type(type_elem))):
+                    raise CompilerBackendException(f"array literal mixes elements of type {type_elem} and {type_node}")
+
+            return array_type(type_elem, len(ast.children))
+
         elif ast.data == "expression_dot":
             type_l = self.infer_type(ast.children[0])
-            name = ast.children[1].children[0].value
+            name = ast.children[1].text
+
+            if type_l.type in ("array", "slice") and type_l.ptr in (0, 1):
+                if name != "len":
+                    raise CompilerBackendException(f"{type_l} has no property {name}, only len")
+                return Type("builtin", "uptr", 0)
 
             if not type_l.type == "struct":
                 raise CompilerBackendException("left side of dot expression is not struct or struct pointer")
 
-            return self.export.structs[type_l.name].vars[name]
+            return self.get_struct(type_l.name).vars[name]
+
+        elif ast.data == "expression_new":
+            type_arena = self.infer_type(ast.children[1])
+            if not (type_arena.type == "builtin" and type_arena.name == "arena" and type_arena.ptr in (0, 1)):
+                raise CompilerBackendException(f"new allocates in an arena or a pointer to one, not {type_arena}")
+            if type_arena.ptr == 0 and local_name(ast.children[1]) == None and ast.children[1].data not in LVALUE_EXPRESSIONS:
+                raise CompilerBackendException("new allocates in an arena stored somewhere, not a temporary one")
+
+            type = self.parse_type(ast.children[0])
+            return Type(type.type, type.name, type.ptr + 1, type.elem, type.length)
 
         elif ast.data == "expression_value":
             type = ast.children[0].data
 
             if type == "ident":
-                return self.locals[ast.children[0].children[0].value]
+                return self.locals[ast.children[0].text]
+
+            if type == "null":
+                raise CompilerBackendException("can't infer the type of null")
 
-            # Need to make a copy otherwise it returns a reference to the object
-            return VALUE_TYPE_MAP[type].copy()
+            return VALUE_TYPE_MAP[type]
 
         elif ast.data == "ident":
-            return self.locals[ast.children[0].value]
+            return self.locals[ast.text]
 
         else:
             raise CompilerBackendException("don't know how to infer unknown expression type: " + ast.data)
     
-    def write_output(self):
-        source_file = self.output + ".source.c"
+    def cache_key(self):
+        return (self.compiler, compiler_version(self.compiler), self.flags, self.args.keep_intermediate, self.args.memo_size, self.args.pgo_train, self.args.bounds_check, self.pass_manager.names, self.args.whole_program, self.args.shared, self.args.instrument, self.source_key())
+
+    # Debug info and reports of instrumented programs have the path of the source in them,
+    # so they're only shared by builds of the same file
+    def source_key(self):
+        if self.args.debug_info or self.args.instrument:
+            return os.path.abspath(self.args.file)
+        return None
+
+    def outputs(self):
+        if self.args.keep_intermediate:
+            return [self.output, self.output + ".source.c"]
+        return [self.output]
+
+    # Returns the path of the prelude as a header, with a precompiled header next to it, or None without one
+    # Headers are cached by the prelude, compiler and flags, so programs with the same includes share one
+    def precompiled_header(self):
+        # The intermediate source is kept whole, so it still compiles on its own
+        if self.build_cache == None or self.args.no_pch or self.args.keep_intermediate:
+            return None
+
+        prelude = "".join("".join(self.emitter.sections[section]) for section in PRELUDE_SECTIONS)
+        key = hashlib.sha256("\0".join(["pch", prelude, self.compiler, compiler_version(self.compiler), " ".join(self.flags)]).encode("utf-8")).hexdigest()
+
+        # Headers are entries of the build cache, so they count towards its size and get evicted like builds
+        entry = self.build_cache.lookup(key)
+        if entry == None:
+            # Other compiles may be building the same header, so it only appears once it's complete
+            tmp = self.build_cache.make_temp()
+            try:
+                header = os.path.join(tmp, "prelude.h")
+                with open(header, "w") as f:
+                    f.write(prelude)
+
+                with self.profiler.phase("pch"):
+                    self.run_process([self.compiler, "-x", "c-header", header, "-o", header + ".gch"] + self.flags, " building the precompiled header")
+            except BaseException:
+                shutil.rmtree(tmp, ignore_errors=True)
+                raise
+
+            # Evicting is left to the end of the build, which could otherwise evict the header it's about to use
+            entry = self.build_cache.insert(key, tmp, evict=False)
+
+        return os.path.join(entry, "prelude.h")
+
+    def run_compiler(self, output, extra_flags=[]):
+        header = self.precompiled_header()
+
+        if self.args.keep_intermediate:
+            source_file = output + ".source.c"
+
+            with open(source_file, "w") as f:
+                self.emitter.write(f)
+
+            with self.profiler.phase("compiler"):
+                self.run_process([self.compiler, source_file, "-o", output] + extra_flags + self.flags)
+        else:
+            # Stream the code straight into the compiler's stdin, no temporary file needed
+            with self.profiler.phase("compiler"):
+                if header != None:
+                    # The compiler picks up header.gch instead of parsing the prelude again
+                    sections = SECTIONS[len(PRELUDE_SECTIONS):]
+                    extra_flags = ["-include", header] + extra_flags
+                else:
+                    sections = SECTIONS
+
+                self.run_process([self.compiler, "-x", "c", "-", "-o", output] + extra_flags + self.flags, write_input=lambda f: self.emitter.write(f, sections))
+
+    def call_compiler(self, args):
+        with self.profiler.phase("compiler"):
+            self.run_process([self.compiler] + args + self.flags)
+
+    # Runs the compiler, raising if it fails, with doing what added to the error
+    # Its messages go straight to stderr, unless Python's stderr was replaced, like the server does to give
+    # every job its own, then they're collected and added to the error, or written to it if it succeeded
+    def run_process(self, command, doing="", write_input=None):
+        captured = sys.stderr is not sys.__stderr__
 
-        with open(source_file, "w") as f:
-            f.write(self.compiled)
+        with tempfile.TemporaryFile("w+") if captured else contextlib.nullcontext() as messages:
+            process = subprocess.Popen(command, stdin=subprocess.PIPE if write_input != None else None, stderr=messages, text=True)
+            if write_input != None:
+                write_input(process.stdin)
+                process.stdin.close()
+            returncode = process.wait()
 
-        subprocess.run([self.compiler, source_file, "-o", self.output] + self.flags)
+            if captured:
+                messages.seek(0)
+                messages = messages.read()
 
-        if not self.args.keep_intermediate:
-            os.remove(source_file)
\ No newline at end of file
+        if returncode != 0:
+            raise CompilerBackendException(f"{self.compiler} exited with code {returncode}{doing}" + (f":\n{messages.rstrip()}" if messages else ""))
+        if messages:
+            sys.stderr.write(messages)
+
+    def write_output(self):
+        if self.profile == "pgo":
+            if self.args.shared:
+                raise CompilerBackendException("the pgo profile can't build shared objects, it has to run the program to train")
+            self.write_output_pgo()
+        else:
+            self.run_compiler(self.output, self.link_flags())
+
+    @contextlib.contextmanager
+    def pgo_dir(self, source):
+        # Profile data only outlives the build if caching is on
+        if self.args.no_cache:
+            with tempfile.TemporaryDirectory() as path:
+                yield path
+            return
+
+        key = hashlib.sha256("\0".join([source, compiler_version(self.compiler), " ".join(self.flags), self.args.pgo_train]).encode("utf-8")).hexdigest()
+        path = os.path.join(self.args.cache_dir, "pgo", key)
+        os.makedirs(path, exist_ok=True)
+
+        # Builds of the same program share the directory, so only one of them uses it at a time
+        with open(os.path.join(path, "lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield path
+
+    def write_output_pgo(self):
+        if self.args.pgo_train == None:
+            raise CompilerBackendException("the pgo profile needs a training command, see --pgo-train")
+
+        source = self.emitter.getvalue()
+
+        if self.args.keep_intermediate:
+            with open(self.output + ".source.c", "w") as f:
+                f.write(source)
+
+        with self.pgo_dir(source) as profile_dir:
+            source_file = os.path.join(profile_dir, "program.c")
+            # gcc names the profile data after the object file, so both builds have to use the same one
+            object_file = os.path.join(profile_dir, "program.o")
+            profile_file = os.path.join(profile_dir, "program.gcda")
+            instrumented = os.path.join(profile_dir, "program-instrumented")
+
+            with open(source_file, "w") as f:
+                f.write(source)
+
+            # Profile data is keyed on the generated code, so it's only missing if something changed
+            if not os.path.exists(profile_file):
+                self.call_compiler(["-c", source_file, "-o", object_file, "-fprofile-generate"])
+                self.call_compiler([object_file, "-o", instrumented, "-fprofile-generate"])
+
+                # replace rather than format, so other braces in the command are left alone
+                command = self.args.pgo_train.replace("{output}", instrumented)
+                with self.profiler.phase("train"):
+                    returncode = subprocess.run(command, shell=True).returncode
+
+                if returncode != 0:
+                    # Whatever the failed run wrote would be used by the next build otherwise
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(profile_file)
+                    raise CompilerBackendException(f"training command exited with code {returncode}: {command}")
+                if not os.path.exists(profile_file):
+                    raise CompilerBackendException(f"training command didn't run the program: {command}")
+
+            self.call_compiler(["-c", source_file, "-o", object_file, "-fprofile-use", "-fprofile-partial-training"])
+            self.call_compiler([object_file, "-o", self.output])
+
+    def write_object(self, output):
+        if self.profile == "pgo":
+            raise CompilerBackendException("the pgo profile doesn't support programs split into modules")
+
+        self.run_compiler(output, ["-c"])
+
+    def link(self, objects):
+        # Modules can come from the cache without being generated, so the objects are asked whether they use OpenMP
+        if "-fopenmp" not in self.flags and any(uses_openmp(path) for path in objects):
+            self.flags = self.flags + ["-fopenmp"]
+
+        self.call_compiler(objects + ["-o", self.output] + self.link_flags())
+
+    def link_flags(self):
+        return ["-shared"] if self.args.shared else []
\ No newline at end of file
@@ -0,0 +1,904 @@
+import os, sys, stat
+from array import array
+
+from .exceptions import CompilerBackendException
+from .types import Type, Struct, Export
+from .lowering import INT, promote
+from .backend_c import CBackend, FUNCTION_TYPES, OP_BIN_COMPARISONS, INT_TYPES, VECTOR_TYPES, is_int_type, vector_function, check_copyable
+from . import bytecode
+
+# Runs the vm.py next to main.py, with the Python running the compiler
+VM_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "vm.py")
+
+COMPARISON_OPS = {
+    "equal": bytecode.EQ,
+    "not_equal": bytecode.NE,
+    "less_than": bytecode.LT,
+    "greater_than": bytecode.GT,
+}
+
+# Jumps taken when a comparison is true, and when it's false
+JUMP_IF = {
+    "equal": (bytecode.JEQ, bytecode.JNE),
+    "not_equal": (bytecode.JNE, bytecode.JEQ),
+    "less_than": (bytecode.JLT, bytecode.JNLT),
+    "greater_than": (bytecode.JGT, bytecode.JNGT),
+}
+
+ARITHMETIC_OPS = {
+    "add": bytecode.ADD,
+    "subtract": bytecode.SUB,
+    "multiply": bytecode.MUL,
+    "divide": bytecode.DIV,
+}
+
+FLOAT_TYPES = ("f32", "f64")
+
+UPTR = Type("builtin", "uptr", 0)
+
+# Structs and arrays are stored in a list, which pointers to them point to directly
+def is_aggregate(type):
+    return type.ptr == 0 and type.type in ("struct", "array")
+
+def is_scalar(type):
+    return type.type == "builtin" and type.ptr == 0
+
+class VMBackend(CBackend):
+    # Compiles to bytecode for the interpreter in bytecode.py, so programs run without a C compiler
+    # Types, exports and type checking are the C backend's, only the code generated differs
+    def __init__(self, args):
+        super().__init__(args)
+        self.unit = None
+
+    def generate(self, ast):
+        if ast.data != "program":
+            raise CompilerBackendException("invalid program type: " + ast.data)
+        if self.args.instrument:
+            raise CompilerBackendException("the vm backend doesn't support --instrument")
+
+        self.context = {
+            "locals_stack": [],
+            "later": {},
+            "current_result_pointer": False,
+        }
+        self.locals = None
+        self.export = Export()
+        self.types = {}
+        self.internal = set()
+
+        self.consts = []
+        self.const_index = {} # (type, value) -> index in consts, for constants that can be hashed
+        self.strings = [] # Indexes of the string constants
+        self.names = [] # Names of the called functions, CALL refers to them by index
+        self.name_index = {}
+        self.includes = set()
+        self.layouts = {} # Type -> layout, see bytecode.copy
+        self.fns = {}
+
+        # Everything is exported before any code is generated, so functions can call the ones defined after them
+        functions = []
+        structs = {}
+        for node in ast.children:
+            if node.data == "include":
+                self.includes.add(node.text[1:-1])
+            elif node.data == "import":
+                pass # Imports are resolved before generating, see add_import
+            elif node.data in FUNCTION_TYPES:
+                self.export_function(node)
+                functions.append((node, None))
+            elif node.data == "struct":
+                struct_name = node.children[0].text
+                if struct_name in structs:
+                    raise CompilerBackendException(f"struct {struct_name} is defined twice")
+                structs[struct_name] = node
+                self.context["struct_name"] = struct_name
+                self.export.structs[struct_name] = Struct()
+                for child in node.children[1].children:
+                    if child.data == "struct_property":
+                        check_copyable(self.parse_type(child.children[1]), f"property {child.children[0].text} of {struct_name}")
+                        self.export.structs[struct_name].vars[child.children[0].text] = self.parse_type(child.children[1])
+                    else:
+                        self.export_function(child, method=True)
+                        functions.append((child, struct_name))
+            else:
+                raise CompilerBackendException("the vm backend doesn't support global variables")
+
+        # Structs can hold each other in any order, as long as none ends up holding itself
+        self.order_structs(structs)
+
+        for node, struct_name in functions:
+            name = self.unwrap_function(node)[0].children[0].text
+            with self.profile_item("function" if struct_name == None else "struct", name if struct_name == None else struct_name):
+                self.compile_function(node, struct_name)
+
+        self.unit = {
+            "consts": self.consts,
+            "strings": self.strings,
+            "names": self.names,
+            "fns": self.fns,
+        }
+
+    # Registers
+    # Locals get a register for as long as the block they're defined in runs, temporaries only for a statement
+
+    def temp(self):
+        reg = self.next_reg
+        self.next_reg += 1
+        self.nregs = max(self.nregs, self.next_reg)
+        return reg
+
+    def define(self, name, type, reg=None):
+        if reg == None:
+            reg = self.temp()
+        self.scopes[-1][name] = reg
+        self.locals[name] = type
+        self.locals_top = max(self.locals_top, reg + 1)
+        return reg
+
+    def lookup(self, name):
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        raise CompilerBackendException("variable doesn't exist: " + name)
+
+    # Code
+
+    def emit(self, *words):
+        self.code.extend(words)
+
+    # Jumps are emitted before their target is known, the target is patched in later
+    def emit_jump(self, *words):
+        self.code.extend(words)
+        return len(self.code) - 1
+
+    def patch(self, at, target=None):
+        self.code[at] = len(self.code) if target == None else target
+
+    def const(self, value):
+        key = (type(value), value)
+        try:
+            if key in self.const_index:
+                return self.const_index[key]
+        except TypeError:
+            key = None # Holds a list, zero values of structs and arrays do
+
+        self.consts.append(value)
+        if key != None:
+            self.const_index[key] = len(self.consts) - 1
+        return len(self.consts) - 1
+
+    def string(self, value):
+        k = len(self.consts)
+        self.consts.append(value)
+        self.strings.append(k)
+        return k
+
+    def load_const(self, value, dest=None):
+        if dest == None:
+            dest = self.temp()
+        self.emit(bytecode.LOADK, dest, self.const(value))
+        return dest
+
+    def function_index(self, name):
+        if name not in self.name_index:
+            self.name_index[name] = len(self.names)
+            self.names.append(name)
+        return self.name_index[name]
+
+    # Vectors have no bytecode, every type goes through here before it's used
+    def parse_type(self, ast):
+        type = super().parse_type(ast)
+        if type.name in VECTOR_TYPES:
+            raise CompilerBackendException("the vm backend doesn't support vector types")
+        return type
+
+    def conversion(self, type):
+        # Arithmetic on f64 and pointers needs no conversion
+        if type.type != "builtin" or type.ptr != 0 or type.name == "f64":
+            return 0
+        return bytecode.conversion(type.name)
+
+    def layout(self, type):
+        if type in self.layouts:
+            return self.layouts[type]
+
+        if type.type == "struct":
+            parts = [self.layout(var_type) if is_aggregate(var_type) else None for var_type in self.get_struct(type.name).vars.values()]
+        else:
+            parts = [self.layout(type.elem) if is_aggregate(type.elem) else None] * type.length
+
+        layout = () if all(part == None for part in parts) else tuple(parts)
+        self.layouts[type] = layout
+        return layout
+
+    def zero(self, type):
+        if type.ptr > 0:
+            return None
+        if type.type == "builtin":
+            if type.name in FLOAT_TYPES:
+                return 0.0
+            return False if type.name == "bool" else 0
+        if type.type == "struct":
+            return [self.zero(var_type) for var_type in self.get_struct(type.name).vars.values()]
+        if type.type == "array":
+            return [self.zero(type.elem) for _ in range(type.length)]
+        return ((), 0, 0) # Empty slice
+
+    def new(self, type, dest=None):
+        if dest == None:
+            dest = self.temp()
+        self.emit(bytecode.NEW, dest, self.const((self.zero(type), self.layout(type))))
+        return dest
+
+    def field_index(self, type, name):
+        fields = list(self.get_struct(type.name).vars)
+        if name not in fields:
+            raise CompilerBackendException(f"struct {type.name} has no property {name}")
+        return fields.index(name)
+
+    # Functions
+
+    def compile_function(self, ast, struct_name):
+        ast, annotations = self.unwrap_function(ast)
+        pure_fn_name = ast.children[0].text
+        fn_name = pure_fn_name if struct_name == None else f"__struct_{struct_name}_{pure_fn_name}"
+        func = self.get_fn(pure_fn_name) if struct_name == None else self.get_struct(struct_name).fns[pure_fn_name]
+
+        if "memo" in annotations:
+            if struct_name != None:
+                raise CompilerBackendException(f"can't memoize method {pure_fn_name}, it depends on self")
+            if func.type == None:
+                raise CompilerBackendException(f"can't memoize {fn_name}, it doesn't return anything")
+            for param in func.params:
+                if not (is_scalar(param.type) and (param.type.name in INT_TYPES or param.type.name == "bool")):
+                    raise CompilerBackendException(f"can't memoize {fn_name}, parameter {param.name} of type {param.type} can't be used as a key")
+
+        self.push_locals()
+        self.code = []
+        self.scopes = [{}]
+        self.next_reg = self.nregs = self.locals_top = 0
+
+        self.context["current_function"] = fn_name
+        self.context["current_func"] = func
+        self.context["current_return_type"] = func.type
+        self.context["current_method"] = struct_name != None
+        self.context["struct_name"] = struct_name
+
+        # Arguments are passed in the first registers, self first
+        if struct_name != None:
+            self.define("self", Type("struct", struct_name, 1))
+        for param in func.params:
+            self.define(param.name, param.type)
+
+        self.compile_block(ast.children[-1], scope=False)
+        self.emit(bytecode.RETV)
+
+        self.pop_locals()
+
+        self.fns[fn_name] = {
+            "nregs": self.nregs,
+            "code": array("q", self.code).tobytes(),
+            "memo": "memo" in annotations,
+        }
+
+    def compile_block(self, ast, scope=True):
+        if scope:
+            self.scopes.append({})
+        top = self.locals_top
+
+        for node in ast.children:
+            self.compile_statement(node)
+
+        if scope:
+            self.scopes.pop()
+            # Registers of the block's locals are free again
+            self.locals_top = self.next_reg = top
+
+    def compile_statement(self, ast):
+        if ast.data == "statement":
+            self.compile_expression(ast.children[0])
+
+        elif ast.data == "statement_return":
+            return_type = self.context["current_return_type"]
+            if return_type == None:
+                raise CompilerBackendException(f"{self.context['current_function']} doesn't return anything")
+
+            reg = self.compile_value(ast.children[0], return_type, returning=True)
+            self.emit(bytecode.RET, reg)
+
+        elif ast.data == "statement_if":
+            ends = []
+            for i in range(0, len(ast.children) - 1, 2):
+                next_branch = self.compile_condition(ast.children[i], False)
+                self.compile_block(ast.children[i + 1])
+                ends.append(self.emit_jump(bytecode.JUMP, None))
+                self.patch(next_branch)
+
+            # Expressions and blocks come in pairs, so an odd number of children means there's an else block
+            if len(ast.children) % 2 == 1:
+                self.compile_block(ast.children[-1])
+
+            for end in ends:
+                self.patch(end)
+
+        elif ast.data == "block":
+            # Left behind by the constant folder when only one branch of an if statement can run
+            self.compile_block(ast)
+
+        elif ast.data == "statement_while":
+            check = self.emit_jump(bytecode.JUMP, None)
+            body = len(self.code)
+            self.compile_block(ast.children[1])
+            self.patch(check)
+            self.patch(self.compile_condition(ast.children[0], True), body)
+
+        elif ast.data == "statement_loop":
+            body = len(self.code)
+            self.compile_block(ast.children[0])
+            self.emit(bytecode.JUMP, body)
+
+        elif ast.data in ("statement_for", "statement_parallel_for"):
+            self.scopes.append({})
+            top = self.locals_top
+
+            # Parallel loops are checked like in C, then run one iteration after the other
+            var_type = self.check_parallel_for(ast)[0] if ast.data == "statement_parallel_for" else UPTR
+
+            # for(uintptr_t i=lo;i<hi;i++), hi is read again on every iteration unless it's a number
+            lo, hi = ast.children[1].children
+            start = self.compile_bound(lo, type=var_type)
+            var = self.define(ast.children[0].text, var_type)
+            self.move(start, var)
+            one = self.load_const(1)
+            end = self.compile_bound(hi, type=var_type) if hi.data == "number" else None
+            self.locals_top = self.next_reg
+
+            check = self.emit_jump(bytecode.JUMP, None)
+            body = len(self.code)
+            self.compile_block(ast.children[2])
+            self.emit(bytecode.ADD, var, var, one, bytecode.conversion(var_type.name))
+            self.patch(check)
+            if end == None:
+                end = self.compile_bound(hi, type=var_type)
+            self.emit(bytecode.JLT, var, end, body)
+
+            self.scopes.pop()
+            self.locals_top = self.next_reg = top
+
+        elif ast.data == "statement_for_each":
+            seq_type = self.infer_type(ast.children[1])
+            if not (seq_type.type in ("array", "slice") and seq_type.ptr == 0):
+                raise CompilerBackendException(f"can only loop over arrays and slices, not {seq_type}")
+
+            self.scopes.append({})
+            top = self.locals_top
+
+            # The sequence and its length are read once, elements are copied into the loop variable
+            seq = self.temp()
+            self.move(self.compile_expression(ast.children[1]), seq)
+            index = self.load_const(0)
+            one = self.load_const(1)
+            if seq_type.type == "array":
+                length = self.load_const(seq_type.length)
+            else:
+                length = self.temp()
+                self.emit(bytecode.LEN, length, seq)
+            var = self.define(ast.children[0].text, seq_type.elem)
+            self.locals_top = self.next_reg
+
+            check = self.emit_jump(bytecode.JUMP, None)
+            body = len(self.code)
+            if seq_type.type == "array":
+                self.emit(bytecode.INDEXA, var, seq, index, 0)
+            else:
+                self.emit(bytecode.INDEXS, var, seq, index, 0)
+            if is_aggregate(seq_type.elem):
+                self.emit(bytecode.COPY, var, var, self.const(self.layout(seq_type.elem)))
+            self.compile_block(ast.children[2])
+            self.emit(bytecode.ADD, index, index, one, bytecode.conversion("uptr"))
+            self.patch(check)
+            self.emit(bytecode.JLT, index, length, body)
+
+            self.scopes.pop()
+            self.locals_top = self.next_reg = top
+
+        elif ast.data in ("statement_variable_define_auto", "statement_variable_define", "statement_variable_declare"):
+            var_name = ast.children[0].text
+
+            if ast.data == "statement_variable_define_auto":
+                # Integer literals are i32 by default
+                var_type = self.infer_type(ast.children[1])
+                if var_type == INT:
+                    var_type = Type("builtin", "i32", 0)
+                value = ast.children[1]
+            else:
+                var_type = self.parse_type(ast.children[1])
+                value = ast.children[2] if ast.data == "statement_variable_define" else None
+
+            if value != None:
+                check_copyable(var_type, var_name)
+
+            # Shadowed variables are still in scope while the value is computed
+            reg = self.temp()
+            if value != None:
+                self.compile_value(value, var_type, dest=reg)
+            elif is_aggregate(var_type):
+                self.new(var_type, reg)
+            else:
+                self.load_const(self.zero(var_type), reg)
+            self.define(var_name, var_type, reg)
+
+        elif ast.data == "statement_variable_assign":
+            target_type = self.infer_type(ast.children[0])
+            check_copyable(target_type, "the target of an assignment")
+            self.store(ast.children[0], target_type, ast.children[1])
+
+        else:
+            raise CompilerBackendException("invalid statement type: " + ast.data)
+
+        # Temporaries only live for a statement
+        self.next_reg = self.locals_top
+
+    def move(self, reg, dest):
+        if dest == None:
+            return reg
+        if reg != dest:
+            self.emit(bytecode.MOVE, dest, reg)
+        return dest
+
+    # Jumps when the condition is what's given, returning the jump to patch, or its target operand with target
+    def compile_condition(self, ast, when):
+        if ast.data == "expression_op_bin" and ast.children[1].data in JUMP_IF:
+            type_l = self.infer_type(ast.children[0])
+            type_r = self.infer_type(ast.children[2])
+            if is_scalar(type_l) and is_scalar(type_r):
+                a, b = self.compile_operands(ast)
+                return self.emit_jump(JUMP_IF[ast.children[1].data][0 if when else 1], a, b, None)
+
+        reg = self.compile_expression(ast)
+        return self.emit_jump(bytecode.JUMPT if when else bytecode.JUMPF, reg, None)
+
+    # Values
+
+    # A value of expression ast stored as type, like C converts it on assignment, in dest if given
+    # Structs and arrays read from a variable are copied, unless returning a local, which dies with the function
+    def compile_value(self, ast, type, dest=None, returning=False):
+        if ast.data == "expression_array":
+            return self.compile_array(ast, type, dest)
+
+        literal = self.literal(ast, type)
+        if literal != None:
+            return self.load_const(literal[0], dest)
+
+        reg = self.compile_expression(ast)
+
+        if is_aggregate(type) and self.is_lvalue(ast) and not (returning and ast.data == "expression_value"):
+            copy = self.temp() if dest == None else dest
+            self.emit(bytecode.COPY, copy, reg, self.const(self.layout(type)))
+            return copy
+
+        if is_scalar(type) and self.value_type(ast) != type:
+            conv = self.temp() if dest == None else dest
+            self.emit(bytecode.CONV, conv, reg, self.conversion(type))
+            return conv
+
+        return self.move(reg, dest)
+
+    # The type the value of an expression really has, arithmetic on narrow types is done on ints
+    def value_type(self, ast):
+        type = self.infer_type(ast)
+        if ast.data == "expression_op_bin" and is_scalar(type) and ast.children[1].data in ARITHMETIC_OPS and not self.overload(ast):
+            return promote(type)
+        if type == INT:
+            return Type("builtin", "i32", 0)
+        return type
+
+    # An integer literal converted to type at compile time, as a 1-tuple, or None if ast isn't one
+    def literal(self, ast, type):
+        if not (ast.data == "expression_value" and ast.children[0].data == "number" and is_scalar(type)):
+            return None
+
+        value = int(ast.children[0].text)
+        return (bytecode.convert(value, self.conversion(type) or bytecode.conversion("f64")),)
+
+    def compile_array(self, ast, type, dest=None):
+        if not (type.type == "array" and type.ptr == 0):
+            raise CompilerBackendException(f"array literal can't be used as {type}")
+        if len(ast.children) > type.length:
+            raise CompilerBackendException(f"array literal has {len(ast.children)} elements, more than the {type.length} of {type}")
+
+        # Elements that aren't given are zeroed
+        elems = [self.compile_value(node, type.elem) for node in ast.children]
+        array = self.new(type, dest)
+        for i, elem in enumerate(elems):
+            self.emit(bytecode.SETF, array, i, elem)
+        return array
+
+    # A bound of a range, a number or a variable, as a uptr
+    # Loads a bound of a range, converted to the type of the loop variable
+    def compile_bound(self, ast, dest=None, type=UPTR):
+        if ast.data == "number":
+            return self.load_const(bytecode.convert(int(ast.text), bytecode.conversion(type.name)), dest)
+
+        reg = self.lookup(ast.text)
+        if not is_int_type(self.locals[ast.text]):
+            raise CompilerBackendException("range bounds have to be integers")
+        # Types of the same width and signedness, like u64 and uptr, hold the same values
+        if bytecode.WRAPS[bytecode.conversion(self.locals[ast.text].name)] == bytecode.WRAPS[bytecode.conversion(type.name)]:
+            return self.move(reg, dest)
+
+        if dest == None:
+            dest = self.temp()
+        self.emit(bytecode.CONV, dest, reg, bytecode.conversion(type.name))
+        return dest
+
+    def is_lvalue(self, ast):
+        return ast.data in ("expression_dot", "expression_index", "expression_deref") or (ast.data == "expression_value" and ast.children[0].data == "ident")
+
+    # Expressions, returning the register holding their value
+    # Structs and arrays aren't copied, the register holds the same list as the variable read
+
+    def compile_expression(self, ast, dest=None):
+        if ast.data == "expression_value":
+            kind = ast.children[0].data
+
+            if kind == "ident":
+                name = ast.children[0].text
+                self.infer_type(ast) # Raises if the variable doesn't exist
+                return self.move(self.lookup(name), dest)
+            elif kind == "number":
+                return self.load_const(int(ast.children[0].text), dest)
+            elif kind == "string":
+                text = ast.children[0].text[1:-1].encode("latin-1", "backslashreplace").decode("unicode_escape").encode("utf-8")
+                if dest == None:
+                    dest = self.temp()
+                self.emit(bytecode.LOADK, dest, self.string(text))
+                return dest
+            elif kind in ("true", "false"):
+                return self.load_const(kind == "true", dest)
+            elif kind == "null":
+                return self.load_const(None, dest)
+            else:
+                raise CompilerBackendException("invalid value type: " + kind)
+
+        elif ast.data == "expression_ref":
+            return self.compile_ref(ast.children[0], dest)
+
+        elif ast.data == "expression_deref":
+            type = self.infer_type(ast)
+            pointer = self.compile_expression(ast.children[0])
+
+            # Pointers to structs and arrays are the list itself
+            if is_aggregate(type):
+                return self.move(pointer, dest)
+
+            if dest == None:
+                dest = self.temp()
+            self.emit(bytecode.LOAD, dest, pointer)
+            return dest
+
+        elif ast.data == "expression_function_call":
+            fn_name = ast.children[0].text
+            args = ast.children[1].children
+
+            if fn_name == "this":
+                # Methods recurse on the same struct
+                self_reg = self.lookup("self") if self.context["current_method"] else None
+                return self.compile_call(self.context["current_function"], self.context["current_func"], args, self_reg, dest)
+
+            if fn_name in self.export.fns or fn_name in self.imports.fns:
+                return self.compile_call(fn_name, self.get_fn(fn_name), args, None, dest)
+
+            if vector_function(fn_name) != None:
+                raise CompilerBackendException("the vm backend doesn't support vector types")
+
+            if fn_name in bytecode.BUILTINS:
+                include = bytecode.BUILTINS[fn_name][0]
+                if include not in self.includes:
+                    raise CompilerBackendException(f"{fn_name} is declared in \"{include}\", which isn't included")
+
+                regs = [self.compile_expression(arg) for arg in args]
+                if dest == None:
+                    dest = self.temp()
+                self.emit(bytecode.BUILTIN, dest, bytecode.BUILTIN_NAMES.index(fn_name), len(regs), *regs)
+                return dest
+
+            raise CompilerBackendException(f"function doesn't exist: {fn_name} (the vm backend can only call C functions it has builtins for: {', '.join(bytecode.BUILTINS)})")
+
+        elif ast.data == "expression_method_call":
+            self.infer_type(ast) # Raises if the method doesn't exist
+            type = self.types[id(ast.children[0])]
+            name = ast.children[1].text
+
+            # Values in the vm are garbage collected, so freeing an arena does nothing
+            if type.type == "builtin":
+                return dest if dest != None else self.temp()
+
+            obj = self.compile_expression(ast.children[0])
+            return self.compile_call(f"__struct_{type.name}_{name}", self.get_struct(type.name).fns[name], ast.children[2].children, obj, dest)
+
+        elif ast.data == "expression_new":
+            type = self.parse_type(ast.children[0])
+            self.infer_type(ast) # Type checks the arena, which isn't needed to allocate
+
+            # Structs and arrays are their own pointer, anything else is boxed in a list of one value
+            if is_aggregate(type):
+                return self.new(type, dest)
+            if dest == None:
+                dest = self.temp()
+            self.emit(bytecode.NEW, dest, self.const(([self.zero(type)], ())))
+            self.emit(bytecode.REFF, dest, dest, 0)
+            return dest
+
+        elif ast.data == "expression_op_bin":
+            return self.compile_op_bin(ast, dest)
+
+        elif ast.data == "expression_dot":
+            type = self.infer_type(ast.children[0])
+            name = ast.children[1].text
+            self.infer_type(ast) # Raises if the property doesn't exist
+
+            if dest == None:
+                dest = self.temp()
+
+            if type.type == "array":
+                return self.load_const(type.length, dest)
+
+            obj = self.compile_expression(ast.children[0])
+            if type.type == "slice":
+                if type.ptr == 1:
+                    self.emit(bytecode.LOAD, dest, obj)
+                    obj = dest
+                self.emit(bytecode.LEN, dest, obj)
+                return dest
+
+            if not (type.type == "struct" and type.ptr in (0, 1)):
+                raise CompilerBackendException("can't use dot operator with multiple pointer layers")
+            self.emit(bytecode.GETF, dest, obj, self.field_index(type, name))
+            return dest
+
+        elif ast.data == "expression_index":
+            self.infer_type(ast) # Type checks the container and the index
+            type = self.types[id(ast.children[0])]
+
+            seq = self.compile_expression(ast.children[0])
+            index = self.compile_value(ast.children[1], UPTR)
+            if dest == None:
+                dest = self.temp()
+
+            if type.type == "array":
+                self.emit(bytecode.INDEXA, dest, seq, index, type.length if self.args.bounds_check else 0)
+            else:
+                self.emit(bytecode.INDEXS, dest, seq, index, int(self.args.bounds_check))
+            return dest
+
+        elif ast.data == "expression_slice":
+            self.infer_type(ast)
+            type = self.types[id(ast.children[0])]
+
+            seq = self.compile_expression(ast.children[0])
+            lo, hi = map(self.compile_bound, ast.children[1].children)
+            if dest == None:
+                dest = self.temp()
+
+            if type.type == "array":
+                self.emit(bytecode.SLICEA, dest, seq, lo, hi, type.length if self.args.bounds_check else 0)
+            else:
+                self.emit(bytecode.SLICES, dest, seq, lo, hi, int(self.args.bounds_check))
+            return dest
+
+        elif ast.data == "expression_array":
+            return self.compile_array(ast, self.infer_type(ast), dest)
+
+        else:
+            raise CompilerBackendException("invalid expression type: " + ast.data)
+
+    # Arguments are converted to the types of the parameters, structs and arrays are passed by value
+    def compile_call(self, fn_name, func, args, self_reg, dest):
+        if len(args) != len(func.params):
+            raise CompilerBackendException(f"{fn_name} takes {len(func.params)} arguments, {len(args)} were given")
+
+        regs = [self.compile_value(arg, param.type) for arg, param in zip(args, func.params)]
+        if self_reg != None:
+            regs.insert(0, self_reg)
+
+        if dest == None:
+            dest = self.temp()
+        self.emit(bytecode.CALL, dest, self.function_index(fn_name), len(regs), *regs)
+        return dest
+
+    # The struct method overloading an operator, or None
+    def overload(self, ast):
+        type_l = self.infer_type(ast.children[0])
+        type_r = self.infer_type(ast.children[2])
+        if not (type_l == type_r and type_l.type == "struct" and type_l.ptr == 0):
+            return None
+
+        fns = self.get_struct(type_l.name).fns
+        op = ast.children[1].data
+        if f"__{op}__" in fns:
+            return f"__{op}__"
+        # a + b can be done with __add_eq__ on a copy of a
+        if not op.endswith("_eq") and op not in OP_BIN_COMPARISONS and f"__{op}_eq__" in fns:
+            return f"__{op}_eq__"
+        return None
+
+    def compile_operands(self, ast):
+        # Literals take the type the other side is computed in
+        type_l = self.value_type(ast.children[0])
+        type_r = self.value_type(ast.children[2])
+        if ast.children[0].data == "expression_value" and ast.children[0].children[0].data == "number":
+            type_l = promote(type_r)
+        if ast.children[2].data == "expression_value" and ast.children[2].children[0].data == "number":
+            type_r = promote(type_l)
+
+        a = self.compile_operand(ast.children[0], type_l)
+        b = self.compile_operand(ast.children[2], type_r)
+        return a, b
+
+    def compile_operand(self, ast, type):
+        literal = self.literal(ast, type)
+        if literal != None:
+            return self.load_const(literal[0])
+        return self.compile_expression(ast)
+
+    def compile_op_bin(self, ast, dest=None):
+        type = self.infer_type(ast)
+        type_l = self.types[id(ast.children[0])]
+        op = ast.children[1].data
+
+        overload = self.overload(ast)
+        if overload != None:
+            struct_name = type_l.name
+            obj = self.compile_expression(ast.children[0])
+            rhs = self.compile_expression(ast.children[2])
+
+            if overload.endswith("_eq__") and not op.endswith("_eq"):
+                # Done in place on a copy of the left side
+                copy = self.temp() if dest == None else dest
+                self.emit(bytecode.COPY, copy, obj, self.const(self.layout(type_l)))
+                self.emit(bytecode.CALL, self.temp(), self.function_index(f"__struct_{struct_name}_{overload}"), 2, copy, rhs)
+                return copy
+
+            if dest == None:
+                dest = self.temp()
+            self.emit(bytecode.CALL, dest, self.function_index(f"__struct_{struct_name}_{overload}"), 2, obj, rhs)
+            return dest
+
+        if op.endswith("_eq"):
+            # a += b computes a + b, converts it to the type of a and stores it there
+            reg = self.compile_op(op[:-len("_eq")], ast, type_l)
+            self.store(ast.children[0], type_l, None, reg)
+            return self.move(reg, dest)
+
+        return self.compile_op(op, ast, type, dest)
+
+    def compile_op(self, op, ast, type, dest=None):
+        if op in OP_BIN_COMPARISONS:
+            type_l = self.types[id(ast.children[0])]
+            a, b = self.compile_operands(ast)
+            if dest == None:
+                dest = self.temp()
+
+            if type_l.ptr > 0 and op in ("equal", "not_equal"):
+                self.emit(bytecode.PEQ if op == "equal" else bytecode.PNE, dest, a, b)
+            elif is_scalar(type_l):
+                self.emit(COMPARISON_OPS[op], dest, a, b)
+            else:
+                raise CompilerBackendException(f"can't compare values of type {type_l}")
+            return dest
+
+        if not is_scalar(type):
+            raise CompilerBackendException(f"can't do arithmetic on values of type {type}")
+
+        a, b = self.compile_operands(ast)
+        if dest == None:
+            dest = self.temp()
+        self.emit(ARITHMETIC_OPS[op], dest, a, b, self.conversion(promote(type) if type != INT else Type("builtin", "i32", 0)))
+
+        # Stored back into a narrower type
+        if type != promote(type) and ast.children[1].data.endswith("_eq"):
+            self.emit(bytecode.CONV, dest, dest, self.conversion(type))
+        return dest
+
+    # Pointers
+
+    def compile_ref(self, ast, dest=None):
+        type = self.infer_type(ast)
+
+        # Structs and arrays are already pointed to by the list holding them
+        if is_aggregate(type):
+            return self.compile_expression(ast, dest)
+
+        if dest == None:
+            dest = self.temp()
+
+        if ast.data == "expression_value" and ast.children[0].data == "ident":
+            self.emit(bytecode.REFL, dest, self.lookup(ast.children[0].text))
+        elif ast.data == "expression_dot":
+            obj_type = self.infer_type(ast.children[0])
+            if obj_type.type != "struct":
+                raise CompilerBackendException(f"can't take the address of a property of {obj_type}")
+            obj = self.compile_expression(ast.children[0])
+            self.emit(bytecode.REFF, dest, obj, self.field_index(obj_type, ast.children[1].text))
+        elif ast.data == "expression_index":
+            seq_type = self.infer_type(ast.children[0])
+            seq = self.compile_expression(ast.children[0])
+            index = self.compile_value(ast.children[1], UPTR)
+            self.emit(bytecode.REFA if seq_type.type == "array" else bytecode.REFS, dest, seq, index)
+        elif ast.data == "expression_deref":
+            return self.compile_expression(ast.children[0], dest)
+        else:
+            raise CompilerBackendException("can only take the address of variables, properties, elements and dereferenced pointers")
+
+        return dest
+
+    # Stores the value of expression value (or what's in register reg) into target
+    # Structs and arrays are overwritten in place, so pointers to them stay valid
+    def store(self, target, type, value, reg=None):
+        if is_aggregate(type):
+            if reg == None:
+                reg = self.compile_array(value, type) if value.data == "expression_array" else self.compile_expression(value)
+            dest = self.compile_expression(target)
+            self.emit(bytecode.ASSIGN, dest, reg, self.const(self.layout(type)))
+            return
+
+        if target.data == "expression_value" and target.children[0].data == "ident":
+            var = self.lookup(target.children[0].text)
+            if reg == None:
+                self.compile_value(value, type, dest=var)
+            else:
+                self.move(reg, var)
+            return
+
+        if reg == None:
+            reg = self.compile_value(value, type)
+
+        if target.data == "expression_dot":
+            obj_type = self.infer_type(target.children[0])
+            if obj_type.type != "struct":
+                raise CompilerBackendException(f"can't assign to a property of {obj_type}")
+            obj = self.compile_expression(target.children[0])
+            self.emit(bytecode.SETF, obj, self.field_index(obj_type, target.children[1].text), reg)
+        elif target.data == "expression_index":
+            seq_type = self.infer_type(target.children[0])
+            seq = self.compile_expression(target.children[0])
+            index = self.compile_value(target.children[1], UPTR)
+            if seq_type.type == "array":
+                self.emit(bytecode.SETA, seq, index, reg, seq_type.length if self.args.bounds_check else 0)
+            else:
+                self.emit(bytecode.SETS, seq, index, reg, int(self.args.bounds_check))
+        elif target.data == "expression_deref":
+            pointer = self.compile_expression(target.children[0])
+            self.emit(bytecode.STORE, pointer, reg)
+        else:
+            raise CompilerBackendException("can only assign to variables, properties, elements and dereferenced pointers")
+
+    # Output
+    # Programs are a line running vm.py followed by the marshalled units, so they can be run directly
+
+    def write_program(self, units, output):
+        with open(output, "wb") as f:
+            f.write(f"#!{sys.executable} {VM_PATH}\n".encode("utf-8"))
+            f.write(bytecode.dump_program(units))
+        os.chmod(output, os.stat(output).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    def write_output(self):
+        self.write_program([self.unit], self.output)
+
+    def write_object(self, output):
+        with open(output, "wb") as f:
+            f.write(bytecode.dump_unit(self.unit))
+
+    def link(self, objects):
+        units = []
+        for object_file in objects:
+            with open(object_file, "rb") as f:
+                units.append(bytecode.load_unit(f.read()))
+        self.write_program(units, self.output)
+
+    def cache_key(self):
+        return (bytecode.VERSION, sys.executable, VM_PATH, self.args.bounds_check)
+
+    def outputs(self):
+        return [self.output]
@@ -0,0 +1,493 @@
+import re, sys, math, struct, marshal
+from array import array
+
+# Bytecode of the vm backend, and the interpreter running it
+#
+# Every function is compiled to a flat array of 64-bit words for a register machine: an opcode,
+# followed by its operands. Registers hold the parameters first, then the locals and temporaries,
+# and are numbered per function. A compiled module is a unit: its functions, a pool of constants
+# shared by them, and the names of the functions they call, resolved when the program is loaded
+#
+# Values are plain Python objects:
+#   integers and bools are ints and bools, wrapped to the width of their type after every operation
+#   floats are floats, f32 results are rounded to single precision
+#   structs and arrays are lists, so a pointer to one is the list itself
+#   slices are (list, offset, length) tuples
+#   pointers to anything else are (container, index) tuples, the container being a list of
+#   registers, a struct, an array or the bytes of a string
+#   null is None
+
+VERSION = 1
+
+# Opcodes, in the order the interpreter checks them, so the most common come first
+# d is the destination register, other single letter operands are registers unless said otherwise
+(
+    MOVE,   # d s
+    LOADK,  # d k: constant k
+    ADD,    # d a b w: w is the conversion the result gets, see CONVERSION_TYPES
+    SUB,    # d a b w
+    MUL,    # d a b w
+    JLT,    # a b t: jumps to t if a < b
+    JNLT,   # a b t: jumps to t unless a < b
+    JGT,    # a b t
+    JNGT,   # a b t
+    JEQ,    # a b t
+    JNE,    # a b t
+    JUMP,   # t
+    JUMPT,  # a t: jumps to t if a is true
+    JUMPF,  # a t
+    GETF,   # d o i: field or element i (a number) of struct or array o
+    SETF,   # o i s
+    CALL,   # d f n args...: calls function f of the unit with n arguments
+    RET,    # s
+    RETV,   # returns nothing
+    DIV,    # d a b w: integer division truncates, like C
+    EQ,     # d a b
+    NE,     # d a b
+    LT,     # d a b
+    GT,     # d a b
+    CONV,   # d s w
+    INDEXA, # d a i n: element i of array a, n is its length if bounds are checked, or 0
+    SETA,   # a i s n
+    INDEXS, # d s i c: element i of slice s, bounds are checked if c
+    SETS,   # s i v c
+    LOAD,   # d p: value p points to
+    STORE,  # p s
+    COPY,   # d s k: copy of struct or array s, with layout k
+    ASSIGN, # d s k: overwrites struct or array d with s, keeping pointers into d valid
+    NEW,    # d k: zeroed struct or array, k is (zero value, layout)
+    REFL,   # d r: pointer to register r
+    REFF,   # d o i: pointer to field or element i (a number) of o
+    REFA,   # d a i: pointer to element i of array a
+    REFS,   # d s i: pointer to element i of slice s
+    SLICEA, # d a lo hi n: slice of array a, n is its length if bounds are checked, or 0
+    SLICES, # d s lo hi c
+    LEN,    # d s: length of slice s
+    PEQ,    # d a b: pointers compared by what they point to
+    PNE,    # d a b
+    BUILTIN, # d f n args...: calls builtin function f, an index in BUILTIN_NAMES
+) = range(44)
+
+# Sizes of the instructions, opcode included, for the disassembler
+# Calls are 4 words plus one per argument
+SIZES = {
+    MOVE: 3, LOADK: 3, ADD: 5, SUB: 5, MUL: 5, DIV: 5,
+    JLT: 4, JNLT: 4, JGT: 4, JNGT: 4, JEQ: 4, JNE: 4, JUMP: 2, JUMPT: 3, JUMPF: 3,
+    GETF: 4, SETF: 4, RET: 2, RETV: 1, EQ: 4, NE: 4, LT: 4, GT: 4, CONV: 4,
+    INDEXA: 5, SETA: 5, INDEXS: 5, SETS: 5, LOAD: 3, STORE: 3, COPY: 4, ASSIGN: 4, NEW: 3,
+    REFL: 3, REFF: 4, REFA: 4, REFS: 4, SLICEA: 6, SLICES: 6, LEN: 3, PEQ: 4, PNE: 4,
+}
+
+NAMES = ["MOVE", "LOADK", "ADD", "SUB", "MUL", "JLT", "JNLT", "JGT", "JNGT", "JEQ", "JNE", "JUMP", "JUMPT", "JUMPF",
+    "GETF", "SETF", "CALL", "RET", "RETV", "DIV", "EQ", "NE", "LT", "GT", "CONV", "INDEXA", "SETA", "INDEXS", "SETS",
+    "LOAD", "STORE", "COPY", "ASSIGN", "NEW", "REFL", "REFF", "REFA", "REFS", "SLICEA", "SLICES", "LEN", "PEQ", "PNE", "BUILTIN"]
+
+# Types values are converted to, by index, 0 meaning no conversion
+# int is what C does arithmetic on narrower types in
+CONVERSION_TYPES = [None, "u8", "u16", "u32", "u64", "uptr", "i8", "i16", "i32", "i64", "iptr", "int", "bool", "f32", "f64"]
+F32 = CONVERSION_TYPES.index("f32")
+
+# (mask, half) of the integer types, a value v is wrapped with ((v + half) & mask) - half
+WIDTHS = {"u8": 8, "u16": 16, "u32": 32, "u64": 64, "uptr": 64, "i8": 8, "i16": 16, "i32": 32, "i64": 64, "iptr": 64, "int": 32}
+WRAPS = [None] + [((1 << WIDTHS[name]) - 1, 1 << (WIDTHS[name] - 1) if name[0] != "u" else 0) for name in CONVERSION_TYPES[1:12]]
+
+# Raised by the running program, the vm stops like a C program would trap
+class Trap(Exception):
+    pass
+
+def conversion(name):
+    return CONVERSION_TYPES.index(name)
+
+def wrap(value, w):
+    mask, half = WRAPS[w]
+    return ((value + half) & mask) - half
+
+def round_f32(value):
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+def convert(value, w):
+    name = CONVERSION_TYPES[w]
+
+    if name == "bool":
+        return value != 0
+    if name == "f32":
+        return round_f32(float(value))
+    if name == "f64":
+        return float(value)
+
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            raise Trap(f"can't convert {value} to {name}")
+        value = int(value) # Truncates toward zero, like C
+    return wrap(int(value), w)
+
+def divide(a, b, w):
+    if w == 0 or w == F32:
+        if b == 0:
+            # Floats divide by zero like C does, to an infinity or nan
+            result = math.nan if a == 0 or a != a else math.copysign(math.inf, a) * math.copysign(1.0, b)
+        else:
+            result = a / b
+        return round_f32(result) if w == F32 else result
+
+    if b == 0:
+        raise Trap("division by zero")
+    # C rounds toward zero, Python toward negative infinity
+    quotient = abs(a) // abs(b)
+    return wrap(quotient if (a < 0) == (b < 0) else -quotient, w)
+
+# Layouts describe which parts of a struct or array are structs or arrays themselves, so they're
+# copied deeply: () if none are, otherwise a tuple with a layout for each of those and None for the rest
+def copy(value, layout):
+    if layout == ():
+        return value[:]
+    return [v if l == None else copy(v, l) for v, l in zip(value, layout)]
+
+def assign(dest, value, layout):
+    if layout == ():
+        dest[:] = value
+        return
+    for i, l in enumerate(layout):
+        if l == None:
+            dest[i] = value[i]
+        else:
+            assign(dest[i], value[i], l)
+
+def same_pointer(a, b):
+    if type(a) is tuple and type(b) is tuple:
+        return a[0] is b[0] and a[1] == b[1]
+    return a is b
+
+# Builtin functions, with the include that declares them
+def c_string(pointer):
+    data, start = pointer
+    end = data.index(0, start)
+    return bytes(data[start:end]).decode("utf-8", "replace")
+
+FORMAT = re.compile(r"%([-+ #0]*)(\d+|\*)?(?:\.(\d+|\*))?(hh|h|ll|l|z|j|t|L)?([diouxXeEfFgGcsp%])")
+
+def printf(fmt, *args):
+    args = iter(args)
+
+    def replace(match):
+        flags, width, precision, length, conversion = match.groups()
+        if conversion == "%":
+            return "%"
+        if width == "*":
+            width = str(next(args))
+        if precision == "*":
+            precision = str(next(args))
+
+        value = next(args)
+        if conversion == "s":
+            value = c_string(value)
+        elif conversion == "c":
+            value = chr(value & 0xff)
+        elif conversion == "p":
+            value, conversion, flags = id(value), "x", flags + "#"
+        elif conversion in "uoxX":
+            # Negative values are printed as the unsigned value with the same bits
+            if value < 0:
+                value &= (1 << 64) - 1 if length in ("l", "ll", "z", "j", "t") else (1 << 32) - 1
+            if conversion == "u":
+                conversion = "d"
+
+        spec = "%" + flags + (width or "") + ("." + precision if precision != None else "") + conversion
+        return spec % value
+
+    text = FORMAT.sub(replace, c_string(fmt))
+    sys.stdout.write(text)
+    return len(text.encode("utf-8"))
+
+def puts(s):
+    sys.stdout.write(c_string(s) + "\n")
+    return 1
+
+def putchar(c):
+    sys.stdout.write(chr(c & 0xff))
+    return c
+
+BUILTINS = {
+    "printf": ("stdio", printf),
+    "puts": ("stdio", puts),
+    "putchar": ("stdio", putchar),
+}
+BUILTIN_NAMES = list(BUILTINS)
+BUILTIN_FUNCTIONS = [BUILTINS[name][1] for name in BUILTIN_NAMES]
+
+class Function:
+    __slots__ = ("name", "nregs", "code", "consts", "fns", "memo")
+
+    def __init__(self, name, nregs, code, consts, memo):
+        self.name = name
+        self.nregs = nregs
+        self.code = code
+        self.consts = consts
+        self.fns = None # Functions the unit calls, by index
+        self.memo = {} if memo else None # Arguments -> result, for @memo functions
+
+# Serialized units and programs are marshalled, which loads a lot faster than pickle
+def dump_unit(unit):
+    return marshal.dumps(unit)
+
+def load_unit(data):
+    return marshal.loads(data)
+
+# A program is a list of units, linked together when it's loaded
+def dump_program(units):
+    return marshal.dumps({"version": VERSION, "units": units})
+
+def load_program(data):
+    program = marshal.loads(data)
+    if program["version"] != VERSION:
+        raise Trap(f"bytecode version {program['version']} isn't supported, compile the program again")
+
+    functions = {}
+    linked = []
+    for unit in program["units"]:
+        consts = list(unit["consts"])
+        # Strings are pointers to their first byte, NUL terminated like in C
+        for k in unit["strings"]:
+            consts[k] = (bytearray(consts[k] + b"\0"), 0)
+
+        fns = []
+        for name, fn in unit["fns"].items():
+            functions[name] = Function(name, fn["nregs"], array("q", fn["code"]), consts, fn["memo"])
+            fns.append(functions[name])
+        linked.append((unit["names"], fns))
+
+    for names, fns in linked:
+        try:
+            resolved = [functions[name] for name in names]
+        except KeyError as e:
+            raise Trap(f"undefined function: {e.args[0]}")
+        for fn in fns:
+            fn.fns = resolved
+
+    return functions
+
+def disassemble(fn):
+    lines = []
+    code = fn.code
+    pc = 0
+    while pc < len(code):
+        op = code[pc]
+        size = 4 + code[pc + 3] if op in (CALL, BUILTIN) else SIZES[op]
+        operands = list(code[pc + 1:pc + size])
+        if op == CALL:
+            operands[1] = fn.fns[operands[1]].name if fn.fns != None else operands[1]
+        elif op == BUILTIN:
+            operands[1] = BUILTIN_NAMES[operands[1]]
+        lines.append(f"{pc:6} {NAMES[op]:8} {' '.join(map(str, operands))}")
+        pc += size
+    return "\n".join(lines)
+
+# Runs fn with args until it returns, returning what it returned
+# Calls don't recurse into Python, frames are kept on a stack of their own, so deep recursion only costs memory
+def execute(fn, args=()):
+    stack = []
+    regs = list(args) + [None] * (fn.nregs - len(args))
+    code = fn.code
+    consts = fn.consts
+    pc = 0
+
+    try:
+        while True:
+            op = code[pc]
+
+            if op == MOVE:
+                regs[code[pc + 1]] = regs[code[pc + 2]]
+                pc += 3
+            elif op == LOADK:
+                regs[code[pc + 1]] = consts[code[pc + 2]]
+                pc += 3
+            elif op == ADD:
+                v = regs[code[pc + 2]] + regs[code[pc + 3]]
+                w = code[pc + 4]
+                if w:
+                    if w < F32:
+                        mask, half = WRAPS[w]
+                        v = ((v + half) & mask) - half
+                    else:
+                        v = round_f32(v)
+                regs[code[pc + 1]] = v
+                pc += 5
+            elif op == SUB:
+                v = regs[code[pc + 2]] - regs[code[pc + 3]]
+                w = code[pc + 4]
+                if w:
+                    if w < F32:
+                        mask, half = WRAPS[w]
+                        v = ((v + half) & mask) - half
+                    else:
+                        v = round_f32(v)
+                regs[code[pc + 1]] = v
+                pc += 5
+            elif op == MUL:
+                v = regs[code[pc + 2]] * regs[code[pc + 3]]
+                w = code[pc + 4]
+                if w:
+                    if w < F32:
+                        mask, half = WRAPS[w]
+                        v = ((v + half) & mask) - half
+                    else:
+                        v = round_f32(v)
+                regs[code[pc + 1]] = v
+                pc += 5
+            elif op == JLT:
+                pc = code[pc + 3] if regs[code[pc + 1]] < regs[code[pc + 2]] else pc + 4
+            elif op == JNLT:
+                pc = pc + 4 if regs[code[pc + 1]] < regs[code[pc + 2]] else code[pc + 3]
+            elif op == JGT:
+                pc = code[pc + 3] if regs[code[pc + 1]] > regs[code[pc + 2]] else pc + 4
+            elif op == JNGT:
+                pc = pc + 4 if regs[code[pc + 1]] > regs[code[pc + 2]] else code[pc + 3]
+            elif op == JEQ:
+                pc = code[pc + 3] if regs[code[pc + 1]] == regs[code[pc + 2]] else pc + 4
+            elif op == JNE:
+                pc = code[pc + 3] if regs[code[pc + 1]] != regs[code[pc + 2]] else pc + 4
+            elif op == JUMP:
+                pc = code[pc + 1]
+            elif op == JUMPT:
+                pc = code[pc + 2] if regs[code[pc + 1]] else pc + 3
+            elif op == JUMPF:
+                pc = pc + 3 if regs[code[pc + 1]] else code[pc + 2]
+            elif op == GETF:
+                regs[code[pc + 1]] = regs[code[pc + 2]][code[pc + 3]]
+                pc += 4
+            elif op == SETF:
+                regs[code[pc + 1]][code[pc + 2]] = regs[code[pc + 3]]
+                pc += 4
+            elif op == CALL:
+                callee = fn.fns[code[pc + 2]]
+                end = pc + 4 + code[pc + 3]
+                args = [regs[r] for r in code[pc + 4:end]]
+
+                key = None
+                if callee.memo != None:
+                    key = tuple(args)
+                    if key in callee.memo:
+                        regs[code[pc + 1]] = callee.memo[key]
+                        pc = end
+                        continue
+
+                stack.append((fn, regs, end, code[pc + 1], key))
+                args.extend([None] * (callee.nregs - len(args)))
+                fn, regs, code, consts, pc = callee, args, callee.code, callee.consts, 0
+            elif op == RET or op == RETV:
+                value = regs[code[pc + 1]] if op == RET else None
+                if not stack:
+                    return value
+
+                callee = fn
+                fn, regs, pc, dest, key = stack.pop()
+                if key != None:
+                    callee.memo[key] = value
+                regs[dest] = value
+                code, consts = fn.code, fn.consts
+            elif op == DIV:
+                regs[code[pc + 1]] = divide(regs[code[pc + 2]], regs[code[pc + 3]], code[pc + 4])
+                pc += 5
+            elif op == EQ:
+                regs[code[pc + 1]] = regs[code[pc + 2]] == regs[code[pc + 3]]
+                pc += 4
+            elif op == NE:
+                regs[code[pc + 1]] = regs[code[pc + 2]] != regs[code[pc + 3]]
+                pc += 4
+            elif op == LT:
+                regs[code[pc + 1]] = regs[code[pc + 2]] < regs[code[pc + 3]]
+                pc += 4
+            elif op == GT:
+                regs[code[pc + 1]] = regs[code[pc + 2]] > regs[code[pc + 3]]
+                pc += 4
+            elif op == CONV:
+                regs[code[pc + 1]] = convert(regs[code[pc + 2]], code[pc + 3])
+                pc += 4
+            elif op == INDEXA:
+                i, n = regs[code[pc + 3]], code[pc + 4]
+                if n and not 0 <= i < n:
+                    raise Trap("index out of bounds")
+                regs[code[pc + 1]] = regs[code[pc + 2]][i]
+                pc += 5
+            elif op == SETA:
+                i, n = regs[code[pc + 2]], code[pc + 4]
+                if n and not 0 <= i < n:
+                    raise Trap("index out of bounds")
+                regs[code[pc + 1]][i] = regs[code[pc + 3]]
+                pc += 5
+            elif op == INDEXS:
+                data, offset, length = regs[code[pc + 2]]
+                i = regs[code[pc + 3]]
+                if code[pc + 4] and not 0 <= i < length:
+                    raise Trap("index out of bounds")
+                regs[code[pc + 1]] = data[offset + i]
+                pc += 5
+            elif op == SETS:
+                data, offset, length = regs[code[pc + 1]]
+                i = regs[code[pc + 2]]
+                if code[pc + 4] and not 0 <= i < length:
+                    raise Trap("index out of bounds")
+                data[offset + i] = regs[code[pc + 3]]
+                pc += 5
+            elif op == LOAD:
+                container, i = regs[code[pc + 2]]
+                regs[code[pc + 1]] = container[i]
+                pc += 3
+            elif op == STORE:
+                container, i = regs[code[pc + 1]]
+                container[i] = regs[code[pc + 2]]
+                pc += 3
+            elif op == COPY:
+                regs[code[pc + 1]] = copy(regs[code[pc + 2]], consts[code[pc + 3]])
+                pc += 4
+            elif op == ASSIGN:
+                assign(regs[code[pc + 1]], regs[code[pc + 2]], consts[code[pc + 3]])
+                pc += 4
+            elif op == NEW:
+                value, layout = consts[code[pc + 2]]
+                regs[code[pc + 1]] = copy(value, layout)
+                pc += 3
+            elif op == REFL:
+                regs[code[pc + 1]] = (regs, code[pc + 2])
+                pc += 3
+            elif op == REFF:
+                regs[code[pc + 1]] = (regs[code[pc + 2]], code[pc + 3])
+                pc += 4
+            elif op == REFA:
+                regs[code[pc + 1]] = (regs[code[pc + 2]], regs[code[pc + 3]])
+                pc += 4
+            elif op == REFS:
+                data, offset, length = regs[code[pc + 2]]
+                regs[code[pc + 1]] = (data, offset + regs[code[pc + 3]])
+                pc += 4
+            elif op == SLICEA:
+                lo, hi, n = regs[code[pc + 3]], regs[code[pc + 4]], code[pc + 5]
+                if n and not 0 <= lo <= hi <= n:
+                    raise Trap("slice out of bounds")
+                regs[code[pc + 1]] = (regs[code[pc + 2]], lo, hi - lo)
+                pc += 6
+            elif op == SLICES:
+                data, offset, length = regs[code[pc + 2]]
+                lo, hi = regs[code[pc + 3]], regs[code[pc + 4]]
+                if code[pc + 5] and not 0 <= lo <= hi <= length:
+                    raise Trap("slice out of bounds")
+                regs[code[pc + 1]] = (data, offset + lo, hi - lo)
+                pc += 6
+            elif op == LEN:
+                regs[code[pc + 1]] = regs[code[pc + 2]][2]
+                pc += 3
+            elif op == PEQ:
+                regs[code[pc + 1]] = same_pointer(regs[code[pc + 2]], regs[code[pc + 3]])
+                pc += 4
+            elif op == PNE:
+                regs[code[pc + 1]] = not same_pointer(regs[code[pc + 2]], regs[code[pc + 3]])
+                pc += 4
+            elif op == BUILTIN:
+                end = pc + 4 + code[pc + 3]
+                regs[code[pc + 1]] = BUILTIN_FUNCTIONS[code[pc + 2]](*[regs[r] for r in code[pc + 4:end]])
+                pc = end
+            else:
+                raise Trap(f"invalid opcode {op}")
+    except (IndexError, TypeError, ValueError) as e:
+        # Out of bounds accesses and null pointers, which would be undefined behaviour in C
+        raise Trap(f"invalid memory access in {fn.name}: {e}")
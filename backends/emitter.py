@@ -0,0 +1,32 @@
+class Emitter:
+    # Generated code is kept as a list of fragments per section, in output order
+    # Nothing is joined until the code gets written out, so emitting is always O(1)
+    def __init__(self, sections):
+        self.sections = {name: [] for name in sections}
+        # Fragments emitted with a key are only emitted once per section, ex. the declaration of a type
+        # Their keys are remembered by position too, so merging another emitter still skips duplicates
+        self.keys = set() # (section, key)
+        self.keyed = {} # (section, position) -> key
+
+    def emit(self, section, fragment, key=None):
+        if key != None:
+            if (section, key) in self.keys:
+                return
+            self.keys.add((section, key))
+            self.keyed[section, len(self.sections[section])] = key
+        self.sections[section].append(fragment)
+
+    # Appends everything another emitter emitted, section by section
+    def merge(self, other):
+        for section, fragments in other.sections.items():
+            for i, fragment in enumerate(fragments):
+                self.emit(section, fragment, other.keyed.get((section, i)))
+
+    # Writes every section, or only the ones given
+    def write(self, f, sections=None):
+        for name, fragments in self.sections.items():
+            if sections == None or name in sections:
+                f.writelines(fragments)
+
+    def getvalue(self):
+        return "".join("".join(fragments) for fragments in self.sections.values())
@@ -0,0 +1,407 @@
+from .exceptions import CompilerBackendException
+from .types import Type
+
+# Functions are lowered to basic blocks of three-address instructions, which the passes in passes.py optimize
+# Only scalar code is lowered, functions using pointers, structs, arrays or methods stay syntax trees
+
+# Raised when a function uses something the lowering doesn't handle
+class NotLowerable(Exception):
+    pass
+
+# Type of int literals, and of C arithmetic on anything narrower than int
+INT = Type("builtin", "int", 0)
+BOOL = Type("builtin", "bool", 0)
+
+# Types C converts to int before doing arithmetic on them
+PROMOTED_TYPES = ("u8", "u16", "i8", "i16", "bool")
+COMPARISONS = ("equal", "not_equal", "less_than", "greater_than")
+SCALAR_TYPES = ("u8", "u16", "u32", "u64", "uptr", "i8", "i16", "i32", "i64", "iptr", "f32", "f64", "bool")
+
+def is_scalar(type):
+    return type != None and type.type == "builtin" and type.ptr == 0 and type.name in SCALAR_TYPES + ("int",)
+
+# Type C computes an arithmetic result in
+def promote(type):
+    return INT if type.name in PROMOTED_TYPES else type
+
+class Var:
+    # There's one per variable, so they're compared and hashed by identity
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+class Const:
+    # value is the literal as written in the source
+    __slots__ = ("value", "type")
+
+    def __init__(self, value, type):
+        self.value = value
+        self.type = type
+
+    def __eq__(self, other):
+        return isinstance(other, Const) and self.value == other.value and self.type is other.type
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __str__(self):
+        return self.value
+
+class Instr:
+    # op is one of:
+    #   copy: dest = args[0]
+    #   an operator in OP_BIN_MAP: dest = args[0] op args[1]
+    #   call: dest = fn(args), dest is None if the result isn't used
+    # and for the instruction ending a block:
+    #   jump: goes to targets[0]
+    #   branch: goes to targets[0] if args[0], otherwise to targets[1]
+    #   return: returns args[0]
+    __slots__ = ("op", "dest", "args", "fn", "targets")
+
+    def __init__(self, op, dest, args, fn=None, targets=()):
+        self.op = op
+        self.dest = dest
+        self.args = args
+        self.fn = fn
+        self.targets = targets
+
+
+class Block:
+    __slots__ = ("instrs", "terminator")
+
+    def __init__(self):
+        self.instrs = []
+        # None when the block runs off the end of the function
+        self.terminator = None
+
+    def successors(self):
+        return self.terminator.targets if self.terminator != None else ()
+
+class Loop:
+    # The preheader runs once right before the loop, invariant code is moved there
+    __slots__ = ("preheader", "header", "blocks")
+
+    def __init__(self, preheader, header, blocks):
+        self.preheader = preheader
+        self.header = header
+        self.blocks = blocks
+
+class Function:
+    def __init__(self, name, return_type, params):
+        self.name = name
+        self.return_type = return_type
+        self.params = params # Names of the parameters
+        self.vars = {} # Name -> Type of every parameter, local variable and temporary
+        self.temps = set() # Names of the temporaries, which are only ever assigned once
+        self.blocks = [] # In the order they're laid out, the first one is the entry
+        self.loops = [] # Inner loops come before the loops around them
+
+    def __str__(self):
+        labels = {id(block): f"L{i}" for i, block in enumerate(self.blocks)}
+        lines = [f"fn {self.name}({', '.join(self.params)})"]
+
+        for block in self.blocks:
+            lines.append(labels[id(block)] + ":")
+            for instr in block.instrs + ([block.terminator] if block.terminator != None else []):
+                dest = f"{instr.dest} = " if instr.dest != None else ""
+                fn = f" {instr.fn}" if instr.fn != None else ""
+                operands = [str(arg) for arg in instr.args] + [labels[id(target)] for target in instr.targets]
+                lines.append(f"    {dest}{instr.op}{fn} {', '.join(operands)}".rstrip())
+
+        return "\n".join(lines)
+
+class Lowerer:
+    # Type checking and inference are left to the backend, whose locals are kept up to date while lowering
+    def __init__(self, backend):
+        self.backend = backend
+
+    def lower(self, ast, name, func):
+        if func.type != None and not is_scalar(func.type):
+            raise NotLowerable()
+
+        self.fn = Function(name, func.type, [param.name for param in func.params])
+        self.scopes = [{}] # Source name -> Var, for every nested block
+        self.added = set() # Ids of the blocks in fn.blocks
+        self.block = self.new_block()
+
+        for param in func.params:
+            if not is_scalar(param.type):
+                raise NotLowerable()
+            self.fn.vars[param.name] = param.type
+            self.scopes[-1][param.name] = Var(param.name)
+
+        self.lower_block(ast.children[-1])
+        self.remove_unreachable()
+
+        return self.fn
+
+    def new_block(self, add=True):
+        block = Block()
+        if add:
+            self.added.add(id(block))
+            self.fn.blocks.append(block)
+        return block
+
+    def emit(self, op, dest, args, fn=None):
+        if self.block == None:
+            # Code after a return can't run, it goes in a block nothing jumps to
+            self.block = self.new_block()
+        self.block.instrs.append(Instr(op, dest, args, fn))
+
+    def terminate(self, op, args, targets=()):
+        if self.block == None:
+            self.block = self.new_block()
+        self.block.terminator = Instr(op, None, args, targets=targets)
+        self.block = None
+
+    # Ends the current block with a jump to the next one, which becomes current
+    def jump_to(self, block):
+        if self.block != None:
+            self.terminate("jump", [], (block,))
+        if id(block) not in self.added:
+            self.added.add(id(block))
+            self.fn.blocks.append(block)
+        self.block = block
+
+    def new_temp(self, type):
+        name = f"__t{len(self.fn.temps)}"
+        self.fn.vars[name] = type
+        self.fn.temps.add(name)
+        return Var(name)
+
+    # Every definition gets its own variable, so variables declared in different blocks never clash
+    def define(self, name, type):
+        if not is_scalar(type):
+            raise NotLowerable()
+
+        unique = name
+        i = 1
+        while unique in self.fn.vars:
+            unique = f"{name}__{i}"
+            i += 1
+
+        self.fn.vars[unique] = type
+        self.scopes[-1][name] = Var(unique)
+        self.backend.locals[name] = type
+        return self.scopes[-1][name]
+
+    def lookup(self, name):
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        raise NotLowerable()
+
+    def lower_block(self, ast):
+        self.scopes.append({})
+        for node in ast.children:
+            self.lower_statement(node)
+        self.scopes.pop()
+
+    def lower_loop(self, lower_header, lower_body):
+        # preheader -> header -> body -> header ... -> exit
+        preheader = self.new_block(add=False)
+        self.jump_to(preheader)
+        header = self.new_block(add=False)
+        self.jump_to(header)
+        exit = self.new_block(add=False)
+        start = self.fn.blocks.index(header)
+
+        lower_header(exit)
+        lower_body()
+        self.jump_to(header)
+        self.block = None
+
+        self.fn.loops.append(Loop(preheader, header, self.fn.blocks[start:]))
+        self.jump_to(exit)
+
+    def lower_statement(self, ast):
+        if ast.data == "statement":
+            self.lower_expression(ast.children[0], value=False)
+
+        elif ast.data == "statement_return":
+            self.terminate("return", [self.lower_expression(ast.children[0])])
+
+        elif ast.data == "statement_if":
+            end = self.new_block(add=False)
+
+            # Pairs of condition and block, with an optional else block at the end
+            for i in range(0, len(ast.children) - 1, 2):
+                condition = self.lower_expression(ast.children[i])
+                then, otherwise = self.new_block(add=False), self.new_block(add=False)
+                self.terminate("branch", [condition], (then, otherwise))
+
+                self.jump_to(then)
+                self.lower_block(ast.children[i + 1])
+                if self.block != None:
+                    self.terminate("jump", [], (end,))
+                self.jump_to(otherwise)
+
+            if len(ast.children) % 2 == 1:
+                self.lower_block(ast.children[-1])
+            self.jump_to(end)
+
+        elif ast.data == "block":
+            self.lower_block(ast)
+
+        elif ast.data == "statement_while":
+            def header(exit):
+                condition = self.lower_expression(ast.children[0])
+                body = self.new_block(add=False)
+                self.terminate("branch", [condition], (body, exit))
+                self.jump_to(body)
+
+            self.lower_loop(header, lambda: self.lower_block(ast.children[1]))
+
+        elif ast.data == "statement_loop":
+            self.lower_loop(lambda exit: None, lambda: self.lower_block(ast.children[0]))
+
+        elif ast.data == "statement_for":
+            self.scopes.append({})
+
+            start, end = (self.lower_range_bound(bound) for bound in ast.children[1].children)
+            var = self.define(ast.children[0].text, Type("builtin", "uptr", 0))
+            self.emit("copy", var, [start])
+
+            def header(exit):
+                condition = self.new_temp(INT)
+                self.emit("less_than", condition, [var, end])
+                body = self.new_block(add=False)
+                self.terminate("branch", [condition], (body, exit))
+                self.jump_to(body)
+
+            def body():
+                self.lower_block(ast.children[2])
+                incremented = self.new_temp(self.fn.vars[var.name])
+                self.emit("add", incremented, [var, Const("1", INT)])
+                self.emit("copy", var, [incremented])
+
+            self.lower_loop(header, body)
+            self.scopes.pop()
+
+        elif ast.data == "statement_variable_define_auto":
+            value = self.lower_expression(ast.children[1])
+            type = self.backend.infer_type(ast.children[1])
+            if type == INT:
+                type = Type("builtin", "i32", 0)
+            self.emit("copy", self.define(ast.children[0].text, type), [value])
+
+        elif ast.data == "statement_variable_define":
+            type = self.backend.parse_type(ast.children[1])
+            value = self.lower_expression(ast.children[2])
+            self.emit("copy", self.define(ast.children[0].text, type), [value])
+
+        elif ast.data == "statement_variable_declare":
+            self.define(ast.children[0].text, self.backend.parse_type(ast.children[1]))
+
+        elif ast.data == "statement_variable_assign":
+            var = self.lower_assignee(ast.children[0])
+            self.emit("copy", var, [self.lower_expression(ast.children[1])])
+
+        else:
+            raise NotLowerable()
+
+    def lower_range_bound(self, ast):
+        if ast.data == "number":
+            return Const(ast.text, INT)
+        elif ast.data == "ident":
+            return self.lookup(ast.text)
+        raise NotLowerable()
+
+    # Only plain variables can be assigned to, everything else lives in memory
+    def lower_assignee(self, ast):
+        if ast.data == "expression_value" and ast.children[0].data == "ident":
+            return self.lookup(ast.children[0].text)
+        raise NotLowerable()
+
+    # Returns the operand holding the value of the expression
+    # If value is False the result isn't used, which only matters for calls
+    def lower_expression(self, ast, value=True):
+        if ast.data == "expression_value":
+            kind = ast.children[0].data
+
+            if kind == "ident":
+                return self.lookup(ast.children[0].text)
+            elif kind == "number":
+                return Const(ast.children[0].text, INT)
+            elif kind in ("true", "false"):
+                return Const(kind, BOOL)
+            elif kind == "string":
+                return Const(ast.children[0].text, Type("builtin", "u8", 1))
+            raise NotLowerable()
+
+        elif ast.data == "expression_op_bin":
+            op = ast.children[1].data
+
+            if op.endswith("_eq"):
+                # x += y is x = x + y, and results in x
+                var = self.lower_assignee(ast.children[0])
+                operand = self.lower_expression(ast.children[2])
+                type = self.backend.infer_type(ast)
+                if not is_scalar(type):
+                    raise NotLowerable()
+
+                result = self.new_temp(promote(type))
+                self.emit(op[:-len("_eq")], result, [var, operand])
+                self.emit("copy", var, [result])
+                return var
+
+            left = self.lower_expression(ast.children[0])
+            right = self.lower_expression(ast.children[2])
+
+            type = self.backend.infer_type(ast)
+            for child in (ast.children[0], ast.children[2]):
+                if not is_scalar(self.backend.types[id(child)]):
+                    raise NotLowerable()
+
+            # Comparisons result in an int in C
+            result = self.new_temp(INT if op in COMPARISONS else promote(type))
+            self.emit(op, result, [left, right])
+            return result
+
+        elif ast.data == "expression_function_call":
+            name = ast.children[0].text
+            if name == "this":
+                name = self.fn.name
+
+            try:
+                func = self.backend.get_fn(ast.children[0].text) if name != self.fn.name else None
+            except CompilerBackendException:
+                # Declared outside the language (like printf), so its result can't be typed
+                if value:
+                    raise NotLowerable()
+                func = None
+
+            return_type = self.fn.return_type if name == self.fn.name else (func.type if func != None else None)
+            args = [self.lower_expression(arg) for arg in ast.children[1].children]
+
+            if value:
+                if not is_scalar(return_type):
+                    raise NotLowerable()
+                result = self.new_temp(return_type)
+            else:
+                result = None
+
+            self.emit("call", result, args, fn=name)
+            return result
+
+        raise NotLowerable()
+
+    def remove_unreachable(self):
+        reachable = set()
+        stack = [self.fn.blocks[0]]
+
+        while stack:
+            block = stack.pop()
+            if id(block) in reachable:
+                continue
+            reachable.add(id(block))
+            stack.extend(block.successors())
+
+        self.fn.blocks = [block for block in self.fn.blocks if id(block) in reachable]
+        for loop in self.fn.loops:
+            loop.blocks = [block for block in loop.blocks if id(block) in reachable]
+        self.fn.loops = [loop for loop in self.fn.loops if id(loop.header) in reachable]
@@ -0,0 +1,223 @@
+import collections
+
+from .exceptions import CompilerBackendException
+from .lowering import Var, Const, INT
+from .types import INT_RANGES
+
+# Optimization passes over lowered functions (see lowering.py), each one rewriting the function in place
+# Passes only assume the function is valid, so they can run in any order, any number of times
+
+# Operators that can be computed ahead of time without trapping, division by zero would
+ARITHMETIC = ("add", "subtract", "multiply", "divide")
+PURE = ARITHMETIC + ("equal", "not_equal", "less_than", "greater_than")
+SPECULABLE = ("copy", "add", "subtract", "multiply", "equal", "not_equal", "less_than", "greater_than")
+COMMUTATIVE = ("add", "multiply", "equal", "not_equal")
+
+# Signed overflow is undefined in C, so signed arithmetic is only safe to run where the source ran it,
+# hoisting it out of a loop that never runs could overflow in a program that never did
+def speculable(fn, instr):
+    if instr.op not in SPECULABLE:
+        return False
+    if instr.op in ARITHMETIC:
+        type = fn.vars[instr.dest.name]
+        return type is not INT and not (type.name in INT_RANGES and INT_RANGES[type.name][0] < 0)
+    return True
+
+def instructions(fn):
+    for block in fn.blocks:
+        yield from block.instrs
+        if block.terminator != None:
+            yield block.terminator
+
+def type_of(fn, operand):
+    return fn.vars[operand.name] if isinstance(operand, Var) else operand.type
+
+# Whether reading source in place of dest gives the same value, which isn't the case if the copy converts it
+def same_value(fn, dest, source):
+    dest_type = fn.vars[dest.name]
+    if isinstance(source, Const) and source.type is INT:
+        return dest_type.name in ("i32", "int")
+    return type_of(fn, source) is dest_type
+
+# Copies within a block, with what reads each variable, so forgetting about one doesn't scan everything
+class Copies:
+    def __init__(self, fn):
+        self.fn = fn
+        self.sources = {} # Var -> operand it's a copy of
+        self.copied_to = collections.defaultdict(list) # Var -> Vars copied from it
+
+    def resolve(self, arg):
+        return self.sources.get(arg, arg) if isinstance(arg, Var) else arg
+
+    # Forgets everything about var, called when it's assigned
+    def kill(self, var):
+        self.sources.pop(var, None)
+        for dest in self.copied_to.pop(var, ()):
+            if self.sources.get(dest) == var:
+                del self.sources[dest]
+
+    def add(self, dest, source):
+        source = self.resolve(source)
+        if source != dest and same_value(self.fn, dest, source):
+            self.sources[dest] = source
+            self.copied_to[source].append(dest)
+
+# Common subexpression elimination, within each block
+# A computation already held in a variable is replaced by a copy of it, copy propagation then removes the copy
+# Operands are compared after looking through copies, so what a replaced computation fed into matches too
+def eliminate_common_subexpressions(fn):
+    for block in fn.blocks:
+        if len(block.instrs) < 2:
+            continue
+
+        available = {} # (op, args) -> Var holding its result
+        readers = collections.defaultdict(list) # Var -> keys computed from it or held in it
+        copies = Copies(fn)
+
+        for instr in block.instrs:
+            key = None
+            if instr.op in PURE:
+                args = list(map(copies.resolve, instr.args))
+                if instr.op in COMMUTATIVE:
+                    args = sorted(args, key=str)
+                key = (instr.op, tuple(args))
+
+                if key in available and type_of(fn, available[key]) is fn.vars[instr.dest.name]:
+                    instr.op, instr.args = "copy", [available[key]]
+                    key = None
+
+            if instr.dest != None:
+                # Whatever was computed from the old value, or held in it, is gone
+                for stale in readers.pop(instr.dest, ()):
+                    available.pop(stale, None)
+                copies.kill(instr.dest)
+
+                if key != None and instr.dest not in key[1]:
+                    available[key] = instr.dest
+                    for var in (instr.dest,) + key[1]:
+                        if isinstance(var, Var):
+                            readers[var].append(key)
+                if instr.op == "copy":
+                    copies.add(instr.dest, instr.args[0])
+
+# Copy propagation, within each block
+# Uses of a variable copied from another are replaced by the original, as long as neither changed since
+def propagate_copies(fn):
+    for block in fn.blocks:
+        if not any(instr.op == "copy" for instr in block.instrs):
+            continue
+
+        copies = Copies(fn)
+
+        for instr in block.instrs + ([block.terminator] if block.terminator != None else []):
+            instr.args = list(map(copies.resolve, instr.args))
+
+            if instr.dest != None:
+                copies.kill(instr.dest)
+                if instr.op == "copy":
+                    copies.add(instr.dest, instr.args[0])
+
+# Blocks each block is always reached through, using the iterative data flow algorithm
+def dominators(fn):
+    predecessors = {id(block): [] for block in fn.blocks}
+    for block in fn.blocks:
+        for successor in block.successors():
+            predecessors[id(successor)].append(block)
+
+    everything = set(map(id, fn.blocks))
+    dom = {id(block): everything for block in fn.blocks}
+    dom[id(fn.blocks[0])] = {id(fn.blocks[0])}
+
+    changed = True
+    while changed:
+        changed = False
+        for block in fn.blocks[1:]:
+            new = {id(block)}
+            if len(predecessors[id(block)]) != 0:
+                new |= set.intersection(*(dom[id(predecessor)] for predecessor in predecessors[id(block)]))
+            if new != dom[id(block)]:
+                dom[id(block)] = new
+                changed = True
+
+    return dom
+
+# Loop invariant code motion
+# Temporaries computed from values the loop never changes are computed once, in the loop's preheader
+# Only blocks that run on every iteration are looked at, so conditional code isn't made to run every time
+def hoist_loop_invariants(fn):
+    if len(fn.loops) == 0:
+        return
+
+    dom = dominators(fn)
+
+    # Inner loops come first, what they hoist can then be hoisted out of the loops around them
+    for loop in fn.loops:
+        latches = [block for block in loop.blocks if loop.header in block.successors()]
+        if len(latches) == 0:
+            continue # Every way through returns, so it isn't really a loop
+        always = [block for block in loop.blocks if all(id(block) in dom[id(latch)] for latch in latches)]
+        changed_in_loop = {instr.dest for block in loop.blocks for instr in block.instrs if instr.dest != None}
+
+        # Blocks are in order, so anything an instruction reads is hoisted before it is
+        for block in always:
+            kept = []
+            for instr in block.instrs:
+                if (speculable(fn, instr) and
+                    instr.dest.name in fn.temps and
+                    not any(isinstance(arg, Var) and arg in changed_in_loop for arg in instr.args)):
+                    loop.preheader.instrs.append(instr)
+                    # Temporaries are only assigned once, so it's invariant from now on
+                    changed_in_loop.discard(instr.dest)
+                else:
+                    kept.append(instr)
+            block.instrs = kept
+
+# Dead code elimination
+# Removes assignments to variables that are never read, calls are kept for their side effects
+# Copy propagation leaves a lot of these behind, since it reads the value from where it was copied from
+def eliminate_dead_code(fn):
+    uses = collections.Counter(arg for instr in instructions(fn) for arg in instr.args if isinstance(arg, Var))
+    definitions = collections.defaultdict(list)
+    for block in fn.blocks:
+        for instr in block.instrs:
+            if instr.dest != None:
+                definitions[instr.dest].append(instr)
+
+    # Removing an instruction can leave what it read unused too
+    dead = set()
+    unused = [var for var in definitions if uses[var] == 0]
+    while len(unused) != 0:
+        for instr in definitions.pop(unused.pop(), ()):
+            if instr.op == "call":
+                instr.dest = None
+                continue
+
+            dead.add(id(instr))
+            for arg in instr.args:
+                if isinstance(arg, Var):
+                    uses[arg] -= 1
+                    if uses[arg] == 0:
+                        unused.append(arg)
+
+    for block in fn.blocks:
+        block.instrs = [instr for instr in block.instrs if id(instr) not in dead]
+
+PASSES = {
+    "cse": eliminate_common_subexpressions,
+    "copyprop": propagate_copies,
+    "licm": hoist_loop_invariants,
+    "dce": eliminate_dead_code,
+}
+
+class PassManager:
+    # Runs the picked passes in order on every lowered function, timing each one as a phase of its own
+    def __init__(self, names):
+        for name in names:
+            if name not in PASSES:
+                raise CompilerBackendException(f"unknown pass: {name} (available passes: {', '.join(PASSES)})")
+        self.names = names
+
+    def run(self, fn, profiler):
+        for name in self.names:
+            with profiler.phase(name):
+                PASSES[name](fn)
@@ -0,0 +1,158 @@
+import sys, time, json, resource, threading, contextlib, tracemalloc
+
+# How many of the slowest functions and structs the table lists, the JSON has all of them
+TABLE_ITEMS = 10
+
+class Profiler:
+    # Records the wall time of every phase of a compile, and the peak memory used during it
+    # Phases nest, and are keyed by their path from the outermost one, like resolve/parse
+    # A phase entered more than once, like parse for every module, adds up
+    # Items are top level definitions (functions and structs), timed on their own
+    def __init__(self, enabled=False, trace_memory=False):
+        self.enabled = enabled
+        # Python's peak memory needs tracemalloc, which slows everything down, so it's optional
+        # Peaks are process wide, so phases running at the same time on other threads share them
+        self.trace_memory = trace_memory
+        self.phases = {} # Path -> record, in the order they were first entered
+        self.items = []
+        self.total = None
+        self.local = threading.local() # Every thread nests its own phases
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        if self.enabled:
+            self.started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+            if self.started_tracing:
+                tracemalloc.start()
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.enabled:
+            self.total = time.perf_counter() - self.start
+            if self.started_tracing:
+                tracemalloc.stop()
+
+    def phase(self, name):
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self.measure(name, None)
+
+    def item(self, kind, name, file):
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self.measure(name, {"kind": kind, "file": file})
+
+    def stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    @contextlib.contextmanager
+    def measure(self, name, item):
+        stack = self.stack()
+        frame = {"name": name, "peak": 0, "item": item != None}
+        # Phases inside an item, like the passes run on every function, are added up under the phase around it
+        path = "/".join([outer["name"] for outer in stack if not outer["item"]] + [name])
+
+        if item == None:
+            # Phases are added when they start, so they're listed before the ones inside them
+            with self.lock:
+                if path not in self.phases:
+                    self.phases[path] = {"phase": path, "calls": 0, "seconds": 0, "peak_bytes": None, "subprocess_peak_bytes": None}
+
+        if self.trace_memory:
+            # The peak is reset for every phase, so the one around it has to remember it first
+            if len(stack) != 0:
+                stack[-1]["peak"] = max(stack[-1]["peak"], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            memory_start = tracemalloc.get_traced_memory()[0]
+
+        # Subprocesses like the C compiler only show up in the peak of every child so far
+        children_start = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+        stack.append(frame)
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            stack.pop()
+
+            peak = None
+            if self.trace_memory:
+                absolute_peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+                peak = absolute_peak - memory_start
+                if len(stack) != 0:
+                    stack[-1]["peak"] = max(stack[-1]["peak"], absolute_peak)
+
+            children_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+            children_peak = children_peak * 1024 if children_peak > children_start else None
+
+            with self.lock:
+                if item != None:
+                    self.items.append(dict(item, name=name, seconds=seconds, peak_bytes=peak))
+                else:
+                    self.record(path, seconds, peak, children_peak)
+
+    def record(self, path, seconds, peak, children_peak):
+        record = self.phases[path]
+        record["calls"] += 1
+        record["seconds"] += seconds
+        if peak != None:
+            record["peak_bytes"] = max(record["peak_bytes"] or 0, peak)
+        if children_peak != None:
+            record["subprocess_peak_bytes"] = max(record["subprocess_peak_bytes"] or 0, children_peak)
+
+    # Adds what another profiler measured, from its to_dict, ex. one that ran in a worker process
+    # Its phases are put under the phase running on this thread
+    def merge(self, data):
+        if not self.enabled:
+            return
+
+        prefix = [outer["name"] for outer in self.stack() if not outer["item"]]
+        with self.lock:
+            for phase in data["phases"]:
+                path = "/".join(prefix + [phase["phase"]])
+                if path not in self.phases:
+                    self.phases[path] = {"phase": path, "calls": 0, "seconds": 0, "peak_bytes": None, "subprocess_peak_bytes": None}
+                self.phases[path]["calls"] += phase["calls"] - 1
+                self.record(path, phase["seconds"], phase["peak_bytes"], phase["subprocess_peak_bytes"])
+            self.items.extend(data["items"])
+
+    def to_dict(self):
+        return {"total_seconds": self.total, "phases": list(self.phases.values()), "items": self.items}
+
+    def table(self):
+        def kib(n):
+            return "" if n == None else f"{n / 1024:.0f}"
+
+        lines = [f"{'phase':<32} {'calls':>6} {'time (ms)':>10} {'peak (KiB)':>11} {'subprocess peak (KiB)':>22}"]
+        # List every phase under the one it ran in, phases on other threads can start in between
+        order = {path: i for i, path in enumerate(self.phases)}
+        def tree_order(record):
+            parts = record["phase"].split("/")
+            return [order["/".join(parts[:i + 1])] for i in range(len(parts))]
+
+        for record in sorted(self.phases.values(), key=tree_order):
+            depth = record["phase"].count("/")
+            name = "  " * depth + record["phase"].split("/")[-1]
+            lines.append(f"{name:<32} {record['calls']:>6} {record['seconds'] * 1000:>10.2f} {kib(record['peak_bytes']):>11} {kib(record['subprocess_peak_bytes']):>22}")
+        lines.append(f"{'total':<32} {'':>6} {self.total * 1000:>10.2f}")
+
+        if len(self.items) != 0:
+            lines.append("")
+            lines.append(f"{'slowest definitions':<32} {'kind':>8} {'time (ms)':>10} {'peak (KiB)':>11}")
+            for item in sorted(self.items, key=lambda item: item["seconds"], reverse=True)[:TABLE_ITEMS]:
+                lines.append(f"{item['name']:<32} {item['kind']:>8} {item['seconds'] * 1000:>10.2f} {kib(item['peak_bytes']):>11}")
+
+        return "\n".join(lines)
+
+    # Prints the table to stderr, so it doesn't mix with anything the compile prints, and writes the JSON if asked to
+    def report(self, json_file=None):
+        print(self.table(), file=sys.stderr)
+
+        if json_file:
+            with open(json_file, "w") as f:
+                json.dump(self.to_dict(), f, indent=4)
@@ -1,51 +1,113 @@
-from typing import List, Dict
+import weakref
+from typing import List, Dict, Optional
+
+# Value ranges of the integer types, pointer sized ones assume a 64-bit target
+INT_RANGES = {
+    "u8": (0, 2**8 - 1),
+    "u16": (0, 2**16 - 1),
+    "u32": (0, 2**32 - 1),
+    "u64": (0, 2**64 - 1),
+    "uptr": (0, 2**64 - 1),
+    "i8": (-2**7, 2**7 - 1),
+    "i16": (-2**15, 2**15 - 1),
+    "i32": (-2**31, 2**31 - 1),
+    "i64": (-2**63, 2**63 - 1),
+    "iptr": (-2**63, 2**63 - 1),
+}
 
 class Type:
-    def __init__(self, type: str, name: str, ptr: int):
-        self.type = type
-        self.name = name
-        self.ptr = ptr
+    # Types are interned, there's only ever one object for every distinct type
+    # That makes them immutable, and they're compared and hashed by identity
+    # Arrays and slices also have the type of their elements, arrays their length too
+    # Their name is spelled like in the source, ex. [4]i32 or []Point
+    # A type is dropped from the table once nothing uses it anymore, so a long running server doesn't keep
+    # every type it ever compiled
+    __slots__ = ("type", "name", "ptr", "elem", "length", "__weakref__")
 
-    def __eq__(self, other):
-        return (
-            self.type == other.type and
-            self.name == other.name and
-            self.ptr == other.ptr)
+    interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, type: str, name: str, ptr: int, elem: Optional["Type"] = None, length: Optional[int] = None):
+        key = (type, name, ptr, elem, length)
+        self = cls.interned.get(key)
+
+        if self == None:
+            self = object.__new__(cls)
+            for attr, value in zip(cls.__slots__, key):
+                object.__setattr__(self, attr, value)
+            # Another thread may have interned the same type in the meantime
+            self = cls.interned.setdefault(key, self)
+
+        return self
+
+    def __setattr__(self, name, value):
+        raise AttributeError("types are immutable")
+
+    # Unpickled types are interned again
+    def __reduce__(self):
+        return (Type, (self.type, self.name, self.ptr, self.elem, self.length))
 
     def __str__(self, i=0):
         return i * "\t" + f"{self.name}{self.ptr * '*'}"
 
-    def copy(self):
-        return Type(self.type, self.name, self.ptr)
-
     def str(self, i=0):
         return self.__str__(i)
 
+    def to_dict(self):
+        data = {"type": self.type, "name": self.name, "ptr": self.ptr}
+        if self.elem != None:
+            data["elem"] = self.elem.to_dict()
+        if self.length != None:
+            data["length"] = self.length
+        return data
+
+    @staticmethod
+    def from_dict(data):
+        elem = Type.from_dict(data["elem"]) if "elem" in data else None
+        return Type(data["type"], data["name"], data["ptr"], elem, data.get("length"))
+
+def array_type(elem, length):
+    return Type("array", f"[{length}]{elem}", 0, elem, length)
+
+def slice_type(elem):
+    return Type("slice", f"[]{elem}", 0, elem)
+
 class Param:
+    __slots__ = ("type", "name")
+
     def __init__(self, type: Type, name: str):
         self.type = type
         self.name = name
 
     def __eq__(self, other):
+        if not isinstance(other, Param):
+            return NotImplemented
         return (
             self.type == other.type and
             self.name == other.name)
 
     def __str__(self, i=0):
         return i * "\t" + f"{str(self.type)} {self.name}"
-    
-    def copy(self):
-        return Param(self.type, self.name)
-    
+
     def str(self, i=0):
         return self.__str__(i)
 
+    def to_dict(self):
+        return {"type": self.type.to_dict(), "name": self.name}
+
+    @staticmethod
+    def from_dict(data):
+        return Param(Type.from_dict(data["type"]), data["name"])
+
 class Func:
-    def __init__(self, type: Type, params: List[Param]):
+    __slots__ = ("type", "params")
+
+    def __init__(self, type: Optional[Type], params: List[Param]):
         self.type = type
         self.params = params
 
     def __eq__(self, other):
+        if not isinstance(other, Func):
+            return NotImplemented
         return (
             self.type == other.type and
             self.params == other.params)
@@ -59,19 +121,32 @@ class Func:
     params=", ".join(param.str() for param in self.params),
     i=i * "\t")
 
-    def copy(self):
-        return Func(self.type, self.params)
-
     def str(self, name="", i=0):
         return self.__str__(name, i)
 
+    def to_dict(self):
+        return {
+            "type": self.type.to_dict() if self.type != None else None,
+            "params": [param.to_dict() for param in self.params]}
+
+    @staticmethod
+    def from_dict(data):
+        return Func(
+            Type.from_dict(data["type"]) if data["type"] != None else None,
+            [Param.from_dict(param) for param in data["params"]])
+
 class Struct:
-    def __init__(self, vars: Dict[str, Type] = {}, fns: Dict[str, Func] = {}, overloads: Dict[str, Func] = {}):
-        self.vars = vars
-        self.fns = fns
-        self.overloads = overloads
+    __slots__ = ("vars", "fns", "overloads")
+
+    # Defaults are None so that instances don't end up sharing the same dicts
+    def __init__(self, vars: Dict[str, Type] = None, fns: Dict[str, Func] = None, overloads: Dict[str, Func] = None):
+        self.vars = vars if vars != None else {}
+        self.fns = fns if fns != None else {}
+        self.overloads = overloads if overloads != None else {}
 
     def __eq__(self, other):
+        if not isinstance(other, Struct):
+            return NotImplemented
         return (
             self.vars == other.vars and
             self.fns == other.fns and
@@ -91,23 +166,41 @@ class Struct:
     overloads="\n".join(v.str(k, i + 1) for k, v in self.overloads.items()),
     i=i * "\t")
 
-    def copy(self):
-        return Struct(self.vars, self.fns, self.overloads)
-
     def str(self, name="", i=0):
         return self.__str__(name, i)
 
+    def to_dict(self):
+        return {
+            "vars": {k: v.to_dict() for k, v in self.vars.items()},
+            "fns": {k: v.to_dict() for k, v in self.fns.items()},
+            "overloads": {k: v.to_dict() for k, v in self.overloads.items()}}
+
+    @staticmethod
+    def from_dict(data):
+        return Struct(
+            {k: Type.from_dict(v) for k, v in data["vars"].items()},
+            {k: Func.from_dict(v) for k, v in data["fns"].items()},
+            {k: Func.from_dict(v) for k, v in data["overloads"].items()})
+
 class Export:
-    def __init__(self, structs: Dict[str, Struct] = {}, fns: Dict[str, Func] = {}, vars: Dict[str, Type] = {}):
-        self.structs = structs
-        self.fns = fns
-        self.vars = vars
+    # internal has the functions and methods (as Struct.method) --whole-program kept out of the rest,
+    # by the path of the module they're in, so using one can say where it is rather than that it doesn't exist
+    __slots__ = ("structs", "fns", "vars", "internal")
+
+    def __init__(self, structs: Dict[str, Struct] = None, fns: Dict[str, Func] = None, vars: Dict[str, Type] = None, internal: Dict[str, str] = None):
+        self.structs = structs if structs != None else {}
+        self.fns = fns if fns != None else {}
+        self.vars = vars if vars != None else {}
+        self.internal = internal if internal != None else {}
 
     def __eq__(self, other):
+        if not isinstance(other, Export):
+            return NotImplemented
         return (
             self.structs == other.structs and
             self.fns == other.fns and
-            self.vars == other.vars)
+            self.vars == other.vars and
+            self.internal == other.internal)
 
     def __str__(self, i=0):
         return """\
@@ -128,8 +221,20 @@ class Export:
     vars="\n".join(v.str(k, i + 2) for k, v in self.vars.items()),
     i=i * "\t")
 
-    def copy(self):
-        return Export(self.structs, self.fns, self.vars)
-
     def str(self, i=0):
-        return self.__str__(i)
\ No newline at end of file
+        return self.__str__(i)
+
+    def to_dict(self):
+        return {
+            "structs": {k: v.to_dict() for k, v in self.structs.items()},
+            "fns": {k: v.to_dict() for k, v in self.fns.items()},
+            "vars": {k: v.to_dict() for k, v in self.vars.items()},
+            "internal": self.internal}
+
+    @staticmethod
+    def from_dict(data):
+        return Export(
+            {k: Struct.from_dict(v) for k, v in data["structs"].items()},
+            {k: Func.from_dict(v) for k, v in data["fns"].items()},
+            {k: Type.from_dict(v) for k, v in data["vars"].items()},
+            data.get("internal"))
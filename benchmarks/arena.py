@@ -0,0 +1,101 @@
+import sys, os, time, argparse, subprocess, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import main
+import backends
+
+# Builds a linked list of SIZE nodes and walks it, PASSES times
+# malloc allocates and frees every node on its own, arena allocates them from an arena freed once per pass
+VERSIONS = {
+    "malloc": """\
+    for pass in 0..PASSES {
+        var head Node* = null
+        for i in 0..SIZE {
+            var node Node* = malloc(16)
+            node.value = i
+            node.next = head
+            head = node
+        }
+        for i in 0..SIZE {
+            result += head.value
+            var next = head.next
+            free(head)
+            head = next
+        }
+    }""",
+    "arena": """\
+    var nodes arena
+    for pass in 0..PASSES {
+        var head Node* = null
+        for i in 0..SIZE {
+            var node = new Node in nodes
+            node.value = i
+            node.next = head
+            head = node
+        }
+        for i in 0..SIZE {
+            result += head.value
+            head = head.next
+        }
+        nodes.free()
+    }""",
+}
+
+PROGRAM = """\
+include "stdio"
+include "stdlib"
+
+struct Node {{
+    value uptr
+    next Node*
+}}
+
+fn main() i32 {{
+    var result uptr = 0
+{body}
+    printf("%lu\\n", result)
+    return 0
+}}
+"""
+
+def build(source_file, output, profile):
+    args = main.make_argument_parser().parse_args([source_file, "-o", output, "--no-cache", "-p", profile])
+    main.compile_program(None, args, backends.Profiler(False))
+
+def run(output, repeat):
+    fastest = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([output], stdout=subprocess.PIPE, check=True).stdout
+        fastest = min(fastest, time.perf_counter() - start)
+    return result, fastest
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Measures allocating the nodes of a linked list with malloc and free against allocating them from an arena.")
+    argparser.add_argument("--size", type=int, default=100000, help="nodes of the list (default: %(default)s)")
+    argparser.add_argument("--passes", type=int, default=100, help="times the list is built and walked (default: %(default)s)")
+    argparser.add_argument("--profiles", default="fast-compile,release", help="comma separated profiles to build with (default: %(default)s)")
+    argparser.add_argument("--repeat", type=int, default=3, help="runs per program, the fastest is reported (default: %(default)s)")
+    args = argparser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'profile':>14} {'malloc (ms)':>12} {'arena (ms)':>11} {'speedup':>8}")
+        for profile in args.profiles.split(","):
+            times = {}
+            results = set()
+            for version, body in VERSIONS.items():
+                source_file = os.path.join(workdir, f"{version}.lang")
+                with open(source_file, "w") as f:
+                    f.write(PROGRAM.format(body=body.replace("PASSES", str(args.passes)).replace("SIZE", str(args.size))))
+
+                output = os.path.join(workdir, version)
+                build(source_file, output, profile)
+                result, times[version] = run(output, args.repeat)
+                results.add(result)
+
+            if len(results) != 1:
+                print("error: the malloc and arena versions printed different results")
+                sys.exit(1)
+
+            print(f"{profile:>14} {times['malloc'] * 1000:>12.2f} {times['arena'] * 1000:>11.2f} {times['malloc'] / times['arena']:>7.2f}x")
@@ -0,0 +1,45 @@
+import sys, os, time, argparse, tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import main
+import parse
+import backends
+import generate
+
+# Measures how much memory a parsed program keeps alive per line of source,
+# and how long parsing and generating code for it take
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Measures the memory used by parsed programs, per line of source.")
+    argparser.add_argument("--shapes", default=",".join(generate.SHAPES), help="comma separated program shapes to run (default: %(default)s)")
+    argparser.add_argument("--size", type=int, default=2000, help="size of every program (default: %(default)s)")
+    argparser.add_argument("--repeat", type=int, default=3, help="runs per program, the fastest is reported (default: %(default)s)")
+    args = argparser.parse_args()
+
+    sys.setrecursionlimit(100000)
+    parser = parse.Parser(main.GRAMMAR_FILE_PATH)
+    compile_args = main.make_argument_parser().parse_args(["<bench>", "-o", "<bench>"])
+
+    print(f"{'shape':>10} {'lines':>7} {'bytes/line':>11} {'parse (ms)':>11} {'generate (ms)':>14}")
+    for shape in args.shapes.split(","):
+        source = generate.SHAPES[shape](args.size)
+        lines = source.count("\n")
+
+        tracemalloc.start()
+        start = tracemalloc.get_traced_memory()[0]
+        ast = parser.parse(source)
+        retained = tracemalloc.get_traced_memory()[0] - start
+        tracemalloc.stop()
+
+        parse_time = generate_time = float("inf")
+        for _ in range(args.repeat):
+            t = time.perf_counter()
+            ast = parser.parse(source)
+            parse_time = min(parse_time, time.perf_counter() - t)
+
+            backend = backends.CBackend(compile_args)
+            t = time.perf_counter()
+            backend.generate(ast)
+            generate_time = min(generate_time, time.perf_counter() - t)
+
+        print(f"{shape:>10} {lines:>7} {retained / lines:>11.0f} {parse_time * 1000:>11.2f} {generate_time * 1000:>14.2f}")
@@ -0,0 +1,62 @@
+import sys, os, time, argparse, subprocess, tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import server
+
+# A small program, slightly different per file so nothing can be shared between them
+def generate_source(i):
+    return f"""\
+include "stdio"
+
+fn square(n i32) i32 {{
+    return n * n + {i}
+}}
+
+fn main() i32 {{
+    for n in 0..{i % 10 + 1} {{
+        printf("%d\\n", square(n))
+    }}
+    return 0
+}}
+"""
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Compares compiling files one main.py call at a time against a batch sent to the compile server.")
+    argparser.add_argument("-n", "--files", type=int, default=32, help="number of files to compile (default: %(default)s)")
+    argparser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="server workers (default: %(default)s)")
+    args = argparser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = []
+        for i in range(args.files):
+            files.append(os.path.join(tmp, f"bench{i}.lang"))
+            with open(files[-1], "w") as f:
+                f.write(generate_source(i))
+
+        start = time.perf_counter()
+        for file in files:
+            subprocess.run([sys.executable, os.path.join(ROOT, "main.py"), file, "-o", file + ".out"], check=True)
+        loop_time = time.perf_counter() - start
+
+        socket_path = os.path.join(tmp, "server.sock")
+        process = subprocess.Popen([sys.executable, os.path.join(ROOT, "server.py"), "serve", "-s", socket_path, "-j", str(args.jobs)], stdout=subprocess.DEVNULL)
+        try:
+            while not os.path.exists(socket_path):
+                time.sleep(0.01)
+
+            start = time.perf_counter()
+            results = server.send_jobs(socket_path, [[file, "-o", file + ".out"] for file in files])
+            batch_time = time.perf_counter() - start
+        finally:
+            process.terminate()
+            process.wait()
+
+        if not all(result["ok"] for result in results):
+            raise RuntimeError("batch compile failed: " + str(results))
+
+    print(f"{'mode':>10} {'total (s)':>10} {'files/s':>10}")
+    print(f"{'main.py':>10} {loop_time:>10.2f} {args.files / loop_time:>10.1f}")
+    print(f"{'batch':>10} {batch_time:>10.2f} {args.files / batch_time:>10.1f}")
+    print(f"speedup: {loop_time / batch_time:.2f}x")
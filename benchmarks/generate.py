@@ -0,0 +1,60 @@
+import sys, argparse
+
+# Generators for synthetic programs, each one scaling a different part of the compiler with size
+# Every program they make is valid and compiles with the C backend
+
+# Operators and operands that keep every intermediate value small, so nothing overflows
+# Operators have no precedence and nest to the right, so multiplying would grow quickly
+OPERATIONS = ["+ 3", "- 2"]
+
+def generate_functions(size):
+    # size functions, each calling the one before it
+    fns = ["fn f0(x i32) i32 {\n    return x\n}\n"]
+    for i in range(1, size):
+        fns.append(f"fn f{i}(x i32) i32 {{\n    var y = x + {i % 100}\n    if y > 1000 {{\n        y = y - 1000\n    }}\n    return f{i - 1}(y)\n}}\n")
+
+    return "".join(fns) + f"fn main() i32 {{\n    return f{size - 1}(0) - f{size - 1}(0)\n}}\n"
+
+def generate_structs(size):
+    # size structs, with a few fields and methods each
+    structs = []
+    for i in range(size):
+        structs.append(
+            f"struct S{i} {{\n    a i32\n    b i64\n    c u8\n\n"
+            f"    fn sum() i64 {{\n        return self.b + {i}\n    }}\n\n"
+            f"    fn set(a i32) {{\n        self.a = a\n    }}\n}}\n")
+
+    body = "".join(f"    var s{i} S{i}\n    s{i}.set({i})\n" for i in range(size))
+    return "".join(structs) + f"fn main() i32 {{\n{body}    return 0\n}}\n"
+
+def generate_deep(size):
+    # One expression nested size levels deep
+    # Its operands are all variables, so constant folding can't shrink it
+    expr = "x"
+    for i in range(size):
+        expr = f"{expr} {'+-'[i % 2]} x"
+
+    return f"fn main() i32 {{\n    var x i32 = 1\n    var y = {expr}\n    return y - y\n}}\n"
+
+def generate_long(size):
+    # One block of size statements
+    body = ["    var v0 i32 = 1\n"]
+    for i in range(1, size):
+        body.append(f"    var v{i} = v{i - 1} {OPERATIONS[i % len(OPERATIONS)]}\n")
+
+    return f"fn main() i32 {{\n{''.join(body)}    return v{size - 1} - v{size - 1}\n}}\n"
+
+SHAPES = {
+    "functions": generate_functions,
+    "structs": generate_structs,
+    "deep": generate_deep,
+    "long": generate_long,
+}
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Prints a synthetic program.")
+    argparser.add_argument("shape", choices=SHAPES, help="what the program has a lot of")
+    argparser.add_argument("size", type=int, help="how many of it")
+    args = argparser.parse_args()
+
+    sys.stdout.write(SHAPES[args.shape](args.size))
@@ -0,0 +1,41 @@
+import sys, os, time, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import main
+import parse
+import backends
+
+GRAMMAR_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "grammar.lark")
+
+# Generates a function whose body is a single expression nested `depth` levels deep,
+# like (((x + 1) * 2) - 3)...
+def generate_source(depth):
+    ops = ["+", "*", "-"]
+    expr = "x"
+    for i in range(depth):
+        expr = f"{expr} {ops[i % len(ops)]} {i % 7 + 1}"
+    return f"fn main() i32 {{\n    var x i32 = 1\n    var y = {expr}\n    return y\n}}\n"
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Times C code generation on deeply nested expressions.")
+    argparser.add_argument("--depths", default="50,100,200,400", help="comma separated nesting depths (default: %(default)s)")
+    argparser.add_argument("--repeat", type=int, default=5, help="runs per depth, the fastest is reported (default: %(default)s)")
+    args = argparser.parse_args()
+
+    sys.setrecursionlimit(100000)
+    parser = parse.Parser(GRAMMAR_FILE_PATH)
+    compile_args = main.make_argument_parser().parse_args(["<bench>", "-o", "<bench>"])
+
+    print(f"{'depth':>8} {'generate (ms)':>14} {'us/node':>10}")
+    for depth in map(int, args.depths.split(",")):
+        ast = parser.parse(generate_source(depth))
+
+        best = float("inf")
+        for _ in range(args.repeat):
+            backend = backends.CBackend(compile_args)
+            start = time.perf_counter()
+            backend.generate(ast)
+            best = min(best, time.perf_counter() - start)
+
+        print(f"{depth:>8} {best * 1000:>14.2f} {best * 1e6 / depth:>10.2f}")
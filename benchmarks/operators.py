@@ -0,0 +1,109 @@
+import sys, os, time, argparse, subprocess, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import main
+import backends
+
+# A vector of 8 fields, added up in a loop through chains of operators
+FIELDS = "abcdefgh"
+
+def method(name, op, returns):
+    lines = [f"    fn {name}(rhs Vector*) {'Vector ' if returns else ''}{{"]
+    if returns:
+        lines.append("        var v Vector")
+        lines += [f"        v.{field} = self.{field} {op} rhs.{field}" for field in FIELDS]
+        lines.append("        return v")
+    else:
+        lines += [f"        self.{field} {op}= rhs.{field}" for field in FIELDS]
+    lines.append("    }")
+    return "\n".join(lines)
+
+# by-value: methods returning the vector, every partial result is copied into a variable,
+# which is what overloads compiled to before they wrote their result through a pointer
+# pointer: __add__ writes its result through a pointer, the chain goes through temporaries
+# in-place: __add_eq__ as well, the chain is folded into updates of a single vector
+VARIANTS = {
+    "by-value": (method("plus", "+", True), """\
+        var t1 = c.plus(&d)
+        var t2 = b.plus(&t1)
+        var t3 = a.plus(&t2)
+        total = total.plus(&t3)"""),
+    "pointer": (method("__add__", "+", True), """\
+        total = total + a + b + c + d"""),
+    "in-place": (method("__add__", "+", True) + "\n\n" + method("__add_eq__", "+", False), """\
+        total = total + a + b + c + d"""),
+}
+
+PROGRAM = """\
+include "stdio"
+
+struct Vector {{
+{fields}
+
+{methods}
+}}
+
+fn make(x i64) Vector {{
+    var v Vector
+{make}
+    return v
+}}
+
+fn main() i32 {{
+    var a = make(1)
+    var b = make(2)
+    var c = make(3)
+    var d = make(4)
+    var total = make(0)
+    for i in 0..N {{
+{body}
+        a.a = i
+    }}
+    printf("%ld\\n", total.a + total.h)
+    return 0
+}}
+"""
+
+def build(source_file, output, profile):
+    args = main.make_argument_parser().parse_args([source_file, "-o", output, "--no-cache", "-p", profile])
+    main.compile_program(None, args, backends.Profiler(False))
+
+def run(output, repeat):
+    fastest = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([output], stdout=subprocess.PIPE, check=True).stdout
+        fastest = min(fastest, time.perf_counter() - start)
+    return result, fastest
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Measures chains of overloaded operators on a large struct, by how their results are passed around.")
+    argparser.add_argument("--size", type=int, default=10000000, help="iterations of the loop (default: %(default)s)")
+    argparser.add_argument("--profiles", default="fast-compile,release", help="comma separated profiles to build with (default: %(default)s)")
+    argparser.add_argument("--repeat", type=int, default=3, help="runs per program, the fastest is reported (default: %(default)s)")
+    args = argparser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'variant':>10} {'profile':>14} {'run (ms)':>10}")
+        results = set()
+        for profile in args.profiles.split(","):
+            for variant, (methods, body) in VARIANTS.items():
+                source_file = os.path.join(workdir, f"{variant}.lang")
+                with open(source_file, "w") as f:
+                    f.write(PROGRAM.format(
+                        fields="\n".join(f"    {field} i64" for field in FIELDS),
+                        methods=methods,
+                        make="\n".join(f"    v.{field} = x" for field in FIELDS),
+                        body=body,
+                    ).replace("N", str(args.size)))
+
+                output = os.path.join(workdir, variant)
+                build(source_file, output, profile)
+                result, run_time = run(output, args.repeat)
+                results.add(result)
+                print(f"{variant:>10} {profile:>14} {run_time * 1000:>10.2f}")
+
+        if len(results) != 1:
+            print("error: the variants printed different results")
+            sys.exit(1)
@@ -0,0 +1,52 @@
+import sys, os, time, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import main
+import backends
+import generate
+
+# Times only generating C for programs of many functions or structs, with a growing number of workers
+# Programs smaller than backends.backend_c.PARALLEL_ITEMS are always generated on one process
+
+def generate_code(ast, file, jobs):
+    args = main.make_argument_parser().parse_args([file, "-o", os.devnull, "--no-cache", "-j", str(jobs)])
+    backend = backends.CBackend(args)
+
+    start = time.perf_counter()
+    backend.generate(ast)
+    elapsed = time.perf_counter() - start
+
+    return backend.emitter.getvalue(), elapsed
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Measures generating code in parallel on programs with thousands of functions.")
+    argparser.add_argument("--shapes", default="functions,structs", help="comma separated shapes of program to generate, see generate.py (default: %(default)s)")
+    argparser.add_argument("--size", type=int, default=4000, help="size of every program (default: %(default)s)")
+    argparser.add_argument("--jobs", default=f"1,2,4,{os.cpu_count()}", help="comma separated numbers of workers to try (default: %(default)s)")
+    argparser.add_argument("--repeat", type=int, default=3, help="runs per number of workers, the fastest is reported (default: %(default)s)")
+    args = argparser.parse_args()
+
+    compile_args = main.make_argument_parser().parse_args(["-", "-o", os.devnull])
+    parser = main.make_parser(compile_args)
+
+    print(f"{'shape':>10} {'jobs':>5} {'generate (ms)':>14} {'speedup':>8}")
+    for shape in args.shapes.split(","):
+        ast = main.prepare(parser.parse(generate.SHAPES[shape](args.size)), compile_args)
+
+        outputs = set()
+        baseline = None
+        for jobs in sorted({int(jobs) for jobs in args.jobs.split(",")}):
+            fastest = float("inf")
+            for _ in range(args.repeat):
+                code, elapsed = generate_code(ast, f"{shape}.lang", jobs)
+                fastest = min(fastest, elapsed)
+            outputs.add(code)
+
+            if baseline == None:
+                baseline = fastest
+            print(f"{shape:>10} {jobs:>5} {fastest * 1000:>14.2f} {baseline / fastest:>7.2f}x")
+
+        if len(outputs) != 1:
+            print(f"error: {shape} generated different code depending on the number of workers")
+            sys.exit(1)
@@ -0,0 +1,73 @@
+import sys, os, time, argparse, subprocess, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import main
+import backends
+
+# Counts the steps of the Collatz sequence of every number, written with a serial for and a parallel for
+# gcc can't turn the inner loop into a formula, so the work really has to be done
+# Operators nest to the right, so 1 + x * 3 is 1 + (x * 3)
+PROGRAM = """\
+include "stdio"
+
+fn main() i32 {{
+    var steps i64 = 0
+    {loop} i in 1..N {{
+        var x i64 = i
+        while x != 1 {{
+            var half = x / 2
+            var even = half * 2
+            if even == x {{
+                x = half
+            }} else {{
+                x = 1 + x * 3
+            }}
+            steps += 1
+        }}
+    }}
+    printf("%ld\\n", steps)
+    return 0
+}}
+"""
+
+def build(source_file, output, profile):
+    args = main.make_argument_parser().parse_args([source_file, "-o", output, "--no-cache", "-p", profile])
+    main.compile_program(None, args, backends.Profiler(False))
+
+def run(output, threads, repeat):
+    env = dict(os.environ, OMP_NUM_THREADS=str(threads))
+    fastest = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([output], stdout=subprocess.PIPE, env=env, check=True).stdout
+        fastest = min(fastest, time.perf_counter() - start)
+    return result, fastest
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Measures a loop heavy kernel with a serial for and a parallel for on a growing number of threads.")
+    argparser.add_argument("--size", type=int, default=1000000, help="iterations of the outer loop (default: %(default)s)")
+    argparser.add_argument("--threads", default=f"1,2,4,{os.cpu_count()}", help="comma separated numbers of threads to run the parallel for on (default: %(default)s)")
+    argparser.add_argument("-p", "--build-profile", default="release", choices=backends.BUILD_PROFILES, help="profile to build with (default: %(default)s)")
+    argparser.add_argument("--repeat", type=int, default=3, help="runs per program, the fastest is reported (default: %(default)s)")
+    args = argparser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'loop':>14} {'threads':>8} {'run (ms)':>10}")
+        results = set()
+        for loop in ("for", "parallel for"):
+            source_file = os.path.join(workdir, "kernel.lang")
+            with open(source_file, "w") as f:
+                f.write(PROGRAM.format(loop=loop).replace("N", str(args.size)))
+
+            output = os.path.join(workdir, loop.replace(" ", "_"))
+            build(source_file, output, args.build_profile)
+
+            for threads in sorted({int(threads) for threads in args.threads.split(",")}) if loop != "for" else [1]:
+                result, run_time = run(output, threads, args.repeat)
+                results.add(result)
+                print(f"{loop:>14} {threads:>8} {run_time * 1000:>10.2f}")
+
+        if len(results) != 1:
+            print("error: the loops printed different results")
+            sys.exit(1)
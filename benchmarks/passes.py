@@ -0,0 +1,79 @@
+import sys, os, time, argparse, subprocess, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import main
+import backends
+
+# Loops full of invariant and repeated arithmetic, which the passes are meant to remove
+# Operators nest to the right, so a * b - i is a * (b - i)
+# gcc does all of this itself with optimizations on, so the difference shows at -O0
+PROGRAM = """\
+include "stdio"
+
+fn kernel(n i64, a i64, b i64) i64 {
+    var total i64 = 0
+    var i i64 = 0
+    while i < n {
+        var j i64 = 0
+        while j < n {
+            var x = a * b - i
+            var y = a * b - i
+            total += x - y + j
+            total -= i * a
+            j += 1
+        }
+        i += 1
+    }
+    return total
+}
+
+fn main() i32 {
+    printf("%ld\\n", kernel(N, 3, 5))
+    return 0
+}
+"""
+
+CONFIGURATIONS = ["none", "cse,copyprop,dce", "licm", "cse,copyprop,licm,dce"]
+
+def build(source_file, output, passes, profile):
+    args = main.make_argument_parser().parse_args([source_file, "-o", output, "--no-cache", "--passes", passes, "-p", profile])
+    profiler = backends.Profiler(True)
+
+    with profiler:
+        main.compile_program(None, args, profiler)
+
+    return sum(record["seconds"] for record in profiler.phases.values() if record["phase"].startswith("generate/"))
+
+def run(output, repeat):
+    fastest = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([output], stdout=subprocess.PIPE, check=True).stdout
+        fastest = min(fastest, time.perf_counter() - start)
+    return result, fastest
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Measures what each optimization pass costs to run and saves at run time.")
+    argparser.add_argument("--size", type=int, default=8000, help="iterations of both loops (default: %(default)s)")
+    argparser.add_argument("-p", "--build-profile", default="fast-compile", choices=backends.BUILD_PROFILES, help="profile to build with (default: %(default)s)")
+    argparser.add_argument("--repeat", type=int, default=3, help="runs per program, the fastest is reported (default: %(default)s)")
+    args = argparser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        source_file = os.path.join(workdir, "passes.lang")
+        with open(source_file, "w") as f:
+            f.write(PROGRAM.replace("N", str(args.size)))
+
+        print(f"{'passes':>24} {'passes (ms)':>12} {'run (ms)':>10}")
+        results = set()
+        for passes in CONFIGURATIONS:
+            output = os.path.join(workdir, "passes")
+            pass_time = build(source_file, output, passes, args.build_profile)
+            result, run_time = run(output, args.repeat)
+            results.add(result)
+            print(f"{passes:>24} {pass_time * 1000:>12.2f} {run_time * 1000:>10.2f}")
+
+        if len(results) != 1:
+            print("error: the passes changed what the program prints")
+            sys.exit(1)
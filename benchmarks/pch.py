@@ -0,0 +1,48 @@
+import sys, os, shutil, argparse, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import main
+import backends
+
+# Small programs including more and more headers, where parsing the headers is most of what gcc does
+HEADERS = ["stdio", "stdlib", "string", "math", "time", "pthread", "signal"]
+
+PROGRAM = """\
+{includes}
+
+fn main() i32 {{
+    printf("%d\\n", 42)
+    return 0
+}}
+"""
+
+# Returns how long the C compiler ran, the build cache is emptied first so it always runs
+def build(source_file, output, cache_dir, profile, pch):
+    shutil.rmtree(os.path.join(cache_dir, "build"), ignore_errors=True)
+
+    args = main.make_argument_parser().parse_args([source_file, "-o", output, "--cache-dir", cache_dir, "-p", profile] + ([] if pch else ["--no-pch"]))
+    profiler = backends.Profiler(True)
+
+    with profiler:
+        main.compile_program(None, args, profiler)
+
+    return sum(record["seconds"] for record in profiler.phases.values() if record["phase"].endswith("/compiler"))
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Measures how long the C compiler takes with and without a precompiled header of the includes.")
+    argparser.add_argument("-p", "--build-profile", default="fast-compile", choices=backends.BUILD_PROFILES, help="profile to build with (default: %(default)s)")
+    argparser.add_argument("--repeat", type=int, default=5, help="compiles per program, the fastest is reported (default: %(default)s)")
+    args = argparser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'headers':>8} {'no pch (ms)':>12} {'pch (ms)':>10}")
+        for count in range(1, len(HEADERS) + 1):
+            source_file = os.path.join(workdir, f"headers{count}.lang")
+            with open(source_file, "w") as f:
+                f.write(PROGRAM.format(includes="\n".join(f'include "{header}"' for header in HEADERS[:count])))
+
+            output = os.path.join(workdir, "program")
+            # The first compile with the precompiled header builds it, the fastest one reuses it
+            times = {pch: min(build(source_file, output, workdir, args.build_profile, pch) for _ in range(args.repeat)) for pch in (False, True)}
+            print(f"{count:>8} {times[False] * 1000:>12.2f} {times[True] * 1000:>10.2f}")
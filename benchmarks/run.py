@@ -0,0 +1,96 @@
+import sys, os, time, json, argparse, resource, subprocess, tempfile, tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import main
+import parse
+import backends
+import generate
+
+DEFAULT_SIZES = {
+    "functions": [250, 500, 1000, 2000],
+    "structs": [250, 500, 1000, 2000],
+    "deep": [100, 200, 400, 800],
+    "long": [250, 500, 1000, 2000],
+}
+
+PHASES = ["parser", "parse", "generate", "write_output"]
+
+# Runs every phase once, returning a dict of phase -> result of measure(phase)
+def run_phases(source_file, compile_args, measure, output=True):
+    results = {}
+
+    parser, results["parser"] = measure(lambda: parse.Parser(main.GRAMMAR_FILE_PATH))
+    ast, results["parse"] = measure(lambda: main.prepare(parser.parse_file(source_file), compile_args))
+
+    backend = backends.BACKEND_MAP[compile_args.backend](compile_args)
+    _, results["generate"] = measure(lambda: backend.generate(ast))
+
+    if output:
+        _, results["write_output"] = measure(backend.write_output)
+
+    return results
+
+def measure_time(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def measure_memory(fn):
+    # Peak of what Python allocated while fn ran, on top of what was already allocated
+    tracemalloc.reset_peak()
+    start = tracemalloc.get_traced_memory()[0]
+    result = fn()
+    return result, tracemalloc.get_traced_memory()[1] - start
+
+# Measures one program, in a process of its own so nothing is shared between runs
+def worker(shape, size, compile_args, output):
+    with tempfile.TemporaryDirectory() as workdir:
+        source_file = os.path.join(workdir, f"{shape}-{size}.lang")
+        with open(source_file, "w") as f:
+            f.write(generate.SHAPES[shape](size))
+
+        compile_args = main.make_argument_parser().parse_args([source_file, "-o", source_file + ".out", "--no-cache"] + compile_args)
+
+        # Tracing allocations slows everything down, so time and memory are measured in separate runs
+        times = run_phases(source_file, compile_args, measure_time, output)
+        # The C compiler runs in a subprocess, the only one this process started
+        compiler_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+
+        tracemalloc.start()
+        peaks = run_phases(source_file, compile_args, measure_memory, output=False)
+        tracemalloc.stop()
+
+    peaks["write_output"] = compiler_peak
+    return [{"shape": shape, "size": size, "phase": phase, "seconds": times[phase], "peak_bytes": peaks[phase]} for phase in PHASES if phase in times]
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Measures how each compiler phase scales with the size of synthetic programs.", epilog="any other arguments are passed on to the compiler")
+    argparser.add_argument("--shapes", default=",".join(generate.SHAPES), help="comma separated program shapes to run (default: %(default)s)")
+    argparser.add_argument("--sizes", help="comma separated sizes to run every shape at (default: depends on the shape)")
+    argparser.add_argument("--no-output", action="store_true", help="skip write_output, so the C compiler doesn't run")
+    argparser.add_argument("-o", "--output", help="file to write the results to as JSON")
+    argparser.add_argument("--worker", nargs=2, metavar=("SHAPE", "SIZE"), help=argparse.SUPPRESS)
+    args, compile_args = argparser.parse_known_args()
+
+    sys.setrecursionlimit(100000)
+
+    if args.worker:
+        json.dump(worker(args.worker[0], int(args.worker[1]), compile_args, not args.no_output), sys.stdout)
+        sys.exit(0)
+
+    results = []
+    for shape in args.shapes.split(","):
+        sizes = list(map(int, args.sizes.split(","))) if args.sizes else DEFAULT_SIZES[shape]
+        for size in sizes:
+            command = [sys.executable, os.path.abspath(__file__), "--worker", shape, str(size)] + (["--no-output"] if args.no_output else []) + compile_args
+            results += json.loads(subprocess.run(command, stdout=subprocess.PIPE, check=True).stdout)
+
+    print(f"{'shape':>10} {'size':>6} {'phase':>13} {'time (ms)':>10} {'peak (KiB)':>11}")
+    for result in results:
+        print(f"{result['shape']:>10} {result['size']:>6} {result['phase']:>13} {result['seconds'] * 1000:>10.2f} {result['peak_bytes'] / 1024:>11.0f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": sys.version, "argv": sys.argv[1:], "results": results}, f, indent=4)
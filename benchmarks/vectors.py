@@ -0,0 +1,139 @@
+import sys, os, time, argparse, subprocess, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import main
+import backends
+
+# Kernels over arrays of N elements, run PASSES times, written with scalar loops and with vector types
+# dot adds up products of floats, which gcc doesn't vectorize without -ffast-math since it reorders the additions
+# Every product is 2, so the sum of a pass stays exact either way and both versions print the same
+# add adds arrays of bytes, which gcc can vectorize on its own
+KERNELS = {
+    "dot": {
+        "setup": """\
+    var x [N]f32
+    var y [N]f32
+    for i in 0..N {
+        x[i] = 1
+        y[i] = 2
+    }""",
+        "scalar": """\
+    var result i64 = 0
+    for pass in 0..PASSES {
+        var total f32 = 0
+        for i in 0..N {
+            total += x[i] * y[i]
+        }
+        var exact i64 = total
+        result += exact
+    }""",
+        "vector": """\
+    var result i64 = 0
+    for pass in 0..PASSES {
+        var sums = f32x8_splat(0)
+        var i uptr = 0
+        while i < N {
+            sums += f32x8_load(&x[i]) * f32x8_load(&y[i])
+            i += 8
+        }
+        var total f32 = 0
+        for lane in 0..8 {
+            total += sums[lane]
+        }
+        var exact i64 = total
+        result += exact
+    }""",
+    },
+    "add": {
+        "setup": """\
+    var a [N]u8
+    var b [N]u8
+    for i in 0..N {
+        a[i] = 1
+        b[i] = 3
+    }""",
+        "scalar": """\
+    for pass in 0..PASSES {
+        for i in 0..N {
+            a[i] = a[i] + b[i]
+        }
+    }
+    var result i64 = 0
+    for i in 0..N {
+        var e i64 = a[i]
+        result += e
+    }""",
+        "vector": """\
+    for pass in 0..PASSES {
+        var i uptr = 0
+        while i < N {
+            u8x16_store(&a[i], u8x16_load(&a[i]) + u8x16_load(&b[i]))
+            i += 16
+        }
+    }
+    var result i64 = 0
+    for i in 0..N {
+        var e i64 = a[i]
+        result += e
+    }""",
+    },
+}
+
+PROGRAM = """\
+include "stdio"
+
+fn main() i32 {{
+{setup}
+{body}
+    printf("%ld\\n", result)
+    return 0
+}}
+"""
+
+def build(source_file, output, profile):
+    args = main.make_argument_parser().parse_args([source_file, "-o", output, "--no-cache", "-p", profile])
+    main.compile_program(None, args, backends.Profiler(False))
+
+def run(output, repeat):
+    fastest = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([output], stdout=subprocess.PIPE, check=True).stdout
+        fastest = min(fastest, time.perf_counter() - start)
+    return result, fastest
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Measures kernels written with scalar loops against the same kernels written with vector types.")
+    argparser.add_argument("--kernels", default=",".join(KERNELS), help="comma separated kernels to run (default: %(default)s)")
+    argparser.add_argument("--size", type=int, default=4096, help="elements of every array, a multiple of 16 (default: %(default)s)")
+    argparser.add_argument("--passes", type=int, default=20000, help="times every kernel goes over its arrays (default: %(default)s)")
+    argparser.add_argument("--profiles", default="fast-compile,release", help="comma separated profiles to build with (default: %(default)s)")
+    argparser.add_argument("--repeat", type=int, default=3, help="runs per program, the fastest is reported (default: %(default)s)")
+    args = argparser.parse_args()
+
+    if args.size % 16 != 0:
+        argparser.error("--size has to be a multiple of 16")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'kernel':>8} {'profile':>14} {'scalar (ms)':>12} {'vector (ms)':>12} {'speedup':>8}")
+        for kernel in args.kernels.split(","):
+            for profile in args.profiles.split(","):
+                times = {}
+                results = set()
+                for version in ("scalar", "vector"):
+                    source_file = os.path.join(workdir, f"{kernel}_{version}.lang")
+                    with open(source_file, "w") as f:
+                        source = PROGRAM.format(setup=KERNELS[kernel]["setup"], body=KERNELS[kernel][version])
+                        f.write(source.replace("PASSES", str(args.passes)).replace("N", str(args.size)))
+
+                    output = os.path.join(workdir, f"{kernel}_{version}")
+                    build(source_file, output, profile)
+                    result, times[version] = run(output, args.repeat)
+                    results.add(result)
+
+                if len(results) != 1:
+                    print(f"error: the scalar and vector {kernel} kernels printed different results")
+                    sys.exit(1)
+
+                print(f"{kernel:>8} {profile:>14} {times['scalar'] * 1000:>12.2f} {times['vector'] * 1000:>12.2f} {times['scalar'] / times['vector']:>7.2f}x")
@@ -0,0 +1,191 @@
+import os, time, json, fcntl, shutil, hashlib, tempfile, argparse, contextlib
+
+DEFAULT_MAX_SIZE = 256 # In MiB
+
+# Entries and stats are written to temporary files first, named with this prefix
+# Ones left behind by a compile that was killed are removed once they're this old, in seconds
+TEMP_PREFIX = "tmp-"
+TEMP_MAX_AGE = 60 * 60
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def hash_parts(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+class BuildCache:
+    # Every entry is a directory named after its key, holding a copy of each output file
+    # Outputs are stored by their position, since the same build can be written to any path
+    # The mtime of an entry is bumped on every hit, so the oldest mtime is the least recently used
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.entries_dir = os.path.join(cache_dir, "entries")
+        self.stats_file = os.path.join(cache_dir, "stats.json")
+        self.lock_file = os.path.join(cache_dir, "lock")
+        self.max_size = max_size
+
+        os.makedirs(self.entries_dir, exist_ok=True)
+
+    def entry(self, key):
+        return os.path.join(self.entries_dir, key)
+
+    def restore(self, key, outputs):
+        entry = self.entry(key)
+
+        try:
+            for i, output in enumerate(outputs):
+                shutil.copy2(os.path.join(entry, str(i)), output)
+            os.utime(entry)
+        except FileNotFoundError:
+            # Not cached, or evicted by another compile while it was being copied
+            self.count("misses")
+            return False
+
+        self.count("hits")
+        return True
+
+    def store(self, key, outputs):
+        if os.path.exists(self.entry(key)):
+            return
+
+        tmp = self.make_temp()
+        try:
+            for i, output in enumerate(outputs):
+                shutil.copy2(output, os.path.join(tmp, str(i)))
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        self.insert(key, tmp)
+
+    # Entries other than copies of outputs, like precompiled headers and module objects, are used in place
+    # Returns the directory of an entry, marking it as recently used, or None if it isn't cached
+    def lookup(self, key):
+        entry = self.entry(key)
+        try:
+            os.utime(entry)
+        except FileNotFoundError:
+            return None
+        return entry
+
+    # A directory to write an entry into, before it's added with insert
+    def make_temp(self):
+        return tempfile.mkdtemp(dir=self.cache_dir, prefix=TEMP_PREFIX)
+
+    # Renames a directory from make_temp into place as the entry of key, so other compiles never
+    # see a half written entry, and returns the entry
+    # Compiles storing several entries can evict once they're done, so they don't evict their own entries
+    def insert(self, key, tmp, evict=True):
+        entry = self.entry(key)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # Another compile stored the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        if evict:
+            self.evict()
+        return entry
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.entries_dir):
+            path = os.path.join(self.entries_dir, name)
+            try:
+                entries.append((os.path.getmtime(path), directory_size(path), path))
+            except FileNotFoundError:
+                pass # Evicted by another compile in the meantime
+
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            self.count("evictions")
+
+        self.remove_stale_temps()
+
+    def remove_stale_temps(self):
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if name.startswith(TEMP_PREFIX) and now - os.path.getmtime(path) > TEMP_MAX_AGE:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    else:
+                        os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        shutil.rmtree(self.entries_dir, ignore_errors=True)
+        os.makedirs(self.entries_dir, exist_ok=True)
+        if os.path.exists(self.stats_file):
+            os.remove(self.stats_file)
+
+    def stats(self):
+        try:
+            with open(self.stats_file, "r") as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            stats = {}
+
+        for name in ("hits", "misses", "evictions"):
+            stats.setdefault(name, 0)
+
+        return stats
+
+    # Stats are updated by every compile using the cache, so updates are serialized with a file lock
+    @contextlib.contextmanager
+    def locked(self):
+        with open(self.lock_file, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def count(self, name):
+        with self.locked():
+            stats = self.stats()
+            stats[name] += 1
+
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix=TEMP_PREFIX)
+            with os.fdopen(fd, "w") as f:
+                json.dump(stats, f)
+            os.replace(tmp, self.stats_file)
+
+if __name__ == "__main__":
+    import main
+
+    parser = argparse.ArgumentParser(description="Manages the build cache.")
+    parser.add_argument("command", choices=("stats", "clear"), help="show hit/miss statistics or empty the cache")
+    parser.add_argument("--cache-dir", default=main.CACHE_DIR, help="directory to store cached data in (default: %(default)s)")
+    args = parser.parse_args()
+
+    build_cache = BuildCache(os.path.join(args.cache_dir, "build"))
+
+    if args.command == "stats":
+        stats = build_cache.stats()
+        entries = os.listdir(build_cache.entries_dir)
+        size = sum(directory_size(os.path.join(build_cache.entries_dir, name)) for name in entries)
+        lookups = stats["hits"] + stats["misses"]
+
+        print(f"entries: {len(entries)} ({size / (1024 * 1024):.1f} MiB)")
+        print(f"hits: {stats['hits']}")
+        print(f"misses: {stats['misses']}")
+        print(f"evictions: {stats['evictions']}")
+        print(f"hit rate: {stats['hits'] / lookups * 100 if lookups else 0:.1f}%")
+    else:
+        build_cache.clear()
@@ -0,0 +1,59 @@
+import sys
+
+from lark import Token
+
+# The syntax tree the parser builds, in place of lark's Tree and Token
+# Nodes have the same data and children a Tree would have, so code walking them doesn't change,
+# but no per instance dict or metadata, and the only position kept is the line of every token
+
+class Leaf:
+    # A token, only keeping its terminal type, text and line
+    # Leaves made after parsing, like folded constants, have no line
+    __slots__ = ("type", "value", "line")
+
+    def __init__(self, type, value, line=None):
+        self.type = type
+        self.value = value
+        self.line = line
+
+    def __repr__(self):
+        return f"Leaf({self.type!r}, {self.value!r})"
+
+    def __str__(self):
+        return self.value
+
+class Node:
+    __slots__ = ("data", "children")
+
+    # Lark calls this with the children of every rule it reduces, while parsing
+    # Tokens are turned into leaves here, their text is interned since names repeat a lot
+    # Rules starting with _ (like the ones lark makes for repetitions) are inlined into their parent,
+    # which converts their children, otherwise a long repetition would be scanned once per element
+    def __init__(self, data, children):
+        self.data = data
+        if data[0] == "_":
+            self.children = children
+        else:
+            self.children = [Leaf(child.type, sys.intern(child.value), child.line) if type(child) is Token else child for child in children]
+
+    def __repr__(self):
+        return f"Node({self.data!r}, {self.children!r})"
+
+    # The text of a node wrapping a single token, like an ident or a number
+    @property
+    def text(self):
+        return self.children[0].value
+
+    def pretty(self, indent="  "):
+        lines = []
+
+        def walk(node, depth):
+            if isinstance(node, Node):
+                lines.append(indent * depth + node.data)
+                for child in node.children:
+                    walk(child, depth + 1)
+            else:
+                lines.append(indent * depth + repr(node.value))
+
+        walk(self, 0)
+        return "\n".join(lines)
@@ -0,0 +1,175 @@
+import sys, os, json, time, ctypes, argparse, tempfile
+
+import main
+import cache
+import backends
+from backends.types import Export, Type
+
+# Loads programs as shared objects into the running Python process, calling their functions through ctypes
+# Compiling goes through the build cache like any other compile, so loading an unchanged program again
+# doesn't run gcc, and calls afterwards cost about as much as any ctypes call
+
+CTYPES_MAP = {
+    "u8": ctypes.c_uint8,
+    "u16": ctypes.c_uint16,
+    "u32": ctypes.c_uint32,
+    "u64": ctypes.c_uint64,
+    "uptr": ctypes.c_size_t,
+    "i8": ctypes.c_int8,
+    "i16": ctypes.c_int16,
+    "i32": ctypes.c_int32,
+    "i64": ctypes.c_int64,
+    "iptr": ctypes.c_ssize_t,
+    "f32": ctypes.c_float,
+    "f64": ctypes.c_double,
+    "bool": ctypes.c_bool,
+}
+
+# Libraries loaded so far, by the hash of the shared object, so loading the same one twice shares it
+loaded = {}
+
+class Library:
+    # Exported functions are attributes, ex. library.fibonacci(10)
+    # Structs, arrays and slices are ctypes structures, laid out like the C backend lays them out
+    def __init__(self, path, export):
+        self.dll = ctypes.CDLL(path)
+        self.export = export
+        self.ctypes = {} # Type -> ctypes type
+        self.fns = {} # Name -> ctypes function, set up the first time it's called
+
+    def __getattr__(self, name):
+        # Only called for attributes that don't exist, so dll, export... never get here
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return self.function(name)
+
+    def __dir__(self):
+        return list(super().__dir__()) + list(self.export.fns)
+
+    def function(self, name):
+        if name in self.fns:
+            return self.fns[name]
+
+        if name not in self.export.fns:
+            raise AttributeError(f"function isn't exported: {name}")
+        func = self.export.fns[name]
+
+        fn = getattr(self.dll, name)
+        fn.argtypes = [self.ctype(param.type) for param in func.params]
+        fn.restype = self.ctype(func.type) if func.type != None else None
+
+        self.fns[name] = fn
+        return fn
+
+    def ctype(self, type):
+        if type in self.ctypes:
+            return self.ctypes[type]
+
+        if type.ptr > 0:
+            base = self.ctype(Type(type.type, type.name, 0, type.elem, type.length))
+            # Strings are u8 pointers, passed and returned as bytes
+            if base is ctypes.c_uint8 and type.ptr == 1:
+                result = ctypes.c_char_p
+            else:
+                result = base
+                for _ in range(type.ptr):
+                    result = ctypes.POINTER(result)
+        elif type.type == "builtin":
+            if type.name not in CTYPES_MAP:
+                raise backends.CompilerBackendException(f"can't pass {type} to or from Python")
+            result = CTYPES_MAP[type.name]
+        elif type.type == "struct":
+            if type.name not in self.export.structs:
+                raise backends.CompilerBackendException(f"struct isn't exported: {type.name}")
+            # Declared before its fields, so structs can point to themselves
+            result = type_struct(type.name)
+            self.ctypes[type] = result
+            result._fields_ = [(name, self.ctype(var_type)) for name, var_type in self.export.structs[type.name].vars.items()]
+        elif type.type == "array":
+            result = type_struct(str(type))
+            result._fields_ = [("data", self.ctype(type.elem) * type.length)]
+        elif type.type == "slice":
+            result = type_struct(str(type))
+            result._fields_ = [("data", ctypes.POINTER(self.ctype(type.elem))), ("len", ctypes.c_size_t)]
+        else:
+            raise backends.CompilerBackendException(f"can't pass {type} to or from Python")
+
+        self.ctypes[type] = result
+        return result
+
+    # The ctypes structure of a struct, ex. library.struct("Point")(x=1, y=2)
+    def struct(self, name):
+        if name not in self.export.structs:
+            raise AttributeError(f"struct isn't exported: {name}")
+        return self.ctype(Type("struct", name, 0))
+
+def type_struct(name):
+    return type(name, (ctypes.Structure,), {})
+
+# Compiles file as a shared object and loads it, compile_args are passed on to the compiler
+def load(file, compile_args=[], parser=None):
+    with tempfile.TemporaryDirectory() as workdir:
+        output = os.path.join(workdir, "library.so")
+        args = main.make_argument_parser().parse_args([file, "-o", output, "--shared"] + compile_args)
+        main.compile(parser, args)
+
+        key = cache.hash_file(output)
+        if key not in loaded:
+            with open(main.interface_path(output), "r") as f:
+                export = Export.from_dict(json.load(f))
+            # Linux keeps the object mapped once it's loaded, it can be deleted with the directory
+            loaded[key] = Library(output, export)
+
+        return loaded[key]
+
+# Turns a command line argument into a value of type
+def parse_value(type, text):
+    if type.type == "builtin" and type.ptr == 0:
+        if type.name == "bool":
+            if text not in ("true", "false"):
+                raise backends.CompilerBackendException(f"not a bool: {text}")
+            return text == "true"
+        if type.name in ("f32", "f64"):
+            try:
+                return float(text)
+            except ValueError:
+                raise backends.CompilerBackendException(f"not a number: {text}")
+        try:
+            return int(text, 0)
+        except ValueError:
+            raise backends.CompilerBackendException(f"not an integer: {text}")
+    if type == Type("builtin", "u8", 1):
+        return text.encode("utf-8")
+    raise backends.CompilerBackendException(f"can't pass {type} from the command line")
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Compiles a program as a shared object and calls one of its functions in process.")
+    argparser.add_argument("file", help="file to compile")
+    argparser.add_argument("function", help="exported function to call")
+    argparser.add_argument("arguments", nargs="*", help="arguments to call the function with")
+    argparser.add_argument("--repeat", type=int, default=1, help="number of calls, the average time of a call is printed if more than one (default: %(default)s)")
+    args, compile_args = argparser.parse_known_args()
+
+    try:
+        library = load(args.file, compile_args)
+        if args.function not in library.export.fns:
+            raise backends.CompilerBackendException(f"function isn't exported: {args.function}")
+
+        params = library.export.fns[args.function].params
+        if len(params) != len(args.arguments):
+            raise backends.CompilerBackendException(f"{args.function} takes {len(params)} arguments, {len(args.arguments)} were given")
+        values = [parse_value(param.type, text) for param, text in zip(params, args.arguments)]
+
+        fn = library.function(args.function)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            result = fn(*values)
+        elapsed = time.perf_counter() - start
+    except backends.CompilerBackendException as e:
+        print(f"error: {e}")
+        sys.exit(1)
+
+    if result != None:
+        print(result)
+    if args.repeat > 1:
+        print(f"{elapsed / args.repeat * 1e6:.3f} us per call", file=sys.stderr)
@@ -1,30 +1,148 @@
-import sys
-import argparse
+import sys, os, json, glob, functools
+import argparse, tempfile, contextlib
 
 import parse
+import cache
+import modules
+import optimize
 import backends
 
-GRAMMAR_FILE_PATH = "grammar.lark"
+GRAMMAR_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "grammar.lark")
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "lang")
 
-if __name__ == "__main__":
-    backend_list_pretty = ", ".join(backends.BACKEND_MAP)
+backend_list_pretty = ", ".join(backends.BACKEND_MAP)
 
+def make_argument_parser():
     parser = argparse.ArgumentParser(description="Compiles some code.")
     parser.add_argument("file", help="file to compile")
     parser.add_argument("-b", "--backend", default="c", help="code generation backend to use. available: " + backend_list_pretty)
     parser.add_argument("-o", "--output", required=True, help="output file to write to")
+    parser.add_argument("--compiler", default="gcc", help="C compiler to use (default: %(default)s)")
+    parser.add_argument("-p", "--build-profile", default="release", choices=backends.BUILD_PROFILES, help="flags to build with. pgo builds, runs the --pgo-train command and rebuilds with the profile it collected (default: %(default)s)")
+    parser.add_argument("--pgo-train", help="shell command that trains the pgo profile, {output} is replaced with the path of the program to train")
+    parser.add_argument("--shared", action="store_true", help="build a shared object instead of a program, with the signatures of its exported functions in OUTPUT.interface.json")
     parser.add_argument("--keep-intermediate", action="store_true", help="keeps the intermediate transpiled source file (for backends that support it)")
-    args = parser.parse_args()
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="directory to store cached data in (default: %(default)s)")
+    parser.add_argument("--no-cache", action="store_true", help="don't read or write any cached data")
+    parser.add_argument("--cache-size", type=int, default=cache.DEFAULT_MAX_SIZE, help="maximum size of the build cache in MiB (default: %(default)s)")
+    parser.add_argument("--no-pch", action="store_true", help="don't compile the base code and includes into a cached precompiled header")
+    parser.add_argument("--no-fold", action="store_true", help="don't fold constant expressions or remove unreachable branches")
+    parser.add_argument("--passes", default=",".join(backends.PASSES), help="comma separated optimization passes to run, in order, on the lowered code of every function, or none. available: " + ", ".join(backends.PASSES) + " (default: %(default)s)")
+    parser.add_argument("--dump-ir", action="store_true", help="print the lowered code of every function after the passes ran on it")
+    parser.add_argument("--whole-program", action="store_true", help="make every function but main and @export ones static, so the C compiler can inline and drop them freely")
+    parser.add_argument("--bounds-check", action="store_true", help="trap when an array or slice is indexed or sliced out of its bounds")
+    parser.add_argument("-g", "--debug-info", action="store_true", help="build with debug info, which maps the program back to the lines of its source for debuggers and profilers")
+    parser.add_argument("--instrument", action="store_true", help="count the calls of every function and time them, writing a report to $LANG_PROFILE or lang-profile.json when the program exits, see report.py")
+    parser.add_argument("--memo-size", type=int, default=4096, help="number of entries in the table of @memo functions without a size (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of modules to compile at once, and of processes generating the functions of a large module (default: %(default)s)")
+    parser.add_argument("--time-phases", action="store_true", help="print the time and memory used by every phase of the compile")
+    parser.add_argument("--time-phases-json", metavar="JSON_FILE", help="like --time-phases, and also write them to JSON_FILE")
+    parser.add_argument("--trace-memory", action="store_true", help="with --time-phases, also measure the peak memory of the compiler itself. slows compiling down")
+    return parser
+
+def make_parser(args):
+    return parse.Parser(GRAMMAR_FILE_PATH, cache_dir=None if args.no_cache else args.cache_dir)
+
+# Builds depend on the grammar and on the compiler's own code, so a build made by another version of either isn't reused
+COMPILER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+@functools.lru_cache(maxsize=None)
+def compiler_hash():
+    sources = [GRAMMAR_FILE_PATH] + sorted(glob.glob(os.path.join(COMPILER_DIR, "*.py")) + glob.glob(os.path.join(COMPILER_DIR, "backends", "*.py")))
+    return cache.hash_parts(*[cache.hash_file(path) for path in sources])
+
+# Runs the passes between parsing and generating code
+def prepare(ast, args):
+    if not args.no_fold:
+        ast = optimize.ConstantFolder().fold(ast)
+    return ast
+
+# Every option prepare depends on, for cache keys
+def prepare_key(args):
+    return (args.no_fold,)
+
+# Where the signatures of a shared object are written, for library.py
+def interface_path(output):
+    return output + ".interface.json"
 
+# Objects and interfaces of modules are kept in the build cache,
+# or in one only lasting for the compile if caching is off
+@contextlib.contextmanager
+def modules_cache(build_cache):
+    if build_cache != None:
+        yield build_cache
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            yield cache.BuildCache(tmp, float("inf"))
+
+# parser can be None, then it only gets built if something has to be parsed
+def compile(parser, args):
+    profiler = backends.Profiler(args.time_phases or args.time_phases_json != None, args.trace_memory)
+
+    with profiler:
+        compile_program(parser, args, profiler)
+
+    if profiler.enabled:
+        profiler.report(args.time_phases_json)
+
+def compile_program(parser, args, profiler):
     args.backend = args.backend.lower()
 
     if args.backend not in backends.BACKEND_MAP:
-        print(f"error: {args.backend} isn't a valid backend. available: {backend_list_pretty}")
-        sys.exit(1)
-    
-    parser = parse.Parser(GRAMMAR_FILE_PATH)
-    ast = parser.parse_file(args.file)
+        raise backends.CompilerBackendException(f"{args.backend} isn't a valid backend. available: {backend_list_pretty}")
+
+    build_cache = None if args.no_cache else cache.BuildCache(os.path.join(args.cache_dir, "build"), args.cache_size * 1024 * 1024)
 
     backend = backends.BACKEND_MAP[args.backend](args)
-    backend.generate(ast)
-    backend.write_output()
\ No newline at end of file
+    backend.profiler = profiler
+    backend.build_cache = build_cache
+
+    def get_parser():
+        nonlocal parser
+        if parser == None:
+            with profiler.phase("parser"):
+                parser = make_parser(args)
+        return parser
+
+    with modules_cache(build_cache) as module_cache:
+        builder = modules.ModuleBuilder(get_parser, lambda ast: prepare(ast, args), compiler_hash(), module_cache, args.jobs, profiler, build_cache != None)
+
+        with profiler.phase("resolve"):
+            program = builder.resolve(args.file)
+
+        # Programs split into modules only produce the linked output
+        outputs = backend.outputs() if len(program) == 1 else [args.output]
+        if args.shared:
+            outputs.append(interface_path(args.output))
+
+        key = None
+        if build_cache != None and backend.cache_key() != None:
+            key = cache.hash_parts([module.source_hash for module in program], compiler_hash(), prepare_key(args), args.backend, backend.cache_key())
+
+            with profiler.phase("cache_restore"):
+                if build_cache.restore(key, outputs):
+                    return
+
+        if len(program) == 1:
+            backend.run_generate(builder.prepare(program[0]))
+            backend.run_write_output()
+            interface = backend.interface()
+        else:
+            with profiler.phase("build"):
+                interface = builder.build(program, backends.BACKEND_MAP[args.backend], args, prepare_key(args))
+
+        if args.shared:
+            modules.write_atomic(interface_path(args.output), json.dumps(interface.to_dict()))
+
+        if key != None:
+            with profiler.phase("cache_store"):
+                build_cache.store(key, outputs)
+
+if __name__ == "__main__":
+    args = make_argument_parser().parse_args()
+
+    try:
+        compile(None, args)
+    except backends.CompilerBackendException as e:
+        print(f"error: {e}")
+        sys.exit(1)
@@ -0,0 +1,178 @@
+import os, json, shutil, argparse, tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import cache
+from backends import CompilerBackendException, Profiler
+from backends.types import Export
+
+MODULE_EXTENSION = ".lang"
+
+class Module:
+    def __init__(self, path):
+        self.path = path
+        self.source_hash = cache.hash_file(path)
+        self.ast = None # Only set if the module had to be parsed
+        self.imports = [] # Modules imported by this one
+
+def get_imports(ast):
+    # import "foo" -> foo
+    return [node.text[1:-1] for node in ast.children if node.data == "import"]
+
+def resolve_import(importer_path, name):
+    # Imports are relative to the directory of the importing module
+    return os.path.normpath(os.path.join(os.path.dirname(importer_path), name + MODULE_EXTENSION))
+
+def write_atomic(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "w") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+class ModuleBuilder:
+    # Every module is compiled to its own object file, plus an interface file holding its Export
+    # Both are stored in an entry of build_cache, keyed on everything that changes them, so unchanged
+    # modules are never parsed or compiled again, and old ones are evicted like any other build
+    def __init__(self, get_parser, prepare, compiler_hash, build_cache, jobs=None, profiler=None, pch=True):
+        self.get_parser = get_parser # Called only once a module actually needs parsing
+        self.prepare_ast = prepare # Passes to run on a parsed module before generating code for it
+        self.compiler_hash = compiler_hash
+        self.build_cache = build_cache
+        self.jobs = jobs if jobs != None else os.cpu_count()
+        self.profiler = profiler if profiler != None else Profiler()
+        # Whether the backends of modules keep precompiled headers in build_cache too
+        self.pch = pch
+
+    def key(self, *parts):
+        return cache.hash_parts(self.compiler_hash, *parts)
+
+    def parse(self, module):
+        if module.ast == None:
+            parser = self.get_parser()
+            with self.profiler.phase("parse"):
+                module.ast = parser.parse_file(module.path)
+        return module.ast
+
+    def prepare(self, module):
+        ast = self.parse(module)
+        with self.profiler.phase("prepare"):
+            return self.prepare_ast(ast)
+
+    # Reads a file of a cached entry, or returns None if it isn't cached or another compile just evicted it
+    def read_entry(self, key, name):
+        entry = self.build_cache.lookup(key)
+        if entry == None:
+            return None
+        try:
+            with open(os.path.join(entry, name), "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def get_import_names(self, module):
+        key = self.key("imports", module.source_hash)
+        names = self.read_entry(key, "imports.json")
+
+        if names != None:
+            return json.loads(names)
+
+        names = get_imports(self.parse(module))
+        tmp = self.build_cache.make_temp()
+        with open(os.path.join(tmp, "imports.json"), "w") as f:
+            json.dump(names, f)
+        self.build_cache.insert(key, tmp, evict=False)
+        return names
+
+    # Returns every module the root depends on, dependencies always coming before their dependents
+    def resolve(self, root_path):
+        modules = {}
+        order = []
+
+        def visit(path, stack):
+            if path in stack:
+                cycle = stack[stack.index(path):] + [path]
+                raise CompilerBackendException("import cycle: " + " -> ".join(cycle))
+            if path in modules:
+                return modules[path]
+
+            if not os.path.exists(path):
+                if len(stack) == 0:
+                    raise CompilerBackendException(f"source file doesn't exist: {path}")
+                raise CompilerBackendException(f"module doesn't exist: {path} (imported by {stack[-1]})")
+
+            module = Module(path)
+            for name in self.get_import_names(module):
+                module.imports.append(visit(resolve_import(path, name), stack + [path]))
+
+            modules[path] = module
+            order.append(module)
+            return module
+
+        visit(os.path.normpath(root_path), [])
+        return order
+
+    def build(self, modules, backend_class, args, prepare_key):
+        interfaces = {} # Module path -> (Export, interface hash)
+        objects = []
+        futures = []
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            for module in modules:
+                backend_args = argparse.Namespace(**vars(args))
+                backend_args.file = module.path
+
+                backend = backend_class(backend_args)
+                backend.profiler = self.profiler
+                backend.build_cache = self.build_cache if self.pch else None
+
+                key = self.key(
+                    module.source_hash,
+                    prepare_key,
+                    args.backend,
+                    backend.cache_key(),
+                    [interfaces[dependency.path][1] for dependency in module.imports])
+                interface = self.read_entry(key, "interface.json")
+
+                if interface != None:
+                    # Dependents type check against the interface, the module isn't parsed again
+                    export = Export.from_dict(json.loads(interface))
+                else:
+                    for dependency in module.imports:
+                        backend.add_import(interfaces[dependency.path][0])
+
+                    backend.run_generate(self.prepare(module))
+
+                    export = backend.interface()
+                    interface = json.dumps(export.to_dict())
+
+                    # Generating is done in order, but the object files are compiled in parallel
+                    futures.append(pool.submit(self.write_module, backend, key, interface))
+
+                interfaces[module.path] = (export, cache.hash_parts(interface))
+                objects.append(os.path.join(self.build_cache.entry(key), "object.o"))
+
+            for future in futures:
+                future.result()
+
+        backend = backend_class(args)
+        backend.profiler = self.profiler
+        backend.run_link(objects)
+
+        # Only evicted once the program is linked, so none of its own modules are
+        self.build_cache.evict()
+
+        # What the program exports is what its root module does
+        return interfaces[modules[-1].path][0]
+
+    # The object file and interface only appear in the cache together, once both are written
+    def write_module(self, backend, key, interface):
+        tmp = self.build_cache.make_temp()
+
+        try:
+            backend.run_write_object(os.path.join(tmp, "object.o"))
+            with open(os.path.join(tmp, "interface.json"), "w") as f:
+                f.write(interface)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        self.build_cache.insert(key, tmp, evict=False)
@@ -0,0 +1,210 @@
+from ir import Node, Leaf
+from backends import CompilerBackendException
+from backends.types import INT_RANGES
+from backends.backend_c import FUNCTION_TYPES
+
+# Integer literals are C ints, so folding follows i32 semantics
+# Results outside of its range are left alone, since signed overflow is undefined in C
+LITERAL_INT_RANGE = INT_RANGES["i32"]
+
+def make_number(value):
+    return Node("expression_value", [Node("number", [Leaf("SIGNED_INT", str(value))])])
+
+def make_bool(value):
+    return Node("expression_value", [Node("true" if value else "false", [])])
+
+def get_literal(ast):
+    # Returns the Python value of a literal expression, or None if it isn't one
+    if ast.data != "expression_value":
+        return None
+
+    value = ast.children[0]
+
+    if value.data == "number":
+        number = int(value.text)
+        if LITERAL_INT_RANGE[0] <= number <= LITERAL_INT_RANGE[1]:
+            return number
+    elif value.data == "true":
+        return True
+    elif value.data == "false":
+        return False
+
+    return None
+
+def divide(l, r):
+    # C division truncates towards zero, Python's floors
+    quotient = abs(l) // abs(r)
+    return quotient if (l < 0) == (r < 0) else -quotient
+
+class ConstantFolder:
+    # Folds integer and boolean arithmetic on literals and removes branches that can never run
+    # Trees are modified in place
+    def fold(self, ast):
+        if ast.data != "program":
+            raise CompilerBackendException("invalid program type: " + ast.data)
+
+        ast.children = self.fold_statements(ast.children)
+        return ast
+
+    def fold_statements(self, nodes):
+        folded = []
+
+        for node in nodes:
+            if node.data in FUNCTION_TYPES:
+                self.fold_function(node)
+            elif node.data == "struct":
+                for child in node.children[1].children:
+                    if child.data in FUNCTION_TYPES:
+                        self.fold_function(child)
+            elif node.data in ("include", "import"):
+                pass
+            else:
+                node = self.fold_statement(node)
+
+            if node == None:
+                continue
+
+            folded.append(node)
+
+            # Nothing after a return can run
+            if node.data == "statement_return":
+                break
+
+        return folded
+
+    def fold_function(self, ast):
+        # Skip past any annotations
+        while ast.data == "function_annotated":
+            ast = ast.children[1]
+        self.fold_block(ast.children[-1])
+
+    def fold_block(self, ast):
+        ast.children = self.fold_statements(ast.children)
+        return ast
+
+    # Returns the folded statement, or None if it can be removed
+    def fold_statement(self, ast):
+        if ast.data == "statement_if":
+            # Children are pairs of condition and block, with an optional else block at the end
+            branches = []
+            for i in range(0, len(ast.children) - 1, 2):
+                branches.append((self.fold_expression(ast.children[i]), self.fold_block(ast.children[i + 1])))
+            else_block = self.fold_block(ast.children[-1]) if len(ast.children) % 2 == 1 else None
+
+            children = []
+            for condition, block in branches:
+                value = get_literal(condition)
+
+                if value is False:
+                    continue
+                elif value is True:
+                    # Every branch after this one is unreachable
+                    else_block = block
+                    break
+
+                children += [condition, block]
+
+            if len(children) == 0:
+                # Only the else block is left, keep it as a block so its scope stays the same
+                return else_block
+
+            if else_block != None:
+                children.append(else_block)
+
+            ast.children = children
+            return ast
+
+        elif ast.data == "statement_while":
+            ast.children[0] = self.fold_expression(ast.children[0])
+            self.fold_block(ast.children[1])
+
+            if get_literal(ast.children[0]) is False:
+                return None
+            return ast
+
+        elif ast.data in ("statement_for", "statement_parallel_for", "statement_loop"):
+            self.fold_block(ast.children[-1])
+            return ast
+
+        elif ast.data == "statement_for_each":
+            ast.children[1] = self.fold_expression(ast.children[1])
+            self.fold_block(ast.children[-1])
+            return ast
+
+        elif ast.data in ("statement", "statement_return"):
+            ast.children[0] = self.fold_expression(ast.children[0])
+            return ast
+
+        elif ast.data == "statement_variable_define_auto":
+            ast.children[1] = self.fold_expression(ast.children[1])
+            return ast
+
+        elif ast.data == "statement_variable_define":
+            ast.children[2] = self.fold_expression(ast.children[2])
+            return ast
+
+        elif ast.data == "statement_variable_assign":
+            ast.children[1] = self.fold_expression(ast.children[1])
+            return ast
+
+        else:
+            return ast
+
+    def fold_expression(self, ast):
+        if not isinstance(ast, Node):
+            return ast
+
+        if ast.data == "expression_op_bin":
+            ast.children[0] = self.fold_expression(ast.children[0])
+            ast.children[2] = self.fold_expression(ast.children[2])
+
+            l = get_literal(ast.children[0])
+            r = get_literal(ast.children[2])
+            if l == None or r == None or type(l) != type(r):
+                return ast
+
+            op = ast.children[1].data
+
+            if isinstance(l, bool):
+                if op == "equal":
+                    return make_bool(l == r)
+                elif op == "not_equal":
+                    return make_bool(l != r)
+                return ast
+
+            if op == "add":
+                value = l + r
+            elif op == "subtract":
+                value = l - r
+            elif op == "multiply":
+                value = l * r
+            elif op == "divide":
+                if r == 0:
+                    return ast
+                value = divide(l, r)
+            elif op == "equal":
+                return make_bool(l == r)
+            elif op == "not_equal":
+                return make_bool(l != r)
+            elif op == "less_than":
+                return make_bool(l < r)
+            elif op == "greater_than":
+                return make_bool(l > r)
+            else: # Assignment operators
+                return ast
+
+            if not LITERAL_INT_RANGE[0] <= value <= LITERAL_INT_RANGE[1]:
+                return ast
+
+            return make_number(value)
+
+        elif ast.data in ("expression_ref", "expression_deref", "expression_dot", "expression_method_call", "expression_function_call", "expression_index", "expression_slice", "expression_array"):
+            ast.children = [self.fold_expression(child) for child in ast.children]
+            return ast
+
+        elif ast.data == "argument_list":
+            ast.children = [self.fold_expression(child) for child in ast.children]
+            return ast
+
+        else:
+            return ast
@@ -1,9 +1,35 @@
+import os, glob, hashlib, contextlib
+
 from lark import Lark
 
+import ir
+
+def grammar_hash(grammar):
+    return hashlib.sha256(grammar.encode("utf-8")).hexdigest()
+
 class Parser:
-    def __init__(self, grammar_file_path):
+    def __init__(self, grammar_file_path, cache_dir=None):
         with open(grammar_file_path, "r") as f:
-            self.lark = Lark(f.read(), start="program", parser="lalr")
+            grammar = f.read()
+
+        self.grammar_hash = grammar_hash(grammar)
+
+        if cache_dir != None:
+            # The LALR tables are pickled by lark, keyed on the grammar hash
+            # Any cached tables from older versions of the grammar are stale, so remove them
+            os.makedirs(cache_dir, exist_ok=True)
+            cache = os.path.join(cache_dir, f"parser-{self.grammar_hash}.lark")
+
+            for stale in glob.glob(os.path.join(cache_dir, "parser-*.lark")):
+                # Another compiler or the server may have removed it first
+                if stale != cache:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(stale)
+        else:
+            cache = False
+
+        # The tree is built out of ir.Node while parsing, lark's own Tree is never made
+        self.lark = Lark(grammar, start="program", parser="lalr", cache=cache, tree_class=ir.Node)
 
     def parse(self, code, start="program"):
         return self.lark.parse(code, start=start)
@@ -11,4 +37,4 @@ class Parser:
     def parse_file(self, file_path):
         with open(file_path, "r") as f:
             ast = self.parse(f.read())
-        return ast
\ No newline at end of file
+        return ast
@@ -0,0 +1,72 @@
+import os, sys, json, argparse, functools
+
+# Reads the report a program built with --instrument writes when it exits, and renders it against its source
+# Times include the time spent in the functions a function calls, so they're shown as a share of the
+# longest one, which is main in a program that returned from it
+
+def load(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+# The lines of a source file, or None if it's gone
+@functools.lru_cache(maxsize=None)
+def read_source(path):
+    try:
+        with open(path, "r") as f:
+            return f.read().split("\n")
+    except OSError:
+        return None
+
+def source_line(path, line):
+    lines = read_source(path)
+    if lines == None or not 0 < line <= len(lines):
+        return ""
+    return lines[line - 1].strip()
+
+def print_table(report, sort, limit):
+    functions = sorted(report["functions"], key=lambda function: function[sort], reverse=True)[:limit]
+    longest = max((function["time"] for function in report["functions"]), default=0) or 1
+    unit = report["unit"]
+
+    print(f"{'time':>7} {unit:>14} {'calls':>10} {unit + '/call':>14}  function")
+    for function in functions:
+        location = f"{os.path.relpath(function['file'])}:{function['line']}"
+        print(f"{function['time'] / longest * 100:>6.1f}% {function['time']:>14} {function['calls']:>10} {function['time'] // function['calls']:>14}  {function['name']} ({location}) {source_line(function['file'], function['line'])}")
+
+# Prints every source file with the calls and time of a function next to the line it's defined on
+def print_annotated(report):
+    longest = max((function["time"] for function in report["functions"]), default=0) or 1
+    by_file = {}
+    for function in report["functions"]:
+        by_file.setdefault(function["file"], {})[function["line"]] = function
+
+    for path, functions in sorted(by_file.items()):
+        print(f"{os.path.relpath(path)}:")
+        lines = read_source(path)
+        if lines == None:
+            print("  source not found")
+            continue
+
+        for number, text in enumerate(lines, 1):
+            function = functions.get(number)
+            margin = f"{function['calls']:>10} {function['time'] / longest * 100:>6.1f}%" if function != None else " " * 18
+            print(f"{margin} {number:>5}  {text}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shows the report of a program built with --instrument.")
+    parser.add_argument("report", nargs="?", default="lang-profile.json", help="report the program wrote (default: %(default)s)")
+    parser.add_argument("--sort", choices=("time", "calls"), default="time", help="what to sort functions by (default: %(default)s)")
+    parser.add_argument("-n", "--limit", type=int, default=None, help="only show this many functions")
+    parser.add_argument("--annotate", action="store_true", help="print the source with the calls and time of every function next to its definition instead")
+    args = parser.parse_args()
+
+    try:
+        report = load(args.report)
+    except (OSError, ValueError) as e:
+        print(f"error: can't read {args.report}: {e}")
+        sys.exit(1)
+
+    if args.annotate:
+        print_annotated(report)
+    else:
+        print_table(report, args.sort, args.limit)
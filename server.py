@@ -0,0 +1,167 @@
+import io, sys, os, json, socket, socketserver, argparse, threading, traceback, contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+import backends
+
+SOCKET_PATH = os.path.join(main.CACHE_DIR, "server.sock")
+
+# Protocol: the client sends one JSON line {"jobs": [argv, ...]}, where each argv is the
+# argument list main.py would have been called with. The server answers with one JSON line
+# holding a list of {"file", "ok", "error", "output"} results, in the same order as the jobs.
+# output is what the job printed, like warnings or --time-phases, and failed jobs also have it in error
+
+# Stands in for stdout and stderr, so what a job prints goes to the buffer of the thread running it
+# rather than the server's log, everything else still goes to the stream it replaced
+class ThreadOutput:
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self.local, "buffer", None)
+        return (buffer if buffer != None else self.stream).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    @contextlib.contextmanager
+    def capture(self, buffer):
+        self.local.buffer = buffer
+        try:
+            yield
+        finally:
+            self.local.buffer = None
+
+class CompileRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+
+        # Jobs from every connection share the server's worker pool
+        futures = [self.server.pool.submit(self.server.run_job, argv) for argv in request["jobs"]]
+        results = [future.result() for future in futures]
+
+        self.wfile.write(json.dumps(results).encode("utf-8") + b"\n")
+
+class CompileServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, jobs, args):
+        self.argument_parser = main.make_argument_parser()
+        # The parser is built once and kept warm for every job
+        self.parser = main.make_parser(args)
+        # gcc does the heavy lifting in a subprocess, so threads are enough to keep every core busy
+        self.pool = ThreadPoolExecutor(max_workers=jobs)
+
+        super().__init__(socket_path, CompileRequestHandler)
+
+    def run_job(self, argv):
+        try:
+            args = self.argument_parser.parse_args(argv)
+        except SystemExit:
+            return {"file": None, "ok": False, "error": "invalid arguments: " + " ".join(argv), "output": ""}
+
+        output = io.StringIO()
+        try:
+            with sys.stdout.capture(output), sys.stderr.capture(output):
+                main.compile(self.parser, args)
+        except backends.CompilerBackendException as e:
+            error = str(e)
+        except Exception:
+            error = traceback.format_exc()
+        else:
+            return {"file": args.file, "ok": True, "error": None, "output": output.getvalue()}
+
+        # What the job printed before it failed comes first, like it would in a terminal
+        return {"file": args.file, "ok": False, "error": output.getvalue() + error, "output": output.getvalue()}
+
+# Whether a server is listening on the socket, rather than it being left over by one that died
+def is_listening(socket_path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            return False
+    return True
+
+def serve(args):
+    if os.path.exists(args.socket):
+        if is_listening(args.socket):
+            print(f"error: a server is already listening on {args.socket}")
+            sys.exit(1)
+        os.remove(args.socket)
+    os.makedirs(os.path.dirname(os.path.abspath(args.socket)), exist_ok=True)
+
+    # Every job gets what it prints back, see run_job
+    sys.stdout = ThreadOutput(sys.stdout)
+    sys.stderr = ThreadOutput(sys.stderr)
+
+    with CompileServer(args.socket, args.jobs, args) as server:
+        print(f"listening on {args.socket} with {args.jobs} workers")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.pool.shutdown()
+            os.remove(args.socket)
+
+def send_jobs(socket_path, jobs):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(json.dumps({"jobs": jobs}).encode("utf-8") + b"\n")
+
+        with client.makefile("rb") as f:
+            return json.loads(f.readline())
+
+def batch(args, extra):
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    # Outputs are named after the files, so two files with the same name would overwrite each other
+    names = {}
+    for file in args.files:
+        name = os.path.splitext(os.path.basename(file))[0]
+        if name in names:
+            print(f"error: {names[name]} and {file} would both be compiled to {os.path.join(args.output_dir, name)}")
+            return 1
+        names[name] = file
+
+    jobs = []
+    for name, file in names.items():
+        output = os.path.join(args.output_dir, name)
+        # The server may run from another directory, so only send absolute paths
+        jobs.append([os.path.abspath(file), "-o", os.path.abspath(output)] + extra)
+
+    failed = 0
+    for result in send_jobs(args.socket, jobs):
+        if not result["ok"]:
+            failed += 1
+            print(f"error: {result['file']}: {result['error']}")
+        elif result["output"]:
+            sys.stderr.write(result["output"])
+
+    return failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keeps the compiler warm and compiles batches of files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="start a compile server")
+    serve_parser.add_argument("-s", "--socket", default=SOCKET_PATH, help="unix socket to listen on (default: %(default)s)")
+    serve_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of compile jobs to run at once (default: %(default)s)")
+    serve_parser.add_argument("--cache-dir", default=main.CACHE_DIR, help="directory to store cached data in (default: %(default)s)")
+    serve_parser.add_argument("--no-cache", action="store_true", help="don't read or write any cached data")
+
+    batch_parser = subparsers.add_parser("batch", help="send files to a running compile server", epilog="any other arguments are passed on to every compile job")
+    batch_parser.add_argument("files", nargs="+", help="files to compile")
+    batch_parser.add_argument("-s", "--socket", default=SOCKET_PATH, help="unix socket of the server (default: %(default)s)")
+    batch_parser.add_argument("-d", "--output-dir", default=".", help="directory to write the outputs to (default: %(default)s)")
+
+    args, extra = parser.parse_known_args()
+
+    if args.command == "serve":
+        if extra:
+            parser.error("unrecognized arguments: " + " ".join(extra))
+        serve(args)
+    else:
+        sys.exit(1 if batch(args, extra) else 0)
@@ -0,0 +1,51 @@
+import os, sys, subprocess
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Programs are compiled and run like a user would, through main.py and vm.py, without the build cache
+# so tests don't depend on each other or on what's cached
+class Programs:
+    def __init__(self, workdir):
+        self.workdir = workdir
+        self.count = 0
+
+    def write(self, source):
+        self.count += 1
+        path = os.path.join(self.workdir, f"program{self.count}.lang")
+        with open(path, "w") as f:
+            f.write(source)
+        return path
+
+    def compile(self, source, *args):
+        path = self.write(source)
+        output = path[:-len(".lang")]
+        result = subprocess.run([sys.executable, os.path.join(ROOT, "main.py"), path, "-o", output, "--no-cache", *args], cwd=self.workdir, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise AssertionError(f"compiling failed:\n{result.stdout}{result.stderr}")
+        return output
+
+    # Output of a program built by the C backend
+    def run_c(self, source, *args, env=None):
+        output = self.compile(source, *args)
+        return subprocess.run([output], cwd=self.workdir, capture_output=True, text=True, check=True, env=env).stdout
+
+    # Output of a program run by the vm
+    def run_vm(self, source, *args):
+        path = self.write(source)
+        result = subprocess.run([sys.executable, os.path.join(ROOT, "vm.py"), path, "--no-cache", *args], cwd=self.workdir, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise AssertionError(f"running failed:\n{result.stdout}{result.stderr}")
+        return result.stdout
+
+    # The error the compiler stopped with
+    def error(self, source, *args):
+        path = self.write(source)
+        result = subprocess.run([sys.executable, os.path.join(ROOT, "main.py"), path, "-o", path[:-len(".lang")], "--no-cache", *args], cwd=self.workdir, capture_output=True, text=True)
+        assert result.returncode != 0, "the program compiled"
+        return result.stdout + result.stderr
+
+@pytest.fixture
+def programs(tmp_path):
+    return Programs(str(tmp_path))
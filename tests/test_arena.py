@@ -0,0 +1,56 @@
+ARENA = """\
+include "stdio"
+
+struct Node {
+    value i64
+    next Node*
+}
+
+fn push(nodes arena*, head Node*, value i64) Node* {
+    var node = new Node in nodes
+    node.value = value
+    node.next = head
+    return node
+}
+
+fn main() i32 {
+    var nodes arena
+    var head Node* = null
+    for i in 0..100000 {
+        head = push(&nodes, head, i)
+    }
+    var total i64 = 0
+    for i in 0..100000 {
+        total += head.value
+        head = head.next
+    }
+    nodes.free()
+
+    var node = new Node in nodes
+    printf("%ld %ld\\n", total, node.value)
+    return 0
+}
+"""
+
+def test_arena(programs):
+    assert programs.run_c(ARENA) == "4999950000 0\n"
+
+def test_arena_copies_are_rejected(programs):
+    assert "can't be copied" in programs.error("fn main() i32 {\n    var a arena\n    var b = a\n    return 0\n}\n")
+    assert "can't be copied" in programs.error("struct S {\n    a arena\n}\n\nfn main() i32 {\n    return 0\n}\n")
+
+def test_arenas_cant_be_shared_by_parallel_for(programs):
+    source = """\
+struct S {
+    x i32
+}
+
+fn main() i32 {
+    var nodes arena
+    parallel for i in 0..10 {
+        var s = new S in nodes
+    }
+    return 0
+}
+"""
+    assert "data race: every iteration of parallel for i uses arena nodes" in programs.error(source)
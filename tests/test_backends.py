@@ -0,0 +1,112 @@
+import os, glob
+
+import pytest
+
+from conftest import ROOT
+
+# Programs the C backend and the vm have to agree on, the vm being the reference for what C does
+PROGRAMS = {
+    "integer_wrap": """\
+include "stdio"
+
+fn main() i32 {
+    var a u8 = 250
+    a += 10
+    var b u16 = 0
+    b -= 1
+    var c u32 = 4000000000
+    c *= 3
+    var d i8 = 100
+    var e i8 = d + d
+    var f u64 = 0
+    f -= 1
+    printf("%u %u %u %d %lu\\n", a, b, c, e, f)
+    return 0
+}
+""",
+    "signed_division": """\
+include "stdio"
+
+fn divide(a i32, b i32) i32 {
+    return a / b
+}
+
+fn main() i32 {
+    printf("%d %d %d %d\\n", divide(7, 2), divide(-7, 2), divide(7, -2), divide(-7, -2))
+    var x i64 = -9
+    var y i64 = x / 4
+    printf("%ld\\n", y)
+    return 0
+}
+""",
+    "structs": """\
+include "stdio"
+
+struct Point {
+    x i32
+    y i32
+
+    fn sum() i32 {
+        return self.x + self.y
+    }
+
+    fn __add__(rhs Point*) Point {
+        var point Point
+        point.x = self.x + rhs.x
+        point.y = self.y + rhs.y
+        return point
+    }
+}
+
+fn make(x i32, y i32) Point {
+    var point Point
+    point.x = x
+    point.y = y
+    return point
+}
+
+fn main() i32 {
+    var a = make(1, 2)
+    var b = a
+    b.x = 10
+    var c = a + b + make(100, 200)
+    printf("%d %d %d %d\\n", a.x, b.x, c.sum(), make(3, 4).sum())
+    return 0
+}
+""",
+    "slices": """\
+include "stdio"
+
+fn sum(values []i32) i32 {
+    var total i32 = 0
+    for value in values {
+        total += value
+    }
+    return total
+}
+
+fn main() i32 {
+    var values [6]i32 = [1, 2, 3, 4, 5, 6]
+    var middle = values[1..5]
+    middle[0] = 20
+    printf("%d %d %lu %d\\n", sum(values[0..6]), sum(middle), middle.len, values[1])
+    return 0
+}
+""",
+}
+
+@pytest.mark.parametrize("name", sorted(PROGRAMS))
+def test_c_matches_vm(programs, name):
+    assert programs.run_c(PROGRAMS[name]) == programs.run_vm(PROGRAMS[name])
+
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(ROOT, "examples", "*.lang"))), ids=os.path.basename)
+def test_examples_match_vm(programs, path):
+    with open(path, "r") as f:
+        source = f.read()
+    assert programs.run_c(source) == programs.run_vm(source)
+
+def test_integer_wrap(programs):
+    assert programs.run_vm(PROGRAMS["integer_wrap"]) == "4 65535 3410065408 -56 18446744073709551615\n"
+
+def test_signed_division_truncates(programs):
+    assert programs.run_c(PROGRAMS["signed_division"]) == "3 -3 -3 3\n-2\n"
@@ -0,0 +1,53 @@
+import os, sys, subprocess
+
+from conftest import ROOT
+
+PROGRAM = """\
+include "stdio"
+
+fn main() i32 {
+    printf("VALUE\\n")
+    return 0
+}
+"""
+
+# Builds go through the cache in a directory of their own, stats are read back through cache.py
+def build(programs, path, *args):
+    output = path[:-len(".lang")]
+    subprocess.run([sys.executable, os.path.join(ROOT, "main.py"), path, "-o", output, "--cache-dir", "cache", *args], cwd=programs.workdir, capture_output=True, text=True, check=True)
+    return subprocess.run([output], cwd=programs.workdir, capture_output=True, text=True, check=True).stdout
+
+def stats(programs, *command):
+    result = subprocess.run([sys.executable, os.path.join(ROOT, "cache.py"), "--cache-dir", "cache", *(command or ["stats"])], cwd=programs.workdir, capture_output=True, text=True, check=True)
+    lines = [line.split(": ") for line in result.stdout.splitlines() if ": " in line]
+    return {key: value.split(" ")[0] for key, value in lines}
+
+def test_rebuild_hits_the_cache(programs):
+    path = programs.write(PROGRAM.replace("VALUE", "1"))
+    assert build(programs, path) == "1\n"
+    assert stats(programs)["misses"] == "1"
+    assert stats(programs)["hits"] == "0"
+    os.remove(path[:-len(".lang")])
+    assert build(programs, path) == "1\n"
+    assert stats(programs)["hits"] == "1"
+
+def test_changes_miss_the_cache(programs):
+    path = programs.write(PROGRAM.replace("VALUE", "1"))
+    build(programs, path)
+    with open(path, "w") as f:
+        f.write(PROGRAM.replace("VALUE", "2"))
+    assert build(programs, path) == "2\n"
+    build(programs, path, "-p", "fast-compile")
+    result = stats(programs)
+    assert (result["hits"], result["misses"]) == ("0", "3")
+
+def test_clear_and_eviction(programs):
+    path = programs.write(PROGRAM.replace("VALUE", "1"))
+    build(programs, path)
+    assert stats(programs)["entries"] != "0"
+    stats(programs, "clear")
+    assert stats(programs)["entries"] == "0"
+    build(programs, path, "--cache-size", "0")
+    result = stats(programs)
+    assert result["entries"] == "0"
+    assert result["evictions"] != "0"
@@ -0,0 +1,35 @@
+USED_BEFORE_DEFINED = """\
+include "stdio"
+
+struct Polygon {
+    first Point
+    rest [3]Point
+}
+
+fn main() i32 {
+    var polygon Polygon
+    polygon.first = origin()
+    polygon.rest[2].y = 7
+    printf("%d %d\\n", polygon.first.x, polygon.rest[2].y)
+    return 0
+}
+
+fn origin() Point {
+    var point Point
+    point.x = 5
+    return point
+}
+
+struct Point {
+    x i32
+    y i32
+}
+"""
+
+def test_structs_and_functions_used_before_defined(programs):
+    assert programs.run_c(USED_BEFORE_DEFINED) == "5 7\n"
+    assert programs.run_vm(USED_BEFORE_DEFINED) == "5 7\n"
+
+def test_struct_containing_itself_is_rejected(programs):
+    source = "struct A {\n    b B\n}\n\nstruct B {\n    a [2]A\n}\n\nfn main() i32 {\n    return 0\n}\n"
+    assert "struct contains itself: A -> B -> A" in programs.error(source)
@@ -0,0 +1,34 @@
+PROGRAM = """\
+include "stdio"
+
+fn main() i32 {
+    var a i32 = 7 * 6 - 0 - 2
+    var b i32 = -7 / 2
+    var c = 3 < 4
+    if 1 > 2 {
+        UNREACHABLE
+    } elif 2 == 2 {
+        printf("%d %d %d\\n", a, b, c)
+    } else {
+        UNREACHABLE
+    }
+    while 1 == 2 {
+        UNREACHABLE
+    }
+    return 0
+    UNREACHABLE
+}
+"""
+
+def test_folding_keeps_the_output(programs):
+    source = PROGRAM.replace("UNREACHABLE", "a += 1")
+    assert programs.run_c(source) == "56 -3 1\n"
+    assert programs.run_c(source, "--no-fold") == "56 -3 1\n"
+    assert programs.run_vm(source) == "56 -3 1\n"
+
+def test_unreachable_code_is_removed(programs):
+    # missing isn't defined anywhere, so the program only links if every call to it is gone.
+    # -O0 keeps the C compiler from removing them itself
+    source = PROGRAM.replace("UNREACHABLE", "missing()")
+    assert programs.run_c(source, "-p", "fast-compile") == "56 -3 1\n"
+    assert "missing" in programs.error(source, "-p", "fast-compile", "--no-fold")
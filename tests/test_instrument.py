@@ -0,0 +1,45 @@
+import os, sys, json, subprocess
+
+from conftest import ROOT
+
+INSTRUMENTED = """\
+include "stdio"
+
+fn fib(n i64) i64 {
+    if n < 2 {
+        return n
+    }
+    return fib(n - 1) + fib(n - 2)
+}
+
+fn leaf(n i64) i64 {
+    return n + 1
+}
+
+fn main() i32 {
+    var out [100]i64
+    parallel for i in 0..100 {
+        out[i] = leaf(i)
+    }
+    printf("%ld %ld\\n", fib(10), out[99])
+    return 0
+}
+"""
+
+def test_instrument(programs, tmp_path):
+    report_path = str(tmp_path / "report.json")
+    output = programs.run_c(INSTRUMENTED, "--instrument", env=dict(os.environ, LANG_PROFILE=report_path, OMP_NUM_THREADS="4"))
+    assert output == "55 100\n"
+
+    with open(report_path, "r") as f:
+        report = json.load(f)
+    calls = {function["name"]: function["calls"] for function in report["functions"]}
+    assert calls == {"main": 1, "fib": 177, "leaf": 100}
+
+def test_report(programs, tmp_path):
+    report_path = str(tmp_path / "report.json")
+    programs.run_c(INSTRUMENTED, "--instrument", env=dict(os.environ, LANG_PROFILE=report_path))
+
+    table = subprocess.run([sys.executable, os.path.join(ROOT, "report.py"), report_path, "--sort", "calls"], capture_output=True, text=True, check=True).stdout.split("\n")
+    # fib is called the most, and shown with the line it's defined on
+    assert "fib (" in table[1] and "fn fib(n i64) i64 {" in table[1]
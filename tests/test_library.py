@@ -0,0 +1,58 @@
+import os, sys, json, subprocess
+
+from conftest import ROOT
+
+sys.path.insert(0, ROOT)
+import library
+
+LIBRARY = """\
+struct Point {
+    x i32
+    y i32
+}
+
+fn scale(point Point, by i32) Point {
+    var scaled Point
+    scaled.x = point.x * by
+    scaled.y = point.y * by
+    return scaled
+}
+
+fn greeting() u8* {
+    return "hello"
+}
+
+fn negative(n i64) bool {
+    return n < 0
+}
+"""
+
+def call(programs, *args):
+    path = programs.write(LIBRARY)
+    result = subprocess.run([sys.executable, os.path.join(ROOT, "library.py"), path, *args, "--no-cache"], cwd=programs.workdir, capture_output=True, text=True)
+    return result.stdout
+
+def test_load(programs):
+    lib = library.load(programs.write(LIBRARY), ["--no-cache"])
+    point = lib.scale(lib.struct("Point")(x=1, y=2), 3)
+    assert (point.x, point.y) == (3, 6)
+    assert lib.greeting() == b"hello"
+    assert lib.negative(-1) is True
+
+def test_command_line(programs):
+    assert call(programs, "negative", "-3") == "True\n"
+    assert call(programs, "negative", "0x10") == "False\n"
+    assert call(programs, "greeting") == "b'hello'\n"
+
+def test_command_line_errors(programs):
+    assert call(programs, "missing") == "error: function isn't exported: missing\n"
+    assert call(programs, "negative", "1", "2") == "error: negative takes 1 arguments, 2 were given\n"
+    assert call(programs, "negative", "1.5") == "error: not an integer: 1.5\n"
+    assert call(programs, "scale", "1", "2") == "error: can't pass Point from the command line\n"
+
+def test_shared_objects_export_their_interface(programs):
+    output = programs.compile(LIBRARY, "--shared")
+    with open(output + ".interface.json", "r") as f:
+        export = library.Export.from_dict(json.load(f))
+    assert sorted(export.fns) == ["greeting", "negative", "scale"]
+    assert list(export.structs["Point"].vars) == ["x", "y"]
@@ -0,0 +1,81 @@
+import os
+
+LIBRARY = """\
+struct Counter {
+    count i32
+
+    fn bump() {
+        self.count += 1
+    }
+
+    @export
+    fn add(n i32) {
+        for i in 0..n {
+            self.bump()
+        }
+    }
+}
+
+fn helper() i32 {
+    return 20
+}
+
+@export
+fn start() i32 {
+    return helper() + 1
+}
+"""
+
+MAIN = """\
+import "library"
+include "stdio"
+
+fn main() i32 {
+    var counter Counter
+    counter.count = start()
+    counter.add(3)
+    BODY
+    printf("%d\\n", counter.count)
+    return 0
+}
+"""
+
+def write_library(programs):
+    with open(os.path.join(programs.workdir, "library.lang"), "w") as f:
+        f.write(LIBRARY)
+
+def test_whole_program_keeps_exports(programs):
+    write_library(programs)
+    source = MAIN.replace("BODY", "")
+    assert programs.run_c(source) == "24\n"
+    assert programs.run_c(source, "--whole-program") == "24\n"
+
+def test_whole_program_names_what_isnt_exported(programs):
+    write_library(programs)
+    error = programs.error(MAIN.replace("BODY", "var n = helper()"), "--whole-program")
+    assert "function helper is not exported from module library" in error
+    error = programs.error(MAIN.replace("BODY", "helper()"), "--whole-program")
+    assert "function helper is not exported from module library" in error
+    error = programs.error(MAIN.replace("BODY", "counter.bump()"), "--whole-program")
+    assert "method Counter.bump is not exported from module library" in error
+
+def test_small_functions_are_inlined(programs):
+    source = """\
+include "stdio"
+
+fn twice(n i32) i32 {
+    return n * 2
+}
+
+@noinline
+fn thrice(n i32) i32 {
+    return n * 3
+}
+
+fn main() i32 {
+    printf("%d %d\\n", twice(4), thrice(4))
+    return 0
+}
+"""
+    assert programs.run_c(source) == "8 12\n"
+    assert programs.run_c(source, "--whole-program") == "8 12\n"
@@ -0,0 +1,44 @@
+PROGRAM = """\
+include "stdio"
+
+@memo(SIZE)
+fn square(n i32, negate bool) i64 {
+    printf("square %d\\n", n)
+    var result i64 = n * n
+    if negate {
+        return 0 - result
+    }
+    return result
+}
+
+fn main() i32 {
+    var total i64 = 0
+    for round in 0..3 {
+        total += square(7, false) + square(8, true)
+    }
+    printf("%ld\\n", total)
+    return 0
+}
+"""
+
+def test_results_are_reused(programs):
+    source = PROGRAM.replace("SIZE", "64")
+    expected = "square 7\nsquare 8\n-45\n"
+    assert programs.run_c(source) == expected
+    assert programs.run_vm(source) == expected
+
+def test_colliding_results_are_replaced(programs):
+    # With a single slot both calls keep evicting each other
+    source = PROGRAM.replace("SIZE", "1")
+    assert programs.run_c(source) == "square 7\nsquare 8\n" * 3 + "-45\n"
+
+def test_memo_size(programs):
+    source = PROGRAM.replace("(SIZE)", "")
+    assert programs.run_c(source, "--memo-size", "64") == "square 7\nsquare 8\n-45\n"
+    assert "memo table of square needs a positive size" in programs.error(source, "--memo-size", "0")
+    assert "memo table of square needs a positive size" in programs.error(PROGRAM.replace("SIZE", "0"))
+
+def test_keys_have_to_be_integers(programs):
+    source = PROGRAM.replace("SIZE", "4").replace("negate bool", "negate i32*").replace("if negate", "if negate != null")
+    source = source.replace("false)", "null)").replace("true)", "null)")
+    assert "can't memoize square, parameter negate of type i32* can't be used as a key" in programs.error(source)
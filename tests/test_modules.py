@@ -0,0 +1,56 @@
+import os
+
+from conftest import ROOT
+
+SCALE = """\
+import "vector"
+
+@export
+fn scale(vector Vector*, by i32) Vector {
+    var scaled Vector
+    scaled.x = vector.x * by
+    scaled.y = vector.y * by
+    return scaled
+}
+"""
+
+MAIN = """\
+include "stdio"
+import "vector"
+import "scale"
+
+fn main() i32 {
+    var a Vector
+    a.x = 1
+    a.y = 2
+    var b = scale(&a, 3)
+    var c = a + b
+    printf("%d %d %d\\n", c.x, c.y, length_squared(&c))
+    return 0
+}
+"""
+
+def write_module(programs, name, source):
+    with open(os.path.join(programs.workdir, name + ".lang"), "w") as f:
+        f.write(source)
+
+def write_modules(programs):
+    with open(os.path.join(ROOT, "examples", "modules", "vector.lang"), "r") as f:
+        write_module(programs, "vector", f.read())
+    write_module(programs, "scale", SCALE)
+
+def test_calls_across_modules(programs):
+    write_modules(programs)
+    assert programs.run_c(MAIN) == "4 8 272\n"
+    assert programs.run_vm(MAIN) == "4 8 272\n"
+    assert programs.run_c(MAIN, "--whole-program") == "4 8 272\n"
+
+def test_import_cycle(programs):
+    write_modules(programs)
+    write_module(programs, "vector", 'import "scale"\n')
+    error = programs.error(MAIN).replace(programs.workdir + os.sep, "")
+    assert "import cycle: vector.lang -> scale.lang -> vector.lang" in error
+
+def test_missing_module(programs):
+    error = programs.error(MAIN).replace(programs.workdir + os.sep, "")
+    assert "module doesn't exist: vector.lang (imported by program1.lang)" in error
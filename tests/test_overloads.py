@@ -0,0 +1,37 @@
+POINT = """\
+include "stdio"
+
+struct Point {
+    x i64
+    y i64
+
+    fn __add__(rhs Point*) Point {
+        var point Point
+        point.x = self.x + rhs.x
+        point.y = self.y + rhs.y
+        return point
+    }
+
+    fn __add_eq__(rhs Point*) {
+        self.x += rhs.x
+        self.y += rhs.y
+    }
+}
+
+fn main() i32 {
+    var a Point
+    a.x = 1
+    a.y = 2
+    var chain = TERMS
+    a = a + a
+    a = a + chain
+    printf("%ld %ld\\n", a.x, a.y)
+    return 0
+}
+"""
+
+def test_overload_chains(programs):
+    source = POINT.replace("TERMS", " + ".join(["a"] * 200))
+    expected = "202 404\n"
+    assert programs.run_c(source) == expected
+    assert programs.run_vm(source) == expected
@@ -0,0 +1,56 @@
+import os
+
+PARALLEL_FOR = """\
+include "stdio"
+
+@memo(16)
+fn square(n i64) i64 {
+    return n * n
+}
+
+fn main() i32 {
+    var squares [1000]i64
+    parallel for i in 0..1000 {
+        squares[i] = square(i / 100)
+    }
+
+    var total i64 = 0
+    parallel for i in 0..1000 {
+        total += squares[i]
+    }
+    printf("%ld\\n", total)
+    return 0
+}
+"""
+
+def test_parallel_for(programs):
+    expected = f"{sum((i // 100) ** 2 for i in range(1000))}\n"
+    assert programs.run_c(PARALLEL_FOR, env=dict(os.environ, OMP_NUM_THREADS="4")) == expected
+    assert programs.run_vm(PARALLEL_FOR) == expected
+
+def test_parallel_for_rejects_data_races(programs):
+    races = [
+        "var last i32 = 0\n    parallel for i in 0..10 {\n        last = i\n    }",
+        "var s S\n    parallel for i in 0..10 {\n        s.x = i\n    }",
+        "var total i32 = 0\n    parallel for i in 0..10 {\n        total += total\n    }",
+    ]
+    for race in races:
+        assert "data race" in programs.error(f"struct S {{\n    x i32\n}}\n\nfn main() i32 {{\n    {race}\n    return 0\n}}\n")
+
+def test_parallel_for_variable_type(programs):
+    # The loop variable is the narrowest type holding both bounds, an i64 here
+    source = """\
+include "stdio"
+
+fn main() i32 {
+    var big i64 = 5000000000
+    var end i64 = 5000000004
+    var sums [4]i64
+    parallel for i in big..end {
+        sums[i - big] = i
+    }
+    printf("%ld\\n", sums[3])
+    return 0
+}
+"""
+    assert programs.run_c(source) == "5000000003\n"
@@ -0,0 +1,59 @@
+import os, sys, subprocess
+
+import pytest
+
+from conftest import ROOT
+
+PROGRAM = """\
+include "stdio"
+
+fn work(n i64, k i64) i64 {
+    var total i64 = 0
+    var i i64 = 0
+    while i < n {
+        var scale = k * 3
+        var a = i * scale
+        var b = i * scale
+        var unused = a - b
+        var copy = a
+        if i > 10 {
+            total += copy + b
+        } else {
+            total -= k * 3
+        }
+        i += 1
+    }
+    return total
+}
+
+fn main() i32 {
+    var j i64 = 0
+    var sum i64 = 0
+    while j < 5 {
+        sum += work(j * 7, j)
+        j += 1
+    }
+    printf("%ld %ld\\n", sum, work(100, 2))
+    return 0
+}
+"""
+
+@pytest.mark.parametrize("passes", ["cse", "copyprop", "licm", "dce", "dce,licm,copyprop,cse"])
+def test_passes_keep_the_output(programs, passes):
+    expected = programs.run_c(PROGRAM, "--passes", "none")
+    assert programs.run_c(PROGRAM, "--passes", passes) == expected
+    assert programs.run_c(PROGRAM) == expected
+
+def test_dump_ir(programs):
+    path = programs.write(PROGRAM)
+    def dump(*args):
+        return subprocess.run([sys.executable, os.path.join(ROOT, "main.py"), path, "-o", path[:-len(".lang")], "--no-cache", "--dump-ir", *args], cwd=programs.workdir, capture_output=True, text=True, check=True).stderr
+    before = dump("--passes", "none")
+    after = dump()
+    # Dead code goes and the repeated multiply is computed once
+    assert "unused = " in before
+    assert "unused = " not in after
+    assert after.count("multiply i, ") < before.count("multiply i, ")
+
+def test_unknown_pass(programs):
+    assert "unknown pass: fold (available passes: cse, copyprop, licm, dce)" in programs.error(PROGRAM, "--passes", "fold")
@@ -0,0 +1,39 @@
+import os
+
+PROGRAM = """\
+include "stdio"
+
+fn collatz(n u64) u64 {
+    var steps u64 = 0
+    while n != 1 {
+        var half = n / 2
+        if n == half * 2 {
+            n = half
+        } else {
+            n = 1 + n * 3
+        }
+        steps += 1
+    }
+    return steps
+}
+
+fn main() i32 {
+    var total u64 = 0
+    for n in 1..10000 {
+        total += collatz(n)
+    }
+    printf("%lu\\n", total)
+    return 0
+}
+"""
+
+def test_pgo_trains_then_rebuilds(programs):
+    expected = programs.run_c(PROGRAM)
+    assert programs.run_c(PROGRAM, "-p", "pgo", "--pgo-train", "{output} > trained.txt") == expected
+    with open(os.path.join(programs.workdir, "trained.txt"), "r") as f:
+        assert f.read() == expected
+
+def test_pgo_training_errors(programs):
+    assert "the pgo profile needs a training command, see --pgo-train" in programs.error(PROGRAM, "-p", "pgo")
+    assert "training command exited with code 3: exit 3" in programs.error(PROGRAM, "-p", "pgo", "--pgo-train", "exit 3")
+    assert "training command didn't run the program: true" in programs.error(PROGRAM, "-p", "pgo", "--pgo-train", "true")
@@ -0,0 +1,68 @@
+import os, sys, time, subprocess
+
+import pytest
+
+from conftest import ROOT
+
+GOOD = """\
+include "stdio"
+
+fn main() i32 {
+    printf("good\\n")
+    return 0
+}
+"""
+
+# Calls a C function nothing defines, so only gcc notices
+BAD = """\
+fn main() i32 {
+    return missing()
+}
+"""
+
+@pytest.fixture
+def server(tmp_path):
+    socket_path = str(tmp_path / "server.sock")
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "server.py"), "serve", "-s", socket_path, "-j", "2", "--no-cache"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            if os.path.exists(socket_path):
+                break
+            time.sleep(0.1)
+        yield socket_path
+    finally:
+        process.terminate()
+        process.wait()
+
+def batch(socket_path, workdir, *args):
+    return subprocess.run([sys.executable, os.path.join(ROOT, "server.py"), "batch", "-s", socket_path, "-d", "out", *args], cwd=workdir, capture_output=True, text=True)
+
+def test_batch(server, programs):
+    good = programs.write(GOOD)
+    bad = programs.write(BAD)
+
+    result = batch(server, programs.workdir, good, bad, "--time-phases")
+    assert result.returncode == 1
+    # The error comes with what gcc said, and the report of the job that succeeded comes back too
+    assert f"error: {bad}: gcc exited with code 1" in result.stdout
+    assert "missing" in result.stdout
+    assert "total" in result.stderr
+
+    output = os.path.join(programs.workdir, "out", os.path.basename(good)[:-len(".lang")])
+    assert subprocess.run([output], capture_output=True, text=True).stdout == "good\n"
+
+def test_batch_rejects_files_with_the_same_name(server, programs, tmp_path):
+    first = programs.write(GOOD)
+    os.makedirs(tmp_path / "other")
+    second = str(tmp_path / "other" / os.path.basename(first))
+    with open(second, "w") as f:
+        f.write(GOOD)
+
+    result = batch(server, programs.workdir, first, second)
+    assert result.returncode == 1
+    assert "would both be compiled to" in result.stdout
+
+def test_serve_refuses_a_live_socket(server):
+    result = subprocess.run([sys.executable, os.path.join(ROOT, "server.py"), "serve", "-s", server], capture_output=True, text=True)
+    assert result.returncode == 1
+    assert "already listening" in result.stdout
@@ -0,0 +1,26 @@
+VECTORS = """\
+include "stdio"
+
+fn main() i32 {
+    var x [8]f32 = [1, 2, 3, 4, 5, 6, 7, 8]
+    var y [8]f32
+    var doubled = f32x8_load(&x[0]) * f32x8_splat(2)
+    var v = doubled + f32x8_splat(1)
+    f32x8_store(&y[0], v)
+    var total f32 = 0
+    for lane in 0..8 {
+        total += v[lane]
+    }
+    var exact i32 = total
+    var last i32 = y[7]
+    printf("%d %d\\n", exact, last)
+    return 0
+}
+"""
+
+def test_vectors(programs):
+    assert programs.run_c(VECTORS) == "80 17\n"
+
+def test_vector_operands_have_to_match(programs):
+    source = "fn main() i32 {\n    var a = f32x8_splat(1)\n    var b = i32x8_splat(1)\n    var c = a + b\n    return 0\n}\n"
+    assert "different type: f32x8 and i32x8" in programs.error(source)
@@ -0,0 +1,62 @@
+import sys, os, argparse, tempfile
+
+from backends import bytecode, CompilerBackendException
+
+# Runs programs compiled by the vm backend, which start with a line running this file
+# Given a .lang file, compiles it first, the build cache makes that a lookup when it didn't change
+
+def load(path):
+    with open(path, "rb") as f:
+        data = f.read()
+
+    # Skips the line running vm.py
+    if data.startswith(b"#!"):
+        data = data[data.index(b"\n") + 1:]
+    return bytecode.load_program(data)
+
+def compile(file, compile_args):
+    # Only needed for sources, so running a compiled program doesn't import the parser
+    import main
+
+    with tempfile.TemporaryDirectory() as workdir:
+        output = os.path.join(workdir, "program")
+        args = main.make_argument_parser().parse_args([file, "-o", output, "-b", "vm"] + compile_args)
+        main.compile(None, args)
+        return load(output)
+
+def run(functions):
+    if "main" not in functions:
+        raise bytecode.Trap("program has no main function")
+
+    result = bytecode.execute(functions["main"])
+    # main returns 0 when it falls off its end, like in C
+    return int(result or 0) & 0xff
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Runs a program compiled by the vm backend, or compiles and runs a source file.")
+    argparser.add_argument("program", help="compiled program, or .lang file to compile and run")
+    argparser.add_argument("--disassemble", action="store_true", help="print the bytecode of every function instead of running the program")
+    args, compile_args = argparser.parse_known_args()
+
+    try:
+        if args.program.endswith(".lang"):
+            functions = compile(args.program, compile_args)
+        else:
+            functions = load(args.program)
+
+        if args.disassemble:
+            for name, fn in functions.items():
+                print(f"{name}:\n{bytecode.disassemble(fn)}\n")
+            sys.exit(0)
+
+        status = run(functions)
+    except bytecode.Trap as e:
+        sys.stdout.flush()
+        print(f"trap: {e}", file=sys.stderr)
+        sys.exit(134)
+    except CompilerBackendException as e:
+        print(f"error: {e}")
+        sys.exit(1)
+
+    sys.stdout.flush()
+    sys.exit(status)